@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class BridgeConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.bridge'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
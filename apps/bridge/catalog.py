@@ -0,0 +1,7 @@
+"""
+Bridge network, token and fee catalog responses, invalidated by the
+receivers of those models (see apps.core.catalog).
+"""
+from apps.core.catalog import Catalog
+
+catalog = Catalog('bridge')
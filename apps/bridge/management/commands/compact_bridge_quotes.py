@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.core.compaction import DEFAULT_BATCH_SIZE, compact
+from apps.bridge.models import BridgeQuote
+
+
+class Command(BaseCommand):
+    help = "Delete expired bridge quotes that were never executed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches")
+        parser.add_argument('--loop', action='store_true', help="Keep compacting every --interval seconds")
+        parser.add_argument('--interval', type=float, default=300.0)
+
+    def handle(self, *args, **options):
+        retention = timedelta(seconds=settings.XUSDT_SETTINGS['QUOTE_RETENTION_SECONDS'])
+        while True:
+            deleted = compact(
+                BridgeQuote.compactable(timezone.now() - retention),
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+            )
+            self.stdout.write(f"{deleted} expired bridge quotes deleted")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
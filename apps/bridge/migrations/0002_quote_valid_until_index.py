@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bridge', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bridgequote',
+            index=models.Index(fields=['valid_until'], name='bridge_brid_valid_u_55b366_idx'),
+        ),
+    ]
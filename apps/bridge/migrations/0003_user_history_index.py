@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bridge', '0002_quote_valid_until_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bridgetransaction',
+            name='bridge_brid_user_to_d78725_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bridgetransaction',
+            index=models.Index(fields=['user_token', '-initiated_at', '-id'], name='idx_bridge_user_history'),
+        ),
+    ]
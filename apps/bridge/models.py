@@ -1,9 +1,12 @@
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from uuid import uuid4
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from apps.core import quotes
+
 class BridgeNetwork(models.Model):
     """
     Supported networks for bridging
@@ -63,6 +66,35 @@ class BridgeQuote(models.Model):
     estimated_time = models.PositiveIntegerField(help_text="Estimated time in minutes")
     valid_until = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['valid_until']),
+        ]
+
+    # Carried by the signed quote token (see apps.core.quotes)
+    SIGNED_FIELDS = ('token_id', 'amount', 'from_network_id', 'to_network_id', 'fee_amount', 'estimated_time')
+    SIGNED_DECIMALS = ('amount', 'fee_amount')
+
+    def sign(self) -> str:
+        data = {field: getattr(self, field) for field in self.SIGNED_FIELDS}
+        data.update({field: str(data[field]) for field in self.SIGNED_DECIMALS})
+        return quotes.sign('bridge', self.id, data, self.valid_until)
+
+    @classmethod
+    def from_token(cls, token):
+        """Unsaved quote from a signed token. Raises quotes.InvalidQuote."""
+        payload = quotes.load('bridge', token)
+        for field in cls.SIGNED_DECIMALS:
+            payload[field] = Decimal(payload[field])
+        return cls(**payload)
+    
+    @classmethod
+    def compactable(cls, before):
+        """Quotes that expired before ``before`` and were never executed."""
+        return cls.objects.filter(valid_until__lt=before).exclude(
+            Exists(BridgeTransaction.objects.filter(quote=OuterRef('pk')))
+        )
     
     def __str__(self):
         return f"Bridge {self.token.symbol} {self.amount} {self.from_network}→{self.to_network}"
@@ -91,7 +123,8 @@ class BridgeTransaction(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['user_token']),
+            # history pages: WHERE user_token = ? ORDER BY initiated_at DESC, id DESC
+            models.Index(fields=['user_token', '-initiated_at', '-id'], name='idx_bridge_user_history'),
             models.Index(fields=['status']),
             models.Index(fields=['deposit_tx_hash']),
             models.Index(fields=['receive_tx_hash']),
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import catalog
+from .models import BridgeFee, BridgeNetwork, BridgeToken, BridgeTokenNetwork
+
+
+@receiver([post_save, post_delete], sender=BridgeNetwork)
+@receiver([post_save, post_delete], sender=BridgeToken)
+@receiver([post_save, post_delete], sender=BridgeTokenNetwork)
+@receiver([post_save, post_delete], sender=BridgeFee)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(catalog.bump)
@@ -116,7 +116,8 @@ class QuoteRequestSerializer(serializers.Serializer):
         return value
 
 class InitiateBridgeRequestSerializer(serializers.Serializer):
-    quote_id = serializers.UUIDField()
+    quote_token = serializers.CharField(required=False)
+    quote_id = serializers.UUIDField(required=False)  # quotes stored before signed quote tokens
     from_address = serializers.CharField(max_length=42)
     to_address = serializers.CharField(max_length=42)
     
@@ -128,4 +129,9 @@ class InitiateBridgeRequestSerializer(serializers.Serializer):
     def validate_to_address(self, value):
         if not value.startswith('0x') or len(value) != 42:
             raise serializers.ValidationError("Invalid Ethereum address")
-        return value.lower()
\ No newline at end of file
+        return value.lower()
+    
+    def validate(self, data):
+        if not data.get('quote_token') and not data.get('quote_id'):
+            raise serializers.ValidationError("Either quote_token or quote_id is required")
+        return data
\ No newline at end of file
@@ -0,0 +1,218 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.core import compaction
+from apps.core.catalog import Catalog
+from apps.core.models import AnonymousUser
+from .models import BridgeFee, BridgeNetwork, BridgeQuote, BridgeToken, BridgeTokenNetwork, BridgeTransaction
+
+ALICE = '0x' + 'aa' * 20
+BOB = '0x' + 'bb' * 20
+
+
+def create_user(exchange_code):
+    user = AnonymousUser(exchange_code=exchange_code)
+    user.set_password('pw123456')
+    user.save()
+    return user
+
+
+class BridgeFixtureMixin:
+    """USDT on two networks with a fee between them."""
+
+    def setUp(self):
+        super().setUp()
+        self.usdt = BridgeToken.objects.create(symbol='USDT', name='Tether')
+        self.source = BridgeNetwork.objects.create(
+            name='Ethereum', chain_id=1, native_token_symbol='ETH',
+            rpc_url='https://eth.example', explorer_url='https://etherscan.example',
+        )
+        self.target = BridgeNetwork.objects.create(
+            name='Polygon', chain_id=137, native_token_symbol='MATIC',
+            rpc_url='https://polygon.example', explorer_url='https://polygonscan.example',
+        )
+        for network in (self.source, self.target):
+            BridgeTokenNetwork.objects.create(
+                token=self.usdt, network=network, contract_address='0x' + '22' * 20,
+                min_bridge_amount=Decimal('1'),
+            )
+        BridgeFee.objects.create(
+            from_network=self.source, to_network=self.target, token=self.usdt,
+            fee_percentage=Decimal('0.1'), min_fee=Decimal('0.5'), max_fee=Decimal('50'),
+        )
+        self.user = create_user('EX-BRIDG01')
+
+    def request(self, method, url, data=None):
+        return getattr(self.client, method)(
+            url, data, content_type='application/json',
+            HTTP_X_CLIENT_TOKEN=self.user.client_token,
+        )
+
+    def stored_quote(self, valid_for=timedelta(minutes=5)):
+        return BridgeQuote.objects.create(
+            token=self.usdt, amount=Decimal('100'), from_network=self.source, to_network=self.target,
+            fee_amount=Decimal('0.5'), estimated_time=600,
+            valid_until=timezone.now() + valid_for,
+        )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class InitiateBridgeTests(BridgeFixtureMixin, TestCase):
+
+    def test_quote_token_initiates_once(self):
+        response = self.request('post', reverse('bridge-quote'), {
+            'token': 'USDT', 'amount': '100', 'from_network': self.source.pk, 'to_network': self.target.pk,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        data = {'quote_token': response.json()['quote_token'], 'from_address': ALICE, 'to_address': BOB}
+
+        self.assertEqual(self.request('post', reverse('bridge-initiate'), data).status_code, 200)
+        self.assertEqual(self.request('post', reverse('bridge-initiate'), data).status_code, 409)
+        self.assertEqual(BridgeTransaction.objects.count(), 1)
+
+    def test_legacy_quote_id_initiates_once(self):
+        quote = self.stored_quote()
+        data = {'quote_id': str(quote.pk), 'from_address': ALICE, 'to_address': BOB}
+        self.assertEqual(self.request('post', reverse('bridge-initiate'), data).status_code, 200)
+        self.assertEqual(self.request('post', reverse('bridge-initiate'), data).status_code, 409)
+
+    def test_missing_address_is_a_bad_request(self):
+        quote = self.stored_quote()
+        response = self.request('post', reverse('bridge-initiate'), {'quote_id': str(quote.pk), 'from_address': ALICE})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('to_address', response.json())
+        self.assertFalse(BridgeTransaction.objects.exists())
+
+
+class CompactionTests(BridgeFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dead = [self.stored_quote(valid_for=-timedelta(hours=2)) for _ in range(5)]
+        self.live = self.stored_quote()
+        self.executed = self.dead.pop(2)
+        BridgeTransaction.objects.create(
+            user_token=self.user.user_token, quote=self.executed, from_address=ALICE, to_address=BOB,
+        )
+
+    def compactable(self):
+        return BridgeQuote.compactable(timezone.now() - timedelta(hours=1))
+
+    def remaining(self):
+        return set(BridgeQuote.objects.values_list('pk', flat=True))
+
+    def test_dead_quotes_are_deleted_in_batches(self):
+        with mock.patch.object(compaction.time, 'sleep') as sleep:
+            self.assertEqual(compaction.compact(self.compactable(), batch_size=2, pause=0.5), 4)
+        self.assertEqual(sleep.call_count, 2)       # between three batches
+        self.assertEqual(self.remaining(), {self.live.pk, self.executed.pk})
+
+    def test_quote_referenced_during_the_run_is_kept(self):
+        # the key range still covers the executed quote; the DELETE refilters it
+        self.assertEqual(compaction.compact(self.compactable(), batch_size=10), 4)
+        self.assertIn(self.executed.pk, self.remaining())
+
+    def test_protected_batch_is_skipped_and_the_rest_compacted(self):
+        expired = BridgeQuote.objects.filter(valid_until__lt=timezone.now())
+        deleted = compaction.compact(expired, batch_size=1)
+        self.assertEqual(deleted, 4)
+        self.assertEqual(self.remaining(), {self.live.pk, self.executed.pk})
+
+    def test_command_keeps_quotes_within_retention(self):
+        recent = self.stored_quote(valid_for=-timedelta(minutes=30))
+        out = StringIO()
+        call_command('compact_bridge_quotes', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), '4 expired bridge quotes deleted')
+        self.assertEqual(self.remaining(), {self.live.pk, self.executed.pk, recent.pk})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CatalogTests(BridgeFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        catalog = Catalog('bridge', ttl=3600)
+        for module in ('apps.bridge.views', 'apps.bridge.receivers'):
+            patcher = mock.patch(f'{module}.catalog', catalog)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fees(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(
+            reverse('bridge-fees'), {'token': 'USDT'}, HTTP_X_CLIENT_TOKEN=self.user.client_token, **headers,
+        )
+
+    def test_fee_change_invalidates_the_etag(self):
+        etag = self.fees()['ETag']
+        self.assertEqual(self.fees(etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BridgeFee.objects.update(fee_percentage=Decimal('0.2'))     # no signal: not seen
+        self.assertEqual(self.fees(etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fee = BridgeFee.objects.get()
+            fee.save()
+        response = self.fees(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([Decimal(fee['fee_percentage']) for fee in response.json()], [Decimal('0.2')])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class HistoryTests(BridgeFixtureMixin, TestCase):
+
+    def transfer(self, initiated_at, user_token=None):
+        transfer = BridgeTransaction.objects.create(
+            user_token=user_token or self.user.user_token, quote=self.stored_quote(),
+            from_address=ALICE, to_address=BOB,
+        )
+        BridgeTransaction.objects.filter(pk=transfer.pk).update(initiated_at=initiated_at)
+        return transfer
+
+    def pages(self, page_size):
+        url, pages = f"{reverse('bridge-history')}?page_size={page_size}", []
+        while url:
+            response = self.request('get', url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append([row['id'] for row in response.json()['results']])
+            url = response.json()['next']
+        return pages
+
+    def test_pages_follow_initiated_at_then_id(self):
+        now = timezone.now()
+        # three transfers share a timestamp: id decides their order
+        transfers = [self.transfer(now) for _ in range(3)] + [self.transfer(now - timedelta(hours=1))]
+        newest = self.transfer(now + timedelta(hours=1))
+        self.transfer(now, user_token='0' * 64)
+        tied = sorted(transfers[:3], key=lambda t: t.pk, reverse=True)
+        expected = [str(t.pk) for t in [newest, *tied, transfers[3]]]
+
+        pages = self.pages(page_size=2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_page_cost_does_not_grow_with_its_size(self):
+        for hours in range(4):
+            self.transfer(timezone.now() - timedelta(hours=hours))
+
+        def queries(page_size):
+            with CaptureQueriesContext(connection) as captured:
+                self.request('get', f"{reverse('bridge-history')}?page_size={page_size}")
+            return len(captured)
+
+        self.assertEqual(queries(1), queries(4))
+
+    def test_malformed_cursor_is_not_found(self):
+        self.assertEqual(self.request('get', f"{reverse('bridge-history')}?cursor=bm90LWpzb24").status_code, 404)
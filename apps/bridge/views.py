@@ -1,40 +1,50 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import generics, status
 from .models import (
     BridgeNetwork, BridgeToken, BridgeTokenNetwork,
     BridgeQuote, BridgeTransaction, BridgeFee, BridgeStats
 )
 from .serializers import (
     NetworkSerializer, TokenSerializer, TokenNetworkSerializer,
-    QuoteSerializer, TransactionSerializer, FeeSerializer, StatsSerializer
+    QuoteSerializer, TransactionSerializer, FeeSerializer, StatsSerializer,
+    InitiateBridgeRequestSerializer
 )
+from apps.core import quotes
+from apps.core.pagination import KeysetPagination
+from .catalog import catalog
 import uuid
 from datetime import timedelta
 from django.utils import timezone
 from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 
 class NetworkListView(APIView):
     def get(self, request):
-        networks = BridgeNetwork.objects.filter(is_active=True)
-        serializer = NetworkSerializer(networks, many=True)
-        return Response(serializer.data)
+        def build():
+            networks = BridgeNetwork.objects.filter(is_active=True)
+            return NetworkSerializer(networks, many=True).data
+        
+        return catalog.respond(request, ('networks',), build)
 
 class TokenListView(APIView):
     def get(self, request):
         network_id = request.query_params.get('network_id')
         
-        tokens = BridgeToken.objects.filter(is_active=True)
-        
-        if network_id:
-            tokens = tokens.filter(
-                bridgetokennetwork__network_id=network_id,
-                bridgetokennetwork__is_active=True
-            ).distinct()
+        def build():
+            tokens = BridgeToken.objects.filter(is_active=True)
             
-        serializer = TokenSerializer(tokens, many=True)
-        return Response(serializer.data)
+            if network_id:
+                tokens = tokens.filter(
+                    bridgetokennetwork__network_id=network_id,
+                    bridgetokennetwork__is_active=True
+                ).distinct()
+                
+            return TokenSerializer(tokens, many=True).data
+        
+        return catalog.respond(request, ('tokens', network_id), build)
 
 class TokenNetworkListView(APIView):
     def get(self, request, token_id):
@@ -105,8 +115,8 @@ class QuoteCreateView(APIView):
             if fee.max_fee and fee_amount > fee.max_fee:
                 fee_amount = fee.max_fee
             
-            # Create quote
-            quote = BridgeQuote.objects.create(
+            # The quote is signed, not saved: it is stored when initiated
+            quote = BridgeQuote(
                 token=token,
                 amount=amount,
                 from_network=from_network,
@@ -117,7 +127,7 @@ class QuoteCreateView(APIView):
             )
             
             serializer = QuoteSerializer(quote)
-            return Response(serializer.data)
+            return Response(dict(serializer.data, quote_token=quote.sign()))
             
         except (BridgeToken.DoesNotExist, BridgeNetwork.DoesNotExist):
             return Response(
@@ -132,37 +142,62 @@ class QuoteCreateView(APIView):
 
 class InitiateBridgeView(APIView):
     def post(self, request):
-        quote_id = request.data.get('quote_id')
-        from_address = request.data.get('from_address')
-        to_address = request.data.get('to_address')
-        user_token = request.headers.get('X-User-Token')  # Get from auth
+        serializer = InitiateBridgeRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        quote_token = data.get('quote_token')
+        user_token = request.user.user_token
         
-        try:
-            quote = BridgeQuote.objects.get(id=quote_id, valid_until__gte=timezone.now())
+        invalid = Response(
+            {'error': 'Invalid or expired quote'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+        used = Response(
+            {'error': 'Quote has already been used'},
+            status=status.HTTP_409_CONFLICT
+        )
+        if quote_token:
+            try:
+                quote = BridgeQuote.from_token(quote_token)
+            except (quotes.InvalidQuote, ValidationError):
+                return invalid
+        
+        with transaction.atomic():
+            if quote_token:
+                try:
+                    # the token's id is the primary key: a token is initiated once
+                    with transaction.atomic():
+                        quote.save(force_insert=True)
+                except IntegrityError:
+                    return used
+            else:
+                # quotes stored before signed quote tokens: the row lock
+                # serializes concurrent initiations of the same quote
+                quote = BridgeQuote.objects.select_for_update().filter(
+                    id=data['quote_id'], valid_until__gte=timezone.now()
+                ).first()
+                if quote is None:
+                    return invalid
+                if BridgeTransaction.objects.filter(quote=quote).exists():
+                    return used
             
             # Create bridge transaction
             bridge = BridgeTransaction.objects.create(
                 user_token=user_token,
                 quote=quote,
-                from_address=from_address,
-                to_address=to_address,
+                from_address=data['from_address'],
+                to_address=data['to_address'],
                 status='pending'
             )
-            
-            # In a real app, here you'd interact with blockchain
-            # For now, we'll simulate success
-            bridge.status = 'completed'
-            bridge.completed_at = timezone.now()
-            bridge.save()
-            
-            serializer = TransactionSerializer(bridge)
-            return Response(serializer.data)
-            
-        except BridgeQuote.DoesNotExist:
-            return Response(
-                {'error': 'Invalid or expired quote'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        
+        # In a real app, here you'd interact with blockchain
+        # For now, we'll simulate success
+        bridge.status = 'completed'
+        bridge.completed_at = timezone.now()
+        bridge.save()
+        
+        serializer = TransactionSerializer(bridge)
+        return Response(serializer.data)
 
 class BridgeStatusView(APIView):
     def get(self, request, id):
@@ -176,12 +211,19 @@ class BridgeStatusView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-class BridgeHistoryView(APIView):
-    def get(self, request):
-        user_token = request.headers.get('X-User-Token')
-        bridges = BridgeTransaction.objects.filter(user_token=user_token).order_by('-initiated_at')
-        serializer = TransactionSerializer(bridges, many=True)
-        return Response(serializer.data)
+class BridgeHistoryPagination(KeysetPagination):
+    ordering = ('-initiated_at', '-id')
+
+class BridgeHistoryView(generics.ListAPIView):
+    """The caller's bridge transfers, newest first, cursor paginated on idx_bridge_user_history."""
+    serializer_class = TransactionSerializer
+    pagination_class = BridgeHistoryPagination
+
+    def get_queryset(self):
+        return (
+            BridgeTransaction.objects.filter(user_token=self.request.user.user_token)
+            .select_related('quote__token', 'quote__from_network', 'quote__to_network')
+        )
 
 class EstimateTimeView(APIView):
     def get(self, request):
@@ -209,17 +251,19 @@ class FeeListView(APIView):
         to_network_id = request.query_params.get('to_network')
         token_symbol = request.query_params.get('token')
         
-        fees = BridgeFee.objects.all()
+        def build():
+            fees = BridgeFee.objects.select_related('from_network', 'to_network', 'token')
+            
+            if from_network_id:
+                fees = fees.filter(from_network_id=from_network_id)
+            if to_network_id:
+                fees = fees.filter(to_network_id=to_network_id)
+            if token_symbol:
+                fees = fees.filter(token__symbol=token_symbol)
+                
+            return FeeSerializer(fees, many=True).data
         
-        if from_network_id:
-            fees = fees.filter(from_network_id=from_network_id)
-        if to_network_id:
-            fees = fees.filter(to_network_id=to_network_id)
-        if token_symbol:
-            fees = fees.filter(token__symbol=token_symbol)
-            
-        serializer = FeeSerializer(fees, many=True)
-        return Response(serializer.data)
+        return catalog.respond(request, ('fees', from_network_id, to_network_id, token_symbol), build)
 
 class StatsView(APIView):
     def get(self, request):
@@ -8,13 +8,14 @@ class AnonymousUserAdmin(UserAdmin):
 
     list_display = ('exchange_code', 'trust_score', 'last_active', 'created_at')
     list_filter = ('trust_score', 'is_active')
-    search_fields = ('exchange_code',)
+    search_fields = ('exchange_code', 'user_token')
     ordering = ('-created_at',)
     
     # Make all security-related fields read-only
     readonly_fields = (
         'exchange_code', 
         'client_token',
+        'user_token',
         'session_salt',
         'password_hash',
         'created_at',
@@ -26,7 +27,7 @@ class AnonymousUserAdmin(UserAdmin):
         (None, {'fields': ('exchange_code', 'trust_score', 'is_active')}),
         ('Timestamps', {'fields': ('created_at', 'last_active', 'deleted_at')}),
         ('Security Information', {
-            'fields': ('client_token', 'session_salt', 'password_hash'),
+            'fields': ('client_token', 'user_token', 'session_salt', 'password_hash'),
             'classes': ('collapse',)  # Makes this section collapsible
         }),
     )
@@ -1,4 +1,9 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class CoreConfig(AppConfig):
     name = 'apps.core'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
+        post_migrate.connect(receivers.create_cache_table, sender=self)
@@ -0,0 +1,153 @@
+"""
+Content-addressed avatar storage.
+
+Uploads are hashed chunk by chunk and stored under their SHA-256 digest in
+the ``avatars`` storage backend (see ``STORAGES`` in settings – swap the
+backend for an S3-compatible one without touching this module). Identical
+images therefore share a single object. Thumbnails are generated by a
+background worker once the upload transaction commits.
+
+The client's Content-Type is not trusted: an upload is only stored once
+Pillow has parsed and verified it, and its extension comes from the format
+Pillow detected.
+"""
+import hashlib
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZES = (64, 256)
+
+# Pillow format -> extension of the stored object
+FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+}
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+}
+
+# <sha256>.<ext> or <sha256>_<size>.<ext>
+NAME_RE = re.compile(r'^(?P<digest>[0-9a-f]{64})(?:_(?P<size>\d+))?\.(?P<ext>jpg|png|gif)$')
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='avatar-thumbs')
+
+
+class InvalidImage(Exception):
+    """Raised when an upload is not a JPEG, PNG or GIF image Pillow can read"""
+    pass
+
+
+def get_storage():
+    return storages['avatars']
+
+
+def storage_key(name: str) -> str:
+    """Fan objects out over 256 prefixes so no directory grows unbounded."""
+    return f"{name[:2]}/{name}"
+
+
+def thumbnail_name(digest: str, size: int, ext: str) -> str:
+    return f"{digest}_{size}.{ext}"
+
+
+def image_extension(upload) -> str:
+    """Extension of the image format Pillow finds in ``upload``. Raises InvalidImage."""
+    try:
+        upload.seek(0)
+        with Image.open(upload) as image:
+            image.verify()
+            image_format = image.format
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage("The file is not a readable image.") from e
+    if image_format not in FORMATS:
+        raise InvalidImage("Invalid file type. Only JPEG, PNG, and GIF are allowed.")
+    return FORMATS[image_format]
+
+
+def store_avatar(upload) -> str:
+    """
+    Persist ``upload`` under its content hash and return the object name.
+    Raises InvalidImage unless Pillow can read it as a JPEG, PNG or GIF.
+
+    The file is read in ``CHUNK_SIZE`` pieces, both for hashing and for the
+    storage write, so memory use does not grow with the upload size.
+    """
+    ext = image_extension(upload)
+
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in upload.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    name = f"{digest.hexdigest()}.{ext}"
+
+    storage = get_storage()
+    key = storage_key(name)
+    if storage.exists(key):
+        logger.debug("Avatar %s already stored, reusing it", name)
+        if missing_thumbnails(name):
+            # a worker died before finishing them
+            _queue_thumbnails(name)
+    else:
+        upload.seek(0)
+        saved = storage.save(key, upload)
+        if saved != key:
+            # a concurrent upload of the same image won the race
+            storage.delete(saved)
+            return name
+        _queue_thumbnails(name)
+
+    return name
+
+
+def missing_thumbnails(name: str) -> list[str]:
+    match = NAME_RE.match(name)
+    storage = get_storage()
+    thumbnails = [thumbnail_name(match['digest'], size, match['ext']) for size in THUMBNAIL_SIZES]
+    return [thumb for thumb in thumbnails if not storage.exists(storage_key(thumb))]
+
+
+def _queue_thumbnails(name: str) -> None:
+    transaction.on_commit(lambda: _executor.submit(generate_thumbnails, name))
+
+
+def generate_thumbnails(name: str) -> list[str]:
+    """Write the fixed-size square thumbnails for a stored avatar."""
+    match = NAME_RE.match(name)
+    digest, ext = match['digest'], match['ext']
+    storage = get_storage()
+    created = []
+
+    try:
+        with storage.open(storage_key(name), 'rb') as fh:
+            image = Image.open(fh)
+            image.load()
+
+        for size in THUMBNAIL_SIZES:
+            thumb = thumbnail_name(digest, size, ext)
+            if storage.exists(storage_key(thumb)):
+                continue
+
+            out = BytesIO()
+            fitted = ImageOps.fit(image, (size, size))
+            if ext == 'jpg' and fitted.mode != 'RGB':
+                fitted = fitted.convert('RGB')
+            fitted.save(out, format=image.format or 'PNG')
+            storage.save(storage_key(thumb), ContentFile(out.getvalue()))
+            created.append(thumb)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+
+    return created
@@ -0,0 +1,98 @@
+"""
+Versioned catalog responses.
+
+Catalog endpoints (tokens, routes, networks, fees) change only when an admin
+edits them. A ``Catalog`` keeps, per process, the rendered JSON bytes of
+each endpoint and query, along with a strong ETag (a hash of those bytes).
+A hit costs no query. A request whose ``If-None-Match`` carries the
+current ETag gets an empty 304.
+
+The snapshot is keyed by a version counter in the shared cache. The app's
+receivers call ``bump()`` after a catalog model is saved or deleted; every
+process drops its snapshot on its next request and rebuilds each response
+once.
+``CATALOG_TTL_SECONDS`` bounds staleness when the cache is not shared
+between processes.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+# Distinct queries kept per catalog; past it, responses are built but not kept
+MAX_ENTRIES = 256
+
+
+class Catalog:
+    def __init__(self, name, ttl=None, max_entries=MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._responses = {}     # key -> (body, etag)
+        self._version = None
+        self._loaded_at = None
+
+    @property
+    def version_key(self) -> str:
+        return f"catalog:{self.name}:version"
+
+    def _ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return settings.XUSDT_SETTINGS.get('CATALOG_TTL_SECONDS', 300)
+
+    # ------------------------------------------------------------------ #
+    # Invalidation                                                       #
+    # ------------------------------------------------------------------ #
+
+    def bump(self) -> None:
+        """Invalidate every process's snapshot (call after the change commits)."""
+        cache.add(self.version_key, 0, None)
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            # evicted between add() and incr()
+            cache.set(self.version_key, 1, None)
+
+    # ------------------------------------------------------------------ #
+    # Responses                                                          #
+    # ------------------------------------------------------------------ #
+
+    def get(self, key, build) -> tuple:
+        """(body, etag) of ``key``, rendering ``build()`` if it is not in the snapshot."""
+        version = cache.get(self.version_key)
+        with self._lock:
+            if (
+                version != self._version
+                or self._loaded_at is None
+                or time.monotonic() - self._loaded_at > self._ttl()
+            ):
+                self._responses = {}
+                self._version = version
+                self._loaded_at = time.monotonic()
+            entry = self._responses.get(key)
+        if entry is not None:
+            return entry
+
+        body = JSONRenderer().render(build())
+        entry = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        with self._lock:
+            if self._version == version and len(self._responses) < self.max_entries:
+                self._responses[key] = entry
+        return entry
+
+    def respond(self, request, key, build) -> HttpResponse:
+        body, etag = self.get(key, build)
+        if_none_match = request.headers.get('If-None-Match', '')
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if '*' in tags or etag in tags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,57 @@
+"""
+Batched deletion of dead rows.
+
+``compact()`` walks a queryset of dead rows in primary-key order. It takes
+``batch_size`` keys at a time and deletes the dead rows in that key range,
+each range in its own short transaction. Locks are only held for one batch,
+and a long backlog never turns into one huge DELETE.
+
+The dead filter is evaluated again by the DELETE itself. A row that came
+back to life between the two reads (say, a transaction now references it)
+is left alone. If a protected reference appears in that window, the range
+is skipped and picked up by the next run.
+"""
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import ProtectedError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def compact(queryset, batch_size=DEFAULT_BATCH_SIZE, pause=0.0) -> int:
+    """
+    Delete the rows of ``queryset`` ``batch_size`` primary keys at a time,
+    sleeping ``pause`` seconds between batches. Returns the rows deleted.
+    """
+    model = queryset.model._meta.label
+    deleted = 0
+    last = None
+    while True:
+        keys = queryset.order_by('pk')
+        if last is not None:
+            keys = keys.filter(pk__gt=last)
+        keys = list(keys.values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            break
+
+        try:
+            with transaction.atomic():
+                count, _ = queryset.filter(pk__gte=keys[0], pk__lte=keys[-1]).delete()
+        except ProtectedError:
+            logger.info("Compaction of %s skipped a batch that became referenced", model)
+        else:
+            deleted += count
+
+        last = keys[-1]
+        if len(keys) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    if deleted:
+        logger.info("Compaction of %s: %s rows deleted", model, deleted)
+    return deleted
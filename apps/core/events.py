@@ -0,0 +1,262 @@
+"""
+Push channel for trade, escrow, swap and bridge state changes.
+
+``publish()`` is called from the models' signal receivers and hands events
+to the broker once the surrounding transaction commits. The broker fans
+them out to the open ``/api/auth/events/`` streams of the affected users.
+
+* ``LocalBroker`` delivers in-process only – enough for a single worker.
+  Its event ids are prefixed with a per-process epoch and nothing is kept
+  to replay.
+* ``DatabaseBroker`` also appends every event to ``StreamEvent``; a relay
+  thread in each worker picks up rows written by the others. It stands in
+  for a real message bus in multi-worker deployments and lets reconnecting
+  clients replay what they missed through ``Last-Event-ID``. The row id is
+  the event id, shared by every worker.
+
+  Ids are handed out at insert but become visible at commit, so a row can
+  appear after a higher id was already relayed. The relay remembers the
+  ids it skipped over and reads them again for ``RELAY_LAG`` seconds; each
+  is relayed once, as soon as it shows up.
+
+When the ``Last-Event-ID`` of a reconnecting client cannot be replayed –
+it comes from another process or database, or too much was missed – the
+stream sends ``resync`` first and the client refetches its state.
+
+Pick one with ``XUSDT_SETTINGS['EVENT_BROKER']`` ('local' or 'database').
+
+Browsers' EventSource cannot send headers. Instead of putting the client
+token in the URL, they get a ``stream_token()`` from an authenticated POST:
+signed, bound to the user and valid for ``STREAM_TOKEN_MAX_AGE`` seconds.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import StreamEvent
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 256
+RELAY_INTERVAL = 0.5     # seconds between relay polls
+RELAY_BATCH = 500
+RELAY_LAG = 5.0          # seconds a skipped id is waited for (a transaction still committing)
+RELAY_MAX_GAP = 500      # larger jumps in the ids are not tracked id by id
+RETENTION = timedelta(hours=1)
+PRUNE_INTERVAL = 300     # seconds
+REPLAY_LIMIT = 200
+STREAM_TOKEN_MAX_AGE = 60   # seconds
+
+
+class Subscription:
+    """One open stream. ``deliver`` may be called from any thread."""
+
+    def __init__(self, user_token):
+        self.user_token = user_token
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a stalled client; the stream tells it to resync and closes
+            self.overflowed = True
+
+
+class LocalBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        # ids only count within this process; the epoch keeps another
+        # worker's ids from being taken for ours
+        self.epoch = uuid.uuid4().hex[:8]
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_token) -> Subscription:
+        subscription = Subscription(user_token)
+        with self._lock:
+            self._subscriptions[user_token].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.user_token)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.user_token]
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscriptions)
+
+    def dispatch(self, event):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(event['user_token'], ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def publish(self, events):
+        for event in events:
+            event['id'] = f"{self.epoch}-{next(self._ids)}"
+            self.dispatch(event)
+
+    def replay(self, user_token, last_event_id) -> list | None:
+        """The user's events after ``last_event_id``, None when they cannot be replayed."""
+        return None
+
+
+class DatabaseBroker(LocalBroker):
+    def __init__(self, interval=RELAY_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._relay = None
+        self._last_id = None
+        self._gaps = {}          # id skipped by the relay -> monotonic time to give up on it
+        self._pruned_at = 0.0
+
+    def subscribe(self, user_token) -> Subscription:
+        self._ensure_relay()
+        return super().subscribe(user_token)
+
+    def publish(self, events):
+        StreamEvent.objects.bulk_create([
+            StreamEvent(user_token=e['user_token'], kind=e['type'], data=e['data'])
+            for e in events
+        ])
+
+    def replay(self, user_token, last_event_id) -> list | None:
+        try:
+            after_id = int(last_event_id)
+        except (TypeError, ValueError):
+            return None     # an id of the local broker
+        bounds = StreamEvent.objects.aggregate(oldest=Min('id'), latest=Max('id'))
+        if after_id > (bounds['latest'] or 0):
+            return None     # from another database
+        if bounds['oldest'] is not None and after_id < bounds['oldest'] - 1:
+            return None     # missed events were pruned already
+        rows = StreamEvent.objects.filter(user_token=user_token, id__gt=after_id).order_by('id')
+        rows = list(rows[:REPLAY_LIMIT + 1])
+        if len(rows) > REPLAY_LIMIT:
+            return None
+        return [_as_event(row) for row in rows]
+
+    # ------------------------------------------------------------------ #
+    # Relay                                                              #
+    # ------------------------------------------------------------------ #
+
+    def _ensure_relay(self):
+        with self._lock:
+            if self._relay is None or not self._relay.is_alive():
+                self._relay = threading.Thread(target=self._run, name='event-relay', daemon=True)
+                self._relay.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Event relay poll failed")
+            finally:
+                close_old_connections()
+            time.sleep(self.interval)
+
+    def poll(self):
+        if self._last_id is None:
+            # only relay what is published from now on; older rows are replayed on demand
+            latest = StreamEvent.objects.order_by('-id').values_list('id', flat=True).first()
+            self._last_id = latest or 0
+
+        if self.has_subscribers():
+            now = time.monotonic()
+            if self._gaps:
+                # committed late, below ids already relayed
+                for row in StreamEvent.objects.filter(id__in=list(self._gaps)).order_by('id'):
+                    del self._gaps[row.id]
+                    self.dispatch(_as_event(row))
+                self._gaps = {i: until for i, until in self._gaps.items() if until > now}
+
+            rows = StreamEvent.objects.filter(id__gt=self._last_id).order_by('id')[:RELAY_BATCH]
+            for row in rows:
+                if row.id - self._last_id - 1 <= RELAY_MAX_GAP:
+                    self._gaps.update(dict.fromkeys(range(self._last_id + 1, row.id), now + RELAY_LAG))
+                self._last_id = row.id
+                self.dispatch(_as_event(row))
+        else:
+            latest = StreamEvent.objects.order_by('-id').values_list('id', flat=True).first()
+            self._last_id = latest or self._last_id
+            self._gaps = {}
+
+        if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+            self._pruned_at = time.monotonic()
+            StreamEvent.objects.filter(created_at__lt=timezone.now() - RETENTION).delete()
+
+
+def _as_event(row: StreamEvent) -> dict:
+    return {'id': row.id, 'user_token': row.user_token, 'type': row.kind, 'data': row.data}
+
+
+# --------------------------------------------------------------------------- #
+# Stream tokens                                                               #
+# --------------------------------------------------------------------------- #
+
+STREAM_TOKEN_SALT = 'apps.core.events.stream'
+
+
+def stream_token(user_token: str) -> str:
+    """Short-lived credential for one user's event stream, safe to put in a URL."""
+    return signing.dumps({'user_token': user_token}, salt=STREAM_TOKEN_SALT)
+
+
+def stream_user(token: str) -> str | None:
+    """The user_token a stream token was issued for; None if invalid or expired."""
+    try:
+        return signing.loads(token, salt=STREAM_TOKEN_SALT, max_age=STREAM_TOKEN_MAX_AGE)['user_token']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> LocalBroker:
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                kind = settings.XUSDT_SETTINGS.get('EVENT_BROKER', 'local')
+                _broker = DatabaseBroker() if kind == 'database' else LocalBroker()
+    return _broker
+
+
+def publish(kind: str, user_tokens, data: dict) -> None:
+    """Queue a ``kind`` event for every user in ``user_tokens`` (sent on commit)."""
+    tokens = {token for token in user_tokens if token}
+    if not tokens:
+        return
+    events = [{'type': kind, 'user_token': token, 'data': data} for token in sorted(tokens)]
+    transaction.on_commit(lambda: _publish(events))
+
+
+def _publish(events):
+    try:
+        get_broker().publish(events)
+    except Exception:
+        # pushing is best effort; clients can still fetch the current state
+        logger.exception("Publishing %s stream events failed", len(events))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.reputation import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute total_trades / success_rate / trust_score for every user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        changed = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Reputation updated for {changed} users"))
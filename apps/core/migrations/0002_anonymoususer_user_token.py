@@ -0,0 +1,47 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_user_token(apps, schema_editor):
+    """
+    Derive the stable token from the client_token each user currently holds.
+
+    Rows in the other apps that were keyed by a client_token the user has
+    since rotated away from cannot be recovered – the HMAC is one way.
+    """
+    AnonymousUser = apps.get_model('core', 'AnonymousUser')
+    hmac_key = settings.XUSDT_SETTINGS['USER_TOKEN_HMAC_KEY'].encode()
+
+    batch = []
+    for user in AnonymousUser.objects.filter(user_token__isnull=True).only('id', 'client_token').iterator(chunk_size=1000):
+        user.user_token = hmac.new(hmac_key, user.client_token.encode(), hashlib.sha256).hexdigest()
+        batch.append(user)
+        if len(batch) >= 1000:
+            AnonymousUser.objects.bulk_update(batch, ['user_token'])
+            batch = []
+    if batch:
+        AnonymousUser.objects.bulk_update(batch, ['user_token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anonymoususer',
+            name='user_token',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_user_token, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='anonymoususer',
+            name='user_token',
+            field=models.CharField(editable=False, help_text='HMAC-SHA256(client_token at registration)', max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_anonymoususer_user_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anonymoususer',
+            name='canceled_trades',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='anonymoususer',
+            name='completed_trades',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='anonymoususer',
+            name='disputed_trades',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='anonymoususer',
+            name='disputes_lost',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
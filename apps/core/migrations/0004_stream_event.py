@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:02
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_reputation_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('user_token', models.CharField(max_length=64)),
+                ('kind', models.CharField(help_text='trade, escrow, swap or bridge', max_length=20)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_token', 'id'], name='idx_stream_user'), models.Index(fields=['created_at'], name='idx_stream_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_stream_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='anonymoususer',
+            index=models.Index(fields=['avatar_url'], name='idx_user_avatar_url'),
+        ),
+    ]
@@ -4,6 +4,7 @@ import hmac
 import json
 from cryptography.fernet import Fernet
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -52,6 +53,15 @@ class AnonymousUser(AbstractBaseUser, PermissionsMixin):
         help_text="SHA3-256(salt + password_hash)",
     )
 
+    # Stable trade identity – unlike client_token it never rotates, so the
+    # seller/buyer/user tokens stored by the other apps keep matching.
+    user_token = models.CharField(
+        max_length=64,
+        unique=True,
+        editable=False,
+        help_text="HMAC-SHA256(client_token at registration)",
+    )
+
     username = models.CharField(max_length=50, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
@@ -61,6 +71,12 @@ class AnonymousUser(AbstractBaseUser, PermissionsMixin):
     total_trades = models.PositiveIntegerField(default=0)
     success_rate = models.FloatField(default=0.0)
 
+    # Reputation counters – maintained by apps.core.reputation
+    completed_trades = models.PositiveIntegerField(default=0)
+    canceled_trades = models.PositiveIntegerField(default=0)
+    disputed_trades = models.PositiveIntegerField(default=0)
+    disputes_lost = models.PositiveIntegerField(default=0)
+
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
 
@@ -87,6 +103,12 @@ class AnonymousUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return f"User {self.exchange_code}"
 
+    @classmethod
+    def generate_user_token(cls, client_token):
+        """Generate HMAC-SHA256 user token from client token"""
+        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
+        return hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
+
     def set_password(self, raw_password):
         """
         Override to (a) capture Django’s hashed password in `password_hash`
@@ -102,6 +124,10 @@ class AnonymousUser(AbstractBaseUser, PermissionsMixin):
         blob = f"{self.session_salt}{self.password_hash}".encode()
         self.client_token = hashlib.sha3_256(blob).hexdigest()
 
+        # derived once, survives password changes and salt rotation
+        if not self.user_token:
+            self.user_token = self.generate_user_token(self.client_token)
+
         self.last_active = timezone.now()
 
     def rotate_session_salt(self):
@@ -115,6 +141,8 @@ class AnonymousUser(AbstractBaseUser, PermissionsMixin):
         indexes = [
             models.Index(fields=["exchange_code"], name="idx_user_exchange_code"),
             models.Index(fields=["client_token"], name="idx_user_client_token"),
+            # AvatarFileView: is a stored avatar still someone's
+            models.Index(fields=["avatar_url"], name="idx_user_avatar_url"),
         ]
 
 
@@ -215,4 +243,25 @@ class SecurityQuestion(models.Model):
             return False
 
     def __str__(self):
-        return f"Security Question for {self.user.exchange_code}"
\ No newline at end of file
+        return f"Security Question for {self.user.exchange_code}"
+
+class StreamEvent(models.Model):
+    """
+    Outbox of pushed state changes, written by the database event broker
+    (apps.core.events) so every worker can relay them and reconnecting
+    clients can replay what they missed.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user_token = models.CharField(max_length=64)
+    kind = models.CharField(max_length=20, help_text="trade, escrow, swap or bridge")
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_token", "id"], name="idx_stream_user"),
+            models.Index(fields=["created_at"], name="idx_stream_created"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} event {self.id} for {self.user_token[:8]}..."
@@ -0,0 +1,124 @@
+"""
+Keyset ("seek") pagination.
+
+Instead of OFFSET, every page continues strictly after the last row of the
+previous one:
+
+    WHERE (created_at, id) < (:created_at, :id) ORDER BY created_at DESC, id DESC
+
+so the cost of a page does not depend on how deep it is, as long as an
+index matches ``ordering``. The cursor carries those key values, base64
+encoded, and is opaque to clients.
+"""
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Must end in a unique column so every row has a distinct position
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    # ------------------------------------------------------------------ #
+    # Cursor encoding                                                    #
+    # ------------------------------------------------------------------ #
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def get_cursor_field(self, model, name):
+        """The model field that parses the cursor value of ordering column ``name``."""
+        return model._meta.get_field(name)
+
+    def encode_cursor(self, instance):
+        values = [str(getattr(instance, name)) for name, _ in self._fields()]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            fields = self._fields()
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [
+                self.get_cursor_field(model, name).to_python(value)
+                for (name, _), value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _after(self, values):
+        """Q() for rows strictly after ``values`` in ``ordering``."""
+        fields = self._fields()
+        clauses = []
+        for i, (name, descending) in enumerate(fields):
+            clause = {prev: values[j] for j, (prev, _) in enumerate(fields[:i])}
+            clause[f"{name}__{'lt' if descending else 'gt'}"] = values[i]
+            clauses.append(Q(**clause))
+        # The redundant bound on the leading column lets the planner seek into
+        # the index instead of scanning from its start and filtering
+        first, descending = fields[0]
+        bound = Q(**{f"{first}__{'lte' if descending else 'gte'}": values[0]})
+        return bound & reduce(or_, clauses)
+
+    # ------------------------------------------------------------------ #
+    # BasePagination                                                     #
+    # ------------------------------------------------------------------ #
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        rows = list(queryset[:size + 1])
+        self.next_cursor = self.encode_cursor(rows[size - 1]) if len(rows) > size else None
+        return rows[:size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
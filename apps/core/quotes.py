@@ -0,0 +1,47 @@
+"""
+Stateless signed quotes.
+
+Quote endpoints hand out a quote token instead of inserting a row per
+request. The token is the quote's fields signed with Django's
+``signing`` (HMAC with SECRET_KEY, salted per quote kind), so it cannot
+be altered or replayed as a different kind, and it carries its own expiry.
+
+The quote is only stored when it is executed. Its ``id`` in the token
+becomes the row's primary key, so a token can be executed once: a second
+INSERT with the same id fails.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core import signing
+
+
+class InvalidQuote(Exception):
+    """Raised when a quote token was tampered with or is not a quote of this kind"""
+    pass
+
+class ExpiredQuote(InvalidQuote):
+    """Raised when a quote token is past its valid_until"""
+    pass
+
+
+def _salt(kind: str) -> str:
+    return f"apps.core.quotes.{kind}"
+
+
+def sign(kind: str, quote_id, data: dict, valid_until: datetime) -> str:
+    """Token for a ``kind`` quote; ``data`` must be JSON serialisable."""
+    payload = dict(data, id=str(quote_id), exp=valid_until.timestamp())
+    return signing.dumps(payload, salt=_salt(kind), compress=True)
+
+
+def load(kind: str, token: str) -> dict:
+    """The verified payload of a quote token, with ``id`` and ``valid_until``."""
+    try:
+        payload = signing.loads(token, salt=_salt(kind))
+    except signing.BadSignature:
+        raise InvalidQuote("Invalid quote")
+    if payload['exp'] < time.time():
+        raise ExpiredQuote("Quote has expired")
+    payload['valid_until'] = datetime.fromtimestamp(payload.pop('exp'), dt_timezone.utc)
+    return payload
@@ -0,0 +1,39 @@
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import events
+
+
+def _status_saved(kind, instance, created, update_fields):
+    """Push an escrow/swap/bridge save that (possibly) changed its status."""
+    if not created and update_fields is not None and "status" not in update_fields:
+        return
+    events.publish(kind, [instance.user_token], {
+        "id": str(instance.pk),
+        "status": instance.status,
+    })
+
+
+@receiver(post_save, sender="escrow.EscrowWallet")
+def push_escrow_status(sender, instance, created, update_fields=None, **kwargs):
+    _status_saved("escrow", instance, created, update_fields)
+
+
+@receiver(post_save, sender="swap.SwapTransaction")
+def push_swap_status(sender, instance, created, update_fields=None, **kwargs):
+    _status_saved("swap", instance, created, update_fields)
+
+
+@receiver(post_save, sender="bridge.BridgeTransaction")
+def push_bridge_status(sender, instance, created, update_fields=None, **kwargs):
+    _status_saved("bridge", instance, created, update_fields)
+
+
+def create_cache_table(sender, using="default", verbosity=1, **kwargs):
+    """Create the dbcache table on migrate so a fresh deploy can serve requests.
+
+    Connected to post_migrate in CoreConfig.ready(). createcachetable skips
+    caches that are not database-backed and tables that already exist.
+    """
+    call_command("createcachetable", database=using, verbosity=max(verbosity - 1, 0))
@@ -0,0 +1,239 @@
+"""
+Incremental reputation for AnonymousUser.
+
+Trade and dispute outcomes are folded into per-user counters with a single
+F-expression UPDATE, which also refreshes the derived ``success_rate`` and
+``trust_score`` columns. Profile pages therefore read precomputed numbers,
+and ``rebuild()`` can recompute everything from scratch in one pass.
+
+Both paths count a trade through ``trade_counters()``: the hooks apply the
+difference between its counters before and after a change, so they also
+take back what a reversed transition or a deleted dispute no longer earns.
+"""
+import logging
+from collections import defaultdict
+
+from django.db.models import Case, F, FloatField, SmallIntegerField, Value, When
+from django.db.models.functions import Cast, Greatest, Least, Round
+from django.db.models.lookups import GreaterThan
+
+from .models import AnonymousUser
+
+logger = logging.getLogger(__name__)
+
+# P2PTrade statuses that affect reputation
+TRADE_COMPLETED = 3
+TRADE_DISPUTED = 4
+TRADE_CANCELED = 5
+
+# TradeDispute resolutions
+RESOLUTION_BUYER_FAVORED = 1
+RESOLUTION_SELLER_FAVORED = 2
+
+# Points deducted from the trust score for every dispute lost
+DISPUTE_PENALTY = 10
+
+COUNTER_FIELDS = (
+    "total_trades",
+    "completed_trades",
+    "canceled_trades",
+    "disputed_trades",
+    "disputes_lost",
+)
+
+
+def trade_counters(status: int | None, disputed: bool) -> dict:
+    """What a trade in ``status`` adds to each party's counters; ``disputed``: it has a dispute."""
+    counters = dict.fromkeys(COUNTER_FIELDS, 0)
+    if status == TRADE_COMPLETED:
+        counters["total_trades"] = counters["completed_trades"] = 1
+    elif status == TRADE_CANCELED:
+        counters["total_trades"] = counters["canceled_trades"] = 1
+    if status == TRADE_DISPUTED or disputed:
+        counters["disputed_trades"] = 1
+    return counters
+
+
+def success_rate(total: int, completed: int) -> float:
+    """Percentage of finished trades that completed."""
+    return completed * 100.0 / total if total else 0.0
+
+
+def trust_score(total: int, completed: int, lost: int) -> int:
+    """0-100 score: success rate (100 without history) minus dispute penalties."""
+    base = round(success_rate(total, completed)) if total else 100
+    return max(0, min(100, base - DISPUTE_PENALTY * lost))
+
+
+def _derived_expressions(total, completed, lost):
+    """SQL twin of success_rate()/trust_score() over (possibly adjusted) columns."""
+    rate = Case(
+        When(
+            GreaterThan(total, 0),
+            then=Cast(completed, FloatField()) * Value(100.0) / Cast(total, FloatField()),
+        ),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    base = Case(
+        When(GreaterThan(total, 0), then=Round(rate)),
+        default=Value(100.0),
+        output_field=FloatField(),
+    )
+    score = Greatest(
+        Value(0.0),
+        Least(Value(100.0), base - Cast(lost, FloatField()) * Value(float(DISPUTE_PENALTY))),
+        output_field=FloatField(),
+    )
+    return {
+        "success_rate": rate,
+        "trust_score": Cast(score, SmallIntegerField()),
+    }
+
+
+def _apply(tokens, **deltas) -> int:
+    """Add ``deltas`` to the counters of every user in ``tokens`` in one UPDATE."""
+    tokens = {t for t in tokens if t}
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not tokens or not deltas:
+        return 0
+
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    updates.update(
+        _derived_expressions(
+            updates.get("total_trades", F("total_trades")),
+            updates.get("completed_trades", F("completed_trades")),
+            updates.get("disputes_lost", F("disputes_lost")),
+        )
+    )
+    return AnonymousUser.objects.filter(user_token__in=tokens).update(**updates)
+
+
+# --------------------------------------------------------------------------- #
+# Hooks                                                                       #
+# --------------------------------------------------------------------------- #
+
+def _has_dispute(trade) -> bool:
+    from apps.disputes.models import TradeDispute
+
+    return TradeDispute.objects.filter(trade_id=trade.pk).exists()
+
+
+def record_trade_transition(trade, old_status: int | None, new_status: int) -> None:
+    """Fold a P2PTrade status change into both parties' counters."""
+    if old_status == new_status:
+        return
+
+    # a dispute only matters when it decides whether a Disputed status counted
+    disputed = TRADE_DISPUTED in (old_status, new_status) and _has_dispute(trade)
+    before = trade_counters(old_status, disputed)
+    after = trade_counters(new_status, disputed)
+    _apply(
+        (trade.buyer_token, trade.seller_token),
+        **{field: after[field] - before[field] for field in COUNTER_FIELDS},
+    )
+
+
+def _dispute_loser(trade, resolution: int) -> str | None:
+    if resolution == RESOLUTION_BUYER_FAVORED:
+        return trade.seller_token
+    if resolution == RESOLUTION_SELLER_FAVORED:
+        return trade.buyer_token
+    return None
+
+
+def record_dispute_resolution(dispute, old_resolution: int) -> None:
+    """Charge the losing party of a (re)resolved dispute."""
+    if old_resolution == dispute.resolution:
+        return
+
+    trade = dispute.trade
+    previous_loser = _dispute_loser(trade, old_resolution)
+    new_loser = _dispute_loser(trade, dispute.resolution)
+    if previous_loser == new_loser:
+        return
+
+    if previous_loser:
+        _apply([previous_loser], disputes_lost=-1)
+    if new_loser:
+        _apply([new_loser], disputes_lost=1)
+
+
+def record_dispute_opened(dispute) -> None:
+    """Count the trade of a new dispute as disputed (and charge a loser if already resolved)."""
+    trade = dispute.trade
+    if trade.status != TRADE_DISPUTED:
+        _apply((trade.buyer_token, trade.seller_token), disputed_trades=1)
+    record_dispute_resolution(dispute, 0)
+
+
+def record_dispute_deleted(dispute) -> None:
+    """Take back what record_dispute_opened() and its resolution counted."""
+    trade = dispute.trade
+    if trade.status != TRADE_DISPUTED:
+        _apply((trade.buyer_token, trade.seller_token), disputed_trades=-1)
+    loser = _dispute_loser(trade, dispute.resolution)
+    if loser:
+        _apply([loser], disputes_lost=-1)
+
+
+# --------------------------------------------------------------------------- #
+# Full rebuild                                                                #
+# --------------------------------------------------------------------------- #
+
+def rebuild(batch_size: int = 1000) -> int:
+    """
+    Recompute every user's counters from P2PTrade + TradeDispute.
+
+    Trades are streamed once (joined to their dispute, if any) and only the
+    users whose numbers changed are written back. Returns that count.
+    """
+    from apps.p2p.models import P2PTrade
+
+    counters = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+
+    rows = P2PTrade.objects.values_list(
+        "buyer_token", "seller_token", "status", "dispute__resolution"
+    ).order_by().iterator(chunk_size=batch_size)
+
+    for buyer, seller, status, resolution in rows:
+        # no dispute row leaves the joined resolution NULL
+        added = trade_counters(status, resolution is not None)
+        for token in (buyer, seller):
+            c = counters[token]
+            for field, value in added.items():
+                c[field] += value
+
+        if resolution == RESOLUTION_BUYER_FAVORED:
+            counters[seller]["disputes_lost"] += 1
+        elif resolution == RESOLUTION_SELLER_FAVORED:
+            counters[buyer]["disputes_lost"] += 1
+
+    fields = list(COUNTER_FIELDS) + ["success_rate", "trust_score"]
+    users = AnonymousUser.objects.only("id", "user_token", *fields).iterator(chunk_size=batch_size)
+
+    changed, batch = 0, []
+    for user in users:
+        c = counters.get(user.user_token) or dict.fromkeys(COUNTER_FIELDS, 0)
+        target = dict(
+            c,
+            success_rate=success_rate(c["total_trades"], c["completed_trades"]),
+            trust_score=trust_score(c["total_trades"], c["completed_trades"], c["disputes_lost"]),
+        )
+        if all(getattr(user, f) == v for f, v in target.items()):
+            continue
+
+        for f, v in target.items():
+            setattr(user, f, v)
+        batch.append(user)
+        if len(batch) >= batch_size:
+            AnonymousUser.objects.bulk_update(batch, fields)
+            changed += len(batch)
+            batch = []
+
+    if batch:
+        AnonymousUser.objects.bulk_update(batch, fields)
+        changed += len(batch)
+
+    logger.info("Reputation rebuilt for %s users", changed)
+    return changed
@@ -97,12 +97,7 @@ class UpdateProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = AnonymousUser
         fields = ['trust_score', 'last_active']  # Add any other fields you want to be updatable
-        read_only_fields = ['exchange_code', 'client_token', 'created_at']  # These shouldn't be changed
-    
-    def validate_trust_score(self, value):
-        if value < 0 or value > 100:
-            raise serializers.ValidationError("Trust score must be between 0 and 100")
-        return value
+        read_only_fields = ['trust_score', 'exchange_code', 'client_token', 'created_at']  # trust_score is maintained by apps.core.reputation
     
 
 
@@ -112,11 +107,13 @@ class ProfileSerializer(serializers.ModelSerializer):
         fields = [
             'username', 'email', 'phone', 'location', 'bio', 
             'avatar_url', 'trust_score', 'total_trades', 'success_rate',
+            'completed_trades', 'canceled_trades', 'disputed_trades',
             'exchange_code', 'created_at'
         ]
         read_only_fields = [
             'exchange_code', 'trust_score', 'total_trades', 
-            'success_rate', 'created_at'
+            'success_rate', 'completed_trades', 'canceled_trades',
+            'disputed_trades', 'created_at'
         ]
 
     def validate_username(self, value):
@@ -1,3 +1,381 @@
-from django.test import TestCase
+import tempfile
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from apps.disputes.models import TradeDispute
+from apps.p2p.models import P2PListing, P2PTrade
+from apps.p2p.transitions import transition_trade
+from . import avatars, events, reputation
+from .models import AnonymousUser, StreamEvent
+from .views import EventStreamView
+
+
+def create_user(exchange_code):
+    user = AnonymousUser(exchange_code=exchange_code)
+    user.set_password('pw123456')
+    user.save()
+    return user
+
+
+def trade_event(user_token, trade_id):
+    return {'type': 'trade', 'user_token': user_token, 'data': {'id': trade_id}}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UserTokenTests(TestCase):
+
+    def test_user_token_is_derived_once_from_the_first_client_token(self):
+        user = create_user('EX-TOKEN01')
+        first_client_token = user.client_token
+        self.assertEqual(user.user_token, AnonymousUser.generate_user_token(first_client_token))
+
+        user.rotate_session_salt()
+        user.set_password('new-password')
+        user.save()
+        user.refresh_from_db()
+        self.assertNotEqual(user.client_token, first_client_token)
+        self.assertEqual(user.user_token, AnonymousUser.generate_user_token(first_client_token))
+
+    def test_rows_stay_owned_across_client_token_rotation(self):
+        user = create_user('EX-TOKEN02')
+        listing = P2PListing.objects.create(
+            seller_token=user.user_token, crypto_type='sell',
+            crypto_amount=Decimal('100'), usdt_amount=Decimal('100'), payment_method=1,
+        )
+        user.rotate_session_salt()
+
+        response = self.client.get(reverse('p2p-specific-user'), HTTP_X_CLIENT_TOKEN=user.client_token)
+        self.assertEqual(response.status_code, 200)
+        listings = response.json()['listings']['results']
+        self.assertEqual([(l['id'], l['is_owner']) for l in listings], [(str(listing.pk), True)])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EventStreamTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('EX-EVENT01')
+        self.token = self.user.user_token
+
+    def use(self, broker):
+        patcher = mock.patch.object(events, '_broker', broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return broker
+
+    def stored(self, *trade_ids):
+        return [
+            StreamEvent.objects.create(user_token=self.token, kind='trade', data={'id': trade_id})
+            for trade_id in trade_ids
+        ]
+
+    def test_stream_is_refused_under_wsgi(self):
+        response = self.client.get(reverse('event-stream'), HTTP_X_CLIENT_TOKEN=self.user.client_token)
+        self.assertEqual(response.status_code, 501)
+
+    async def test_stream_authenticates_under_asgi(self):
+        response = await self.async_client.get(reverse('event-stream'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_takes_a_short_lived_stream_token_not_the_client_token(self):
+        url = reverse('event-stream')
+        response = await self.async_client.get(url, {'client_token': self.user.client_token})
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.post(
+            reverse('event-stream-token'), headers={'X-Client-Token': self.user.client_token},
+        )
+        self.assertEqual(response.status_code, 200)
+        token = response.json()['stream_token']
+        self.assertNotIn(self.user.client_token, token)
+
+        response = await self.async_client.get(url, {'stream_token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual((await self.async_client.get(url, {'stream_token': token + 'x'})).status_code, 401)
+        with mock.patch.object(events, 'STREAM_TOKEN_MAX_AGE', -1):
+            self.assertEqual((await self.async_client.get(url, {'stream_token': token})).status_code, 401)
+
+    async def test_id_from_another_worker_resyncs_the_client(self):
+        broker = self.use(events.LocalBroker())
+        stream = EventStreamView().stream(self.token, 'a1b2c3d4-500')
+        try:
+            self.assertTrue((await anext(stream)).startswith('retry:'))
+            self.assertEqual(await anext(stream), EventStreamView.RESYNC)
+
+            # this worker's counter is far below the client's last id
+            broker.publish([trade_event(self.token, 7)])
+            chunk = await anext(stream)
+            self.assertIn(f'id: {broker.epoch}-1\n', chunk)
+            self.assertIn('"id": 7', chunk)
+        finally:
+            await stream.aclose()
+
+    def test_database_broker_replays_after_its_own_ids_only(self):
+        first, second = self.stored(1, 2)
+        broker = events.DatabaseBroker()
+
+        self.assertEqual([e['id'] for e in broker.replay(self.token, str(first.id))], [second.id])
+        self.assertEqual(broker.replay(self.token, str(second.id)), [])
+        self.assertIsNone(broker.replay(self.token, 'a1b2c3d4-1'))         # a local broker id
+        self.assertIsNone(broker.replay(self.token, str(second.id + 100)))  # another database
+
+        before_first = first.id - 1
+        first.delete()      # pruned
+        self.assertIsNone(broker.replay(self.token, str(before_first)))
+
+    def test_relay_picks_up_rows_committed_after_a_higher_id(self):
+        broker = events.DatabaseBroker()
+        broker.poll()
+        first, late, last = self.stored(1, 2, 3)
+        late_id = late.id
+        late.delete()       # not committed yet when the relay looks
+
+        with mock.patch.object(broker, 'has_subscribers', return_value=True), \
+                mock.patch.object(broker, 'dispatch') as dispatch:
+            broker.poll()
+            self.assertEqual([c.args[0]['id'] for c in dispatch.call_args_list], [first.id, last.id])
+
+            StreamEvent.objects.create(id=late_id, user_token=self.token, kind='trade', data={'id': 2})
+            dispatch.reset_mock()
+            broker.poll()
+            broker.poll()
+            self.assertEqual([c.args[0]['id'] for c in dispatch.call_args_list], [late_id])
+
+            # a gap nobody fills is given up after RELAY_LAG
+            StreamEvent.objects.create(id=last.id + 5, user_token=self.token, kind='trade', data={'id': 4})
+            with mock.patch.object(events, 'RELAY_LAG', 0):
+                broker.poll()
+                broker.poll()
+            self.assertEqual(broker._gaps, {})
+
+    def test_database_broker_refuses_a_replay_over_the_limit(self):
+        first, *_ = self.stored(*range(4))
+        broker = events.DatabaseBroker()
+        with mock.patch.object(events, 'REPLAY_LIMIT', 2):
+            self.assertIsNone(broker.replay(self.token, str(first.id)))
+
+    async def test_replayed_events_are_not_sent_twice(self):
+        first, second = await sync_to_async(self.stored)(1, 2)
+        broker = self.use(events.DatabaseBroker())
+        with mock.patch.object(events.DatabaseBroker, '_ensure_relay'):
+            stream = EventStreamView().stream(self.token, str(first.id))
+            try:
+                await anext(stream)
+                self.assertIn(f'id: {second.id}\n', await anext(stream))
+
+                # the relay picks up the replayed row too, then a new one
+                broker.dispatch(events._as_event(second))
+                broker.dispatch({'id': second.id + 1, **trade_event(self.token, 3)})
+                self.assertIn(f'id: {second.id + 1}\n', await anext(stream))
+            finally:
+                await stream.aclose()
+
+
+class ReputationTests(TestCase):
+    FIELDS = reputation.COUNTER_FIELDS + ('success_rate', 'trust_score')
+
+    def setUp(self):
+        self.buyer = create_user('EX-REPBUY1')
+        self.seller = create_user('EX-REPSEL1')
+
+    def trade(self, status=1):
+        listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type='sell',
+            crypto_amount=Decimal('100'), usdt_amount=Decimal('100'), payment_method=1,
+        )
+        return P2PTrade.objects.create(
+            listing=listing, buyer_token=self.buyer.user_token, seller_token=self.seller.user_token,
+            escrow_tx_hash='0x' + '0' * 64, usdt_amount=listing.usdt_amount, status=status,
+        )
+
+    def open_dispute(self, trade):
+        dispute = TradeDispute.objects.create(trade=trade, initiator_token=trade.buyer_token)
+        if trade.status in (0, 1, 2):
+            transition_trade(trade, 'dispute')
+        return dispute
+
+    def resolve(self, dispute, resolution):
+        previous, dispute.resolution = dispute.resolution, resolution
+        dispute.save(update_fields=['resolution'])
+        reputation.record_dispute_resolution(dispute, previous)
+
+    def counters(self):
+        return {
+            user.exchange_code: {field: getattr(user, field) for field in self.FIELDS}
+            for user in AnonymousUser.objects.all()
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.counters()
+        self.assertEqual(reputation.rebuild(), 0)
+        self.assertEqual(self.counters(), incremental)
+        return incremental
+
+    def test_trade_outcomes_match_rebuild(self):
+        transition_trade(self.trade(status=2), 'complete')
+        transition_trade(self.trade(), 'cancel')
+        transition_trade(self.trade(), 'timeout')
+        seller = self.assert_matches_rebuild()['EX-REPSEL1']
+        self.assertEqual(
+            (seller['total_trades'], seller['completed_trades'], seller['canceled_trades']), (3, 1, 2)
+        )
+        self.assertEqual(seller['trust_score'], 33)
+
+    def test_resolved_dispute_matches_rebuild(self):
+        trade = self.trade(status=2)
+        dispute = self.open_dispute(trade)
+        self.resolve(dispute, reputation.RESOLUTION_BUYER_FAVORED)
+        transition_trade(trade, 'complete')
+
+        counters = self.assert_matches_rebuild()
+        self.assertEqual(counters['EX-REPBUY1']['disputed_trades'], 1)
+        self.assertEqual(counters['EX-REPSEL1']['disputes_lost'], 1)
+
+    def test_disputed_status_without_a_dispute_is_taken_back(self):
+        trade = self.trade()
+        transition_trade(trade, 'dispute')
+        self.assertEqual(self.assert_matches_rebuild()['EX-REPBUY1']['disputed_trades'], 1)
+
+        transition_trade(trade, 'cancel')
+        self.assertEqual(self.assert_matches_rebuild()['EX-REPBUY1']['disputed_trades'], 0)
+
+    def test_deleted_dispute_is_taken_back(self):
+        trade = self.trade(status=2)
+        transition_trade(trade, 'complete')
+        dispute = self.open_dispute(trade)     # a finished trade keeps its status
+        self.resolve(dispute, reputation.RESOLUTION_SELLER_FAVORED)
+        self.assertEqual(self.assert_matches_rebuild()['EX-REPBUY1']['disputes_lost'], 1)
+
+        dispute.delete()
+        counters = self.assert_matches_rebuild()
+        self.assertEqual(counters['EX-REPBUY1']['disputed_trades'], 0)
+        self.assertEqual(counters['EX-REPBUY1']['disputes_lost'], 0)
+
+
+class AvatarStorageMixin:
+    """A throwaway filesystem storage behind the ``avatars`` alias."""
+
+    def setUp(self):
+        super().setUp()
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        storages = dict(settings.STORAGES, avatars={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': location.name},
+        })
+        override = override_settings(STORAGES=storages, SECURE_SSL_REDIRECT=False)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class AvatarUploadTests(AvatarStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('EX-AVATAR2')
+        executor = mock.patch.object(avatars, '_executor')
+        self.executor = executor.start()
+        self.addCleanup(executor.stop)
+
+    def png(self):
+        out = BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(out, format='PNG')
+        return out.getvalue()
+
+    def upload(self, content, content_type='image/png'):
+        avatar = SimpleUploadedFile('avatar', content, content_type=content_type)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('upload-avatar'), {'avatar': avatar}, HTTP_X_CLIENT_TOKEN=self.user.client_token,
+            )
+
+    def test_type_is_taken_from_the_image_not_the_header(self):
+        response = self.upload(b'<script>alert(1)</script>', content_type='image/png')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(avatars.get_storage().listdir('')[0], [])
+
+        response = self.upload(self.png(), content_type='image/jpeg')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['avatar_url'].endswith('.png/'))
+
+    def test_missing_thumbnails_are_queued_again_for_a_stored_image(self):
+        response = self.upload(self.png())
+        name = response.json()['avatar_url'].rsplit('/', 2)[-2]
+        self.executor.submit.assert_called_once_with(avatars.generate_thumbnails, name)
+        self.assertEqual(len(avatars.generate_thumbnails(name)), len(avatars.THUMBNAIL_SIZES))
+
+        self.executor.reset_mock()
+        self.upload(self.png())
+        self.executor.submit.assert_not_called()
+
+        # the worker died before writing the second thumbnail
+        thumbnail = avatars.thumbnail_name(name.split('.')[0], avatars.THUMBNAIL_SIZES[-1], 'png')
+        avatars.get_storage().delete(avatars.storage_key(thumbnail))
+        self.upload(self.png())
+        self.executor.submit.assert_called_once_with(avatars.generate_thumbnails, name)
+
+
+class AvatarFileTests(AvatarStorageMixin, TestCase):
+    DIGEST = 'ab' * 32
+
+    def setUp(self):
+        super().setUp()
+        self.name = f'{self.DIGEST}.png'
+        self.store(self.name)
+        self.user = create_user('EX-AVATAR1')
+        self.user.avatar_url = reverse('avatar-file', args=[self.name])
+        self.user.save(update_fields=['avatar_url'])
+
+    def store(self, name):
+        avatars.get_storage().save(avatars.storage_key(name), ContentFile(b'\x89PNG'))
+
+    def get(self, name, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('avatar-file', args=[name]), **headers)
+
+    def test_avatar_is_served_then_confirmed_by_etag(self):
+        response = self.get(self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'\x89PNG')
+        self.assertEqual(response['ETag'], f'"{self.DIGEST}"')
+
+        response = self.get(self.name, etag=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], f'"{self.DIGEST}"')
+
+    def test_thumbnail_of_a_users_avatar_is_served(self):
+        thumbnail = avatars.thumbnail_name(self.DIGEST, 64, 'png')
+        self.assertEqual(self.get(thumbnail).status_code, 404)     # not generated yet
+        self.store(thumbnail)
+        self.assertEqual(self.get(thumbnail, etag=f'"{self.DIGEST}_64"').status_code, 304)
+
+    def test_etag_does_not_confirm_a_missing_file(self):
+        name = f'{"cd" * 32}.png'
+        AnonymousUser.objects.filter(pk=self.user.pk).update(avatar_url=reverse('avatar-file', args=[name]))
+        self.assertEqual(self.get(name, etag=f'"{"cd" * 32}"').status_code, 404)
+
+    def test_etag_does_not_confirm_an_avatar_nobody_uses(self):
+        AnonymousUser.objects.filter(pk=self.user.pk).update(avatar_url=None)
+        self.assertEqual(self.get(self.name).status_code, 404)
+        self.assertEqual(self.get(self.name, etag=f'"{self.DIGEST}"').status_code, 404)
+
+
+class CacheTableTests(TestCase):
+    def test_migrate_creates_a_missing_cache_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE django_cache')
+        self.assertNotIn('django_cache', connection.introspection.table_names())
+        emit_post_migrate_signal(verbosity=0, interactive=False, db='default')
+        self.assertIn('django_cache', connection.introspection.table_names())
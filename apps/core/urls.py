@@ -7,7 +7,8 @@ from .views import (
     SecurityQuestionListView, SetupSecurityQuestionView,
     VerifySecurityQuestionView,
     InitiatePasswordResetView, CompletePasswordResetView,
-    RecoveryQuestionsView, VerifySecurityQuestionView, UpdateProfileView, ChangePasswordView, ProfileView, AvatarUploadView
+    RecoveryQuestionsView, VerifySecurityQuestionView, UpdateProfileView, ChangePasswordView, ProfileView, AvatarUploadView,
+    AvatarFileView, EventStreamView, EventStreamTokenView,
 )
 
 urlpatterns = [
@@ -21,6 +22,9 @@ urlpatterns = [
     path('profile/', ProfileView.as_view(), name='user-profile'),
     path('change-password/', ChangePasswordView.as_view(), name='change-password'),
     path('profile/avatar/', AvatarUploadView.as_view(), name='upload-avatar'),
+    path('avatars/<str:name>/', AvatarFileView.as_view(), name='avatar-file'),
+    path('events/', EventStreamView.as_view(), name='event-stream'),
+    path('events/token/', EventStreamTokenView.as_view(), name='event-stream-token'),
     # Security Features
     path('security-events/', SecurityEventListView.as_view(), name='security-events'),
     
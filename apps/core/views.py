@@ -1,11 +1,21 @@
+import asyncio
+import json
 import uuid
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
+from django.views import View
 from rest_framework.response import Response
 import random
 from rest_framework.views import APIView
 from rest_framework import generics, permissions, status
 from rest_framework.throttling import ScopedRateThrottle
+from . import avatars, events
 from .models import SecurityQuestion, AnonymousUser, SecurityEvent
 from .serializers import (
     SecurityQuestionSerializer,
@@ -385,8 +395,17 @@ class ChangePasswordView(generics.GenericAPIView):
         )
     
 class AvatarUploadView(APIView):
+    """
+    POST /api/auth/profile/avatar/
+    Stores the avatar under its content hash; thumbnails are built in the background
+    """
     permission_classes = [permissions.IsAuthenticated]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Spool the upload to a temp file in chunks instead of holding it in memory
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
         user = request.user
         avatar = request.FILES.get('avatar')
@@ -405,30 +424,13 @@ class AvatarUploadView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Validate file type (example: only images)
-        valid_types = ['image/jpeg', 'image/png', 'image/gif']
-        if avatar.content_type not in valid_types:
-            return Response(
-                {"error": "Invalid file type. Only JPEG, PNG, and GIF are allowed."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         try:
-            # In a real implementation, you would:
-            # 1. Save the file to your storage (S3, local filesystem, etc.)
-            # 2. Generate a URL for the file
-            # 3. Store that URL in the avatar_url field
-            
-            # For this example, we'll just store the file name
-            # In production, use something like:
-            # from django.core.files.storage import default_storage
-            # file_path = default_storage.save(f'avatars/{user.id}/{avatar.name}', avatar)
-            # avatar_url = default_storage.url(file_path)
-            
-            # For now, we'll just store a placeholder
-            avatar_url = f"/media/avatars/user_{user.id}/{avatar.name}"
-            user.avatar_url = avatar_url
-            user.save()
+            # the file type is read from the image itself, not the client's Content-Type
+            name = avatars.store_avatar(avatar)
+            digest, ext = name.split('.')
+
+            user.avatar_url = reverse('avatar-file', args=[name])
+            user.save(update_fields=['avatar_url'])
             
             SecurityEvent.log_event(
                 event_type=4,
@@ -440,12 +442,159 @@ class AvatarUploadView(APIView):
             return Response(
                 {
                     "message": "Avatar uploaded successfully.",
-                    "avatar_url": user.avatar_url
+                    "avatar_url": user.avatar_url,
+                    "thumbnails": {
+                        size: reverse('avatar-file', args=[avatars.thumbnail_name(digest, size, ext)])
+                        for size in avatars.THUMBNAIL_SIZES
+                    },
                 },
                 status=status.HTTP_200_OK
             )
+        except avatars.InvalidImage as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class AvatarFileView(APIView):
+    """
+    GET /api/auth/avatars/<name>/
+    Serves a stored avatar; content-addressed, so it is cached forever.
+    An avatar (or one of its thumbnails) is only served, or confirmed with a
+    304, while it exists and is some user's current avatar.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, name):
+        match = avatars.NAME_RE.match(name)
+        if not match:
+            raise Http404
+
+        original = f"{match['digest']}.{match['ext']}"
+        if not AnonymousUser.objects.filter(avatar_url=reverse('avatar-file', args=[original])).exists():
+            raise Http404
+        storage = avatars.get_storage()
+        key = avatars.storage_key(name)
+        if not storage.exists(key):
+            raise Http404
+
+        etag = f'"{name.rsplit(".", 1)[0]}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "public, max-age=31536000, immutable",
+        }
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(
+                storage.open(key, 'rb'),
+                content_type=avatars.CONTENT_TYPES[match["ext"]],
+            )
+
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+
+class EventStreamTokenView(APIView):
+    """
+    POST /api/auth/events/token/
+    A short-lived token that opens the caller's event stream from an
+    EventSource, which cannot send the X-Client-Token header.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return Response({
+            "stream_token": events.stream_token(request.user.user_token),
+            "expires_in": events.STREAM_TOKEN_MAX_AGE,
+        })
+
+
+class EventStreamView(View):
+    """
+    GET /api/auth/events/
+    Server-sent events for the user's trades, escrows, swaps and bridges
+    (see events.py). Authenticated with X-Client-Token, or, for EventSource
+    clients that cannot set headers, ?stream_token= from
+    POST /api/auth/events/token/. Send Last-Event-ID to
+    replay missed events when the database broker is enabled; an id that
+    cannot be replayed gets a ``resync`` event first.
+
+    Served by the ASGI application only (config/asgi.py): under WSGI the
+    endless response would be buffered and hold a worker, so it is refused.
+    """
+    RETRY_MS = 3000
+    KEEPALIVE_SECONDS = 15
+    RESYNC = "event: resync\ndata: {}\n\n"
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"detail": "The event stream is only served over ASGI"},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+
+        # the client token never goes in the URL, where proxies and browsers log it
+        client_token = request.headers.get("X-Client-Token")
+        users = AnonymousUser.objects.filter(is_active=True)
+        user = None
+        if client_token:
+            user = await users.filter(client_token=client_token).afirst()
+        elif request.GET.get("stream_token"):
+            user_token = events.stream_user(request.GET["stream_token"])
+            if user_token:
+                user = await users.filter(user_token=user_token).afirst()
+        if user is None:
+            return JsonResponse({"detail": "Invalid client token"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+
+        response = StreamingHttpResponse(
+            self.stream(user.user_token, last_event_id),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, user_token, last_event_id=None):
+        broker = events.get_broker()
+        subscription = broker.subscribe(user_token)
+        last_id = None   # of the replayed events, which the queue may hold again
+        try:
+            yield f"retry: {self.RETRY_MS}\n\n"
+            if last_event_id:
+                replayed = await sync_to_async(broker.replay)(user_token, last_event_id)
+                if replayed is None:
+                    yield self.RESYNC
+                for event in replayed or ():
+                    last_id = event["id"]
+                    yield self.format(event)
+
+            while not subscription.overflowed:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), self.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if last_id is not None and event["id"] <= last_id:
+                    continue  # already sent by the replay
+                yield self.format(event)
+
+            yield self.RESYNC
+        finally:
+            broker.unsubscribe(subscription)
+
+    @staticmethod
+    def format(event):
+        data = json.dumps(event["data"], cls=DjangoJSONEncoder)
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
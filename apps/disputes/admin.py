@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from apps.core.reputation import record_dispute_resolution
 from .models import TradeDispute
 from django.conf import settings
 from django.utils import timezone
@@ -83,21 +84,31 @@ class TradeDisputeAdmin(admin.ModelAdmin):
             return self.readonly_fields + ('resolution', 'admin_sig')
         return self.readonly_fields
     
+    def _resolve(self, queryset, resolution):
+        disputes = list(queryset.select_related('trade'))
+        queryset.update(resolution=resolution, resolved_at=timezone.now())
+        for dispute in disputes:
+            previous_resolution = dispute.resolution
+            dispute.resolution = resolution
+            record_dispute_resolution(dispute, previous_resolution)
+
     def resolve_as_buyer_favored(self, request, queryset):
-        queryset.update(resolution=1, resolved_at=timezone.now())
+        self._resolve(queryset, 1)
     resolve_as_buyer_favored.short_description = "Mark as Buyer Favored"
     
     def resolve_as_seller_favored(self, request, queryset):
-        queryset.update(resolution=2, resolved_at=timezone.now())
+        self._resolve(queryset, 2)
     resolve_as_seller_favored.short_description = "Mark as Seller Favored"
     
     def resolve_as_split(self, request, queryset):
-        queryset.update(resolution=3, resolved_at=timezone.now())
+        self._resolve(queryset, 3)
     resolve_as_split.short_description = "Mark as Split Funds"
     
     def save_model(self, request, obj, form, change):
         if 'resolution' in form.changed_data and obj.resolution != 0:
             obj.resolved_at = timezone.now()
         super().save_model(request, obj, form, change)
+        if change and 'resolution' in form.changed_data:
+            record_dispute_resolution(obj, form.initial.get('resolution', 0))
 
 admin.site.register(TradeDispute, TradeDisputeAdmin)
\ No newline at end of file
@@ -14,7 +14,7 @@ class TradeDisputeSerializer(serializers.ModelSerializer):
             'evidence_hashes', 'evidence_ipfs_cid',
             'resolution', 'admin_sig', 'created_at', 'resolved_at'
         ]
-        read_only_fields = ['id', 'created_at', 'resolved_at', 'admin_sig']
+        read_only_fields = ['id', 'initiator_token', 'resolution', 'created_at', 'resolved_at', 'admin_sig']
         
     def validate_evidence_hashes(self, value):
         if value:
@@ -27,4 +27,11 @@ class TradeDisputeSerializer(serializers.ModelSerializer):
                         raise serializers.ValidationError("Invalid SHA3-256 hash format")
             except json.JSONDecodeError:
                 raise serializers.ValidationError("Invalid JSON format for evidence hashes")
-        return value
\ No newline at end of file
+        return value
+
+
+class TradeDisputeUpdateSerializer(TradeDisputeSerializer):
+    """Resolution is writable here – TradeDisputeDetailView lets only staff change it."""
+
+    class Meta(TradeDisputeSerializer.Meta):
+        read_only_fields = [f for f in TradeDisputeSerializer.Meta.read_only_fields if f != 'resolution']
@@ -1,3 +1,89 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.core.models import AnonymousUser
+from apps.p2p.models import P2PListing, P2PTrade, TradeParticipant
+from .models import TradeDispute
+
+
+def create_user(exchange_code, **extra):
+    user = AnonymousUser(exchange_code=exchange_code, **extra)
+    user.set_password('pw123456')
+    user.save()
+    return user
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TradeDisputeTests(TestCase):
+
+    def setUp(self):
+        self.buyer = create_user('EX-DISBUY1')
+        self.seller = create_user('EX-DISSEL1')
+        listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type='sell',
+            crypto_amount=Decimal('100'), usdt_amount=Decimal('100'), payment_method=1,
+        )
+        self.trade = P2PTrade.objects.create(
+            listing=listing, buyer_token=self.buyer.user_token, seller_token=self.seller.user_token,
+            escrow_tx_hash='0x' + '0' * 64, usdt_amount=listing.usdt_amount, status=2,
+        )
+        TradeParticipant.objects.bulk_create(TradeParticipant.for_trade(self.trade))
+
+    def request(self, method, url, user, data):
+        return getattr(self.client, method)(
+            url, data, content_type='application/json', HTTP_X_CLIENT_TOKEN=user.client_token,
+        )
+
+    def test_resolution_cannot_be_set_on_create(self):
+        response = self.request('post', reverse('dispute-create'), self.buyer, {
+            'trade': str(self.trade.pk), 'resolution': 2,
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        dispute = TradeDispute.objects.get()
+        self.assertEqual(dispute.resolution, 0)
+        self.buyer.refresh_from_db()
+        self.assertEqual((self.buyer.disputed_trades, self.buyer.disputes_lost), (1, 0))
+
+    def test_only_staff_resolve(self):
+        dispute = TradeDispute.objects.create(trade=self.trade, initiator_token=self.buyer.user_token)
+        url = reverse('dispute-detail', kwargs={'pk': dispute.pk})
+
+        response = self.request('patch', url, self.buyer, {'resolution': 1})
+        self.assertEqual(response.status_code, 403)
+
+        self.seller.is_staff = True
+        self.seller.save(update_fields=['is_staff'])
+        response = self.request('patch', url, self.seller, {'resolution': 1})
+        self.assertEqual(response.status_code, 200, response.content)
+        dispute.refresh_from_db()
+        self.assertEqual(dispute.resolution, 1)
+        self.assertIsNotNone(dispute.resolved_at)
+
+    def test_list_pages_follow_the_participant_index(self):
+        disputes = [TradeDispute.objects.create(trade=self.trade, initiator_token=self.buyer.user_token)]
+        for hours in (1, 2):
+            trade = P2PTrade.objects.create(
+                listing=self.trade.listing, buyer_token=self.buyer.user_token, seller_token=self.seller.user_token,
+                escrow_tx_hash='0x' + '0' * 64, usdt_amount=Decimal('100'), status=4,
+            )
+            TradeParticipant.objects.bulk_create(TradeParticipant.for_trade(trade))
+            TradeParticipant.objects.filter(trade=trade).update(created_at=trade.created_at - timedelta(hours=hours))
+            disputes.append(TradeDispute.objects.create(trade=trade, initiator_token=self.seller.user_token))
+        # the newest dispute is on the oldest trade: pages follow the trades
+        TradeDispute.objects.filter(pk=disputes[2].pk).update(created_at=timezone.now() + timedelta(hours=1))
+
+        url, seen = f"{reverse('dispute-list')}?page_size=2", []
+        while url:
+            response = self.client.get(url, HTTP_X_CLIENT_TOKEN=self.seller.client_token)
+            self.assertEqual(response.status_code, 200, response.content)
+            seen.extend(dispute['id'] for dispute in response.json()['results'])
+            url = response.json()['next']
+        self.assertEqual(seen, [str(dispute.pk) for dispute in disputes])
+
+        TradeDispute.objects.filter(pk=disputes[1].pk).update(resolution=1)
+        response = self.client.get(reverse('dispute-list'), {'resolution': 0}, HTTP_X_CLIENT_TOKEN=self.seller.client_token)
+        self.assertEqual([d['id'] for d in response.json()['results']], [str(disputes[0].pk), str(disputes[2].pk)])
@@ -1,15 +1,18 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, ValidationError
-from django.conf import settings
-from django.db.models import Q
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from django.utils import timezone
-import hmac
-import hashlib
 import json
 
+from apps.core.reputation import record_dispute_resolution
+from apps.p2p.exceptions import InvalidTransition, TransitionConflict
+from apps.p2p.models import P2PTrade
+from apps.p2p.pagination import ParticipantPagination
+from apps.p2p.transitions import transition_trade
 from .models import TradeDispute
-from .serializers import TradeDisputeSerializer
+from .serializers import TradeDisputeSerializer, TradeDisputeUpdateSerializer
 
 
 class TradeDisputeCreateView(generics.CreateAPIView):
@@ -35,12 +38,25 @@ class TradeDisputeCreateView(generics.CreateAPIView):
                 {"detail": "Dispute already exists for this trade"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        return super().create(request, *args, **kwargs)
+        try:
+            return super().create(request, *args, **kwargs)
+        except TransitionConflict:
+            # the dispute was rolled back with the failed transition
+            return Response(
+                {"detail": "Trade was updated by another request, please retry."},
+                status=status.HTTP_409_CONFLICT,
+            )
 
     def perform_create(self, serializer):
-        client_token = self.request.user.client_token
-        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-        initiator_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
+        initiator_token = self.request.user.user_token
+
+        try:
+            trade = P2PTrade.objects.get(pk=self.request.data.get("trade"))
+        except (P2PTrade.DoesNotExist, DjangoValidationError):
+            raise ValidationError({"trade": "Trade not found"})
+
+        if initiator_token not in (trade.buyer_token, trade.seller_token):
+            raise PermissionDenied("You are not a party to this trade")
 
         # Validate evidence_hashes if provided
         evidence_hashes = serializer.validated_data.get("evidence_hashes")
@@ -53,30 +69,33 @@ class TradeDisputeCreateView(generics.CreateAPIView):
             if not isinstance(hashes, list):
                 raise ValidationError({"evidence_hashes": "Must be a JSON array"})
 
-        serializer.save(initiator_token=initiator_token)
+        with transaction.atomic():
+            serializer.save(initiator_token=initiator_token, trade=trade)
+
+            # Open trades move to Disputed; finished ones keep their status
+            try:
+                transition_trade(trade, "dispute")
+            except InvalidTransition:
+                pass
 
 
 class TradeDisputeDetailView(generics.RetrieveUpdateAPIView):
     """Retrieve a single dispute or update evidence / resolution status."""
 
-    serializer_class = TradeDisputeSerializer
+    serializer_class = TradeDisputeUpdateSerializer
     permission_classes = [permissions.IsAuthenticated]
     lookup_field = "pk"
     lookup_url_kwarg = "pk"
 
     def get_queryset(self):
-        client_token = self.request.user.client_token
-        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-        user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
+        user_token = self.request.user.user_token
 
-        return TradeDispute.objects.filter(
-            Q(trade__buyer_token=user_token)
-            | Q(trade__seller_token=user_token)
-            | Q(initiator_token=user_token)
-        )
+        # The initiator is always a party, so the participant index covers it
+        return TradeDispute.objects.filter(trade__participants__user_token=user_token)
 
     def perform_update(self, serializer):
         instance = self.get_object()
+        previous_resolution = instance.resolution
 
         # Non‑staff users may only update evidence fields
         allowed_fields = {"evidence_hashes", "evidence_ipfs_cid"}
@@ -92,32 +111,32 @@ class TradeDisputeDetailView(generics.RetrieveUpdateAPIView):
                 raise PermissionDenied("Only admins can update resolution")
             serializer.validated_data["resolved_at"] = timezone.now()
 
-        serializer.save()
+        dispute = serializer.save()
+        record_dispute_resolution(dispute, previous_resolution)
+
+
+class DisputePagination(ParticipantPagination):
+    participant_path = "trade__participants"
 
 
 class TradeDisputeListView(generics.ListAPIView):
-    """List all disputes belonging to the authenticated user."""
+    """
+    Disputes on the authenticated user's trades, newest trade first and
+    cursor paginated on idx_participant_user.
+    """
 
     serializer_class = TradeDisputeSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filterset_fields = ["resolution"]
-    search_fields = ["trade__id", "initiator_token"]
-    ordering = ["-created_at"]
+    pagination_class = DisputePagination
 
     def get_queryset(self):
-        client_token = self.request.user.client_token
-        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-        user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
+        user_token = self.request.user.user_token
 
-        qs = TradeDispute.objects.filter(
-            Q(trade__buyer_token=user_token)
-            | Q(trade__seller_token=user_token)
-            | Q(initiator_token=user_token)
-        )
+        qs = TradeDispute.objects.filter(trade__participants__user_token=user_token)
 
         # Optional filtering by resolution query param
         resolution = self.request.query_params.get("resolution")
         if resolution is not None:
             qs = qs.filter(resolution=resolution)
 
-        return qs.order_by("-created_at")
+        return qs
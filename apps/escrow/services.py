@@ -10,7 +10,7 @@ from web3 import Web3
 from web3.exceptions import ContractLogicError, TransactionNotFound
 from web3.types import TxReceipt
 
-
+from apps.p2p.services import fund_trades
 from .exceptions import (
     EscrowError,
     InsufficientFundsError,
@@ -83,6 +83,7 @@ def wait_for_deposit(wallet: EscrowWallet, min_amount: Decimal) -> None:
                     wallet.amount = Decimal(balance) / Decimal(10 ** USDT_DECIMALS)
                     wallet.status = "funded"
                     wallet.save(update_fields=["amount", "status"])
+                    fund_trades(wallet)
                 return
                 
             time.sleep(POLL_INTERVAL)
@@ -9,8 +9,6 @@ from django.shortcuts import get_object_or_404
 from .services import release_to, wait_for_deposit
 from decimal import Decimal
 from .services import create_escrow_wallet
-import hmac
-import hashlib
 
 class EscrowWalletCreateView(generics.CreateAPIView):
     queryset = EscrowWallet.objects.all()
@@ -18,8 +16,7 @@ class EscrowWalletCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        client_token = self.request.user.client_token
-        user_token = EscrowWallet.generate_user_token(client_token)
+        user_token = self.request.user.user_token
         
         # Create and save the escrow wallet with all fields at once
         escrow_wallet = create_escrow_wallet()
@@ -35,8 +32,7 @@ class EscrowWalletDetailView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        client_token = self.request.user.client_token
-        user_token = EscrowWallet.generate_user_token(client_token)
+        user_token = self.request.user.user_token
         return EscrowWallet.objects.filter(user_token=user_token)
 
 class SystemWalletListView(generics.ListAPIView):
@@ -49,8 +45,7 @@ class EscrowWalletListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        client_token = self.request.user.client_token
-        user_token = EscrowWallet.generate_user_token(client_token)
+        user_token = self.request.user.user_token
         return EscrowWallet.objects.filter(user_token=user_token)
 
 class EscrowFundView(APIView):
@@ -60,9 +55,7 @@ class EscrowFundView(APIView):
         escrow = get_object_or_404(EscrowWallet, id=escrow_id)
         
         # Verify user owns this escrow
-        client_token = request.user.client_token
-        user_token = EscrowWallet.generate_user_token(client_token)
-        if escrow.user_token != user_token:
+        if escrow.user_token != request.user.user_token:
             return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
         
         # Start monitoring for deposit
@@ -99,9 +92,7 @@ class EscrowReleaseView(APIView):
         escrow = get_object_or_404(EscrowWallet, id=escrow_id)
         
         # Verify user owns this escrow
-        client_token = request.user.client_token
-        user_token = EscrowWallet.generate_user_token(client_token)
-        if escrow.user_token != user_token:
+        if escrow.user_token != request.user.user_token:
             return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
         
         if escrow.status != "funded":
@@ -141,9 +132,7 @@ class EscrowDisputeView(APIView):
         escrow = get_object_or_404(EscrowWallet, id=escrow_id)
         
         # Verify user owns this escrow
-        client_token = request.user.client_token
-        user_token = EscrowWallet.generate_user_token(client_token)
-        if escrow.user_token != user_token:
+        if escrow.user_token != request.user.user_token:
             return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
         
         if escrow.status != "funded":
@@ -170,9 +159,7 @@ class EscrowUpdateView(APIView):
         escrow = get_object_or_404(EscrowWallet, id=escrow_id)
         
         # Verify user owns this escrow
-        client_token = request.user.client_token
-        user_token = EscrowWallet.generate_user_token(client_token)
-        if escrow.user_token != user_token:
+        if escrow.user_token != request.user.user_token:
             return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
         
         if escrow.status != "created":
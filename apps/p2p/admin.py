@@ -1,6 +1,10 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from django.contrib import messages
+from django.db import transaction
+from .exceptions import P2PError
 from .models import P2PListing, P2PTrade
+from .transitions import transition_listing, transition_trade
 
 @admin.register(P2PListing)
 class P2PListingAdmin(admin.ModelAdmin):
@@ -165,9 +169,12 @@ class P2PTradeAdmin(admin.ModelAdmin):
         'completed_at',
         'buyer_token',
         'seller_token',
+        'status',
+        'version',
         'trade_details',
         'status_history',
     )
+    actions = ['complete_trades', 'cancel_trades']
     fieldsets = (
         ('Basic Information', {
             'fields': (
@@ -199,6 +206,30 @@ class P2PTradeAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
     list_per_page = 20
 
+    # listing transition that follows each trade transition
+    LISTING_TRANSITION = {'complete': 'complete', 'cancel': 'release'}
+
+    def _transition(self, request, queryset, name):
+        done = 0
+        for trade in queryset.select_related('listing'):
+            try:
+                with transaction.atomic():
+                    transition_trade(trade, name)
+                    if trade.listing.status == 3:   # still reserved by this trade
+                        transition_listing(trade.listing, self.LISTING_TRANSITION[name])
+                done += 1
+            except P2PError as e:
+                self.message_user(request, str(e), level=messages.WARNING)
+        self.message_user(request, f"{done} trade(s) updated")
+
+    def complete_trades(self, request, queryset):
+        self._transition(request, queryset, 'complete')
+    complete_trades.short_description = "Mark as Completed"
+
+    def cancel_trades(self, request, queryset):
+        self._transition(request, queryset, 'cancel')
+    cancel_trades.short_description = "Cancel trades"
+
     def id_short(self, obj):
         return str(obj.id)[:8] + "..."
     id_short.short_description = "ID"
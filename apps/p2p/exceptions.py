@@ -0,0 +1,19 @@
+class P2PError(Exception):
+    """Base exception for p2p-related errors"""
+    pass
+
+class InvalidTransition(P2PError):
+    """Raised when a transition is not allowed from the current status"""
+    pass
+
+class TransitionConflict(P2PError):
+    """Raised when the row changed underneath us (status or version moved on)"""
+    pass
+
+class ListingUnavailable(P2PError):
+    """Raised when a listing cannot be traded (not active, expired or already reserved)"""
+    pass
+
+class EscrowUnavailable(P2PError):
+    """Raised when the escrow wallet given for a trade cannot be claimed"""
+    pass
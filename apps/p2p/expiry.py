@@ -0,0 +1,85 @@
+"""
+Deadline sweeper for P2P listings and trades.
+
+The due-time queue is the ``(status, expires_at)`` index itself: each pass
+takes the live rows whose deadline has passed, oldest first, in batches,
+and moves every batch with one bulk UPDATE through the state machine:
+
+* Created/Funded trades past ``expires_at`` -> Canceled, and the listing
+  they had reserved goes back to Active;
+* Active listings past ``expires_at`` -> Expired.
+
+Trades are swept first so a released listing that is itself past its
+deadline expires in the same pass. Rows are claimed with
+``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it, so
+several sweepers can run side by side.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import P2PListing, P2PTrade
+from .transitions import (
+    LISTING_TRANSITIONS,
+    TRADE_TRANSITIONS,
+    bulk_transition_listings,
+    bulk_transition_trades,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def _due(queryset, statuses, now, batch_size):
+    return list(
+        queryset.select_for_update(skip_locked=True, of=('self',))
+        .filter(status__in=statuses, expires_at__lte=now)
+        .order_by('expires_at')[:batch_size]
+    )
+
+
+def sweep_trades(now=None, batch_size=DEFAULT_BATCH_SIZE) -> tuple[int, int]:
+    """Cancel timed-out trades and release their listings. Returns (trades, listings)."""
+    now = now or timezone.now()
+    sources, _ = TRADE_TRANSITIONS['timeout']
+    canceled = released = 0
+
+    while True:
+        with transaction.atomic():
+            due = _due(P2PTrade.objects.select_related('listing'), sources, now, batch_size)
+            moved = bulk_transition_trades(due, 'timeout', updated_at=now)
+            released += len(bulk_transition_listings(
+                [trade.listing for trade in moved if trade.listing.status == 3], 'release'
+            ))
+        canceled += len(moved)
+        if len(due) < batch_size or not moved:
+            return canceled, released
+
+
+def sweep_listings(now=None, batch_size=DEFAULT_BATCH_SIZE) -> int:
+    """Move Active listings past their deadline to Expired."""
+    now = now or timezone.now()
+    sources, _ = LISTING_TRANSITIONS['expire']
+    expired = 0
+
+    while True:
+        with transaction.atomic():
+            due = _due(P2PListing.objects.all(), sources, now, batch_size)
+            moved = bulk_transition_listings(due, 'expire')
+        expired += len(moved)
+        if len(due) < batch_size or not moved:
+            return expired
+
+
+def sweep(now=None, batch_size=DEFAULT_BATCH_SIZE) -> dict:
+    now = now or timezone.now()
+    trades, released = sweep_trades(now, batch_size)
+    listings = sweep_listings(now, batch_size)
+    if trades or listings:
+        logger.info(
+            "Expiry sweep: %s trades canceled, %s listings released, %s listings expired",
+            trades, released, listings,
+        )
+    return {'trades_canceled': trades, 'listings_released': released, 'listings_expired': listings}
@@ -0,0 +1,169 @@
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+
+from apps.core.pagination import KeysetPagination
+from apps.p2p.models import P2PListing
+
+# Seeded rows are tagged with this seller token so they can be removed again
+BENCH_SELLER = 'benchmark-listing-feed'
+
+
+@contextmanager
+def _explicit_created_at():
+    """Let bulk_create keep the spread-out created_at values instead of now()."""
+    field = P2PListing._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic P2P listings in steps and time the listing feed "
+        "(keyset cursor vs. OFFSET) at increasing page depths. Runs in a "
+        "throwaway test database unless --i-know is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10000,100000,1000000',
+            help="Comma separated table sizes to measure at (default: 10k,100k,1M)",
+        )
+        parser.add_argument('--page-size', type=int, default=KeysetPagination.page_size)
+        parser.add_argument('--depths', default='1,10,100,1000', help="Page numbers to time")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--active-ratio', type=float, default=0.3,
+                            help="Share of seeded listings that stay Active")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--i-know', action='store_true', dest='i_know',
+                            help="Seed the configured database itself instead of a test database")
+        parser.add_argument('--keep', action='store_true',
+                            help="Do not delete the seeded rows (with --i-know)")
+        parser.add_argument('--cleanup', action='store_true', help="Only delete previously seeded rows")
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.stdout.write(f"Deleted {self._cleanup()} seeded listings")
+            return
+
+        try:
+            sizes = sorted(int(s) for s in options['sizes'].split(','))
+            depths = sorted(int(d) for d in options['depths'].split(','))
+        except ValueError:
+            raise CommandError("--sizes and --depths must be comma separated integers")
+        if options['keep'] and not options['i_know']:
+            raise CommandError("--keep needs --i-know: the test database is dropped afterwards")
+
+        if options['i_know']:
+            self._benchmark(sizes, depths, options)
+            return
+
+        # the same kind of database as configured, created and dropped like the test runner's
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._benchmark(sizes, depths, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _benchmark(self, sizes, depths, options):
+        self.page_size = options['page_size']
+        self.repeat = options['repeat']
+        self.stdout.write(
+            f"{connection.vendor} ({connection.settings_dict['NAME']}): "
+            f"page_size={self.page_size}, repeat={self.repeat}"
+        )
+        self.stdout.write(f"{'rows':>10} {'page':>6} {'keyset ms':>10} {'offset ms':>10}")
+
+        seeded = P2PListing.objects.filter(seller_token=BENCH_SELLER).count()
+        try:
+            for size in sizes:
+                if size > seeded:
+                    self._seed(size - seeded, options['active_ratio'], options['batch_size'])
+                    seeded = size
+                for depth in depths:
+                    cursor = self._cursor_for(depth)
+                    keyset = self._time(lambda: self._keyset_page(cursor))
+                    offset = self._time(lambda: self._offset_page(depth))
+                    self.stdout.write(f"{size:>10} {depth:>6} {keyset:>10.2f} {offset:>10.2f}")
+        finally:
+            if not options['keep']:
+                self._cleanup()
+
+    # ------------------------------------------------------------------ #
+
+    def _seed(self, count, active_ratio, batch_size):
+        now = timezone.now()
+        started = time.perf_counter()
+        created = 0
+        while created < count:
+            batch = []
+            for _ in range(min(batch_size, count - created)):
+                created += 1
+                active = random.random() < active_ratio
+                batch.append(P2PListing(
+                    id=uuid.uuid4(),
+                    seller_token=BENCH_SELLER,
+                    crypto_type=random.choice(('buy', 'sell')),
+                    crypto_amount=Decimal(random.randint(10, 10000)),
+                    usdt_amount=Decimal(random.randint(10, 10000)),
+                    payment_method=random.randint(1, 3),
+                    status=1 if active else random.choice((4, 5)),
+                    created_at=now - timedelta(seconds=created),
+                    expires_at=now + timedelta(days=7) if active else now - timedelta(days=1),
+                ))
+            with transaction.atomic(), _explicit_created_at():
+                P2PListing.objects.bulk_create(batch)
+        self.stdout.write(f"  seeded {count} listings in {time.perf_counter() - started:.1f}s")
+
+    def _request(self, cursor=None):
+        params = {'page_size': self.page_size}
+        if cursor:
+            params['cursor'] = cursor
+        return Request(RequestFactory().get('/api/p2p/listings/', params))
+
+    def _feed(self):
+        return P2PListing.objects.filter(status=1)
+
+    def _cursor_for(self, depth):
+        """Follow the cursor chain to the start of page ``depth``."""
+        cursor = None
+        for _ in range(depth - 1):
+            paginator = KeysetPagination()
+            paginator.paginate_queryset(self._feed(), self._request(cursor))
+            if paginator.next_cursor is None:
+                break
+            cursor = paginator.next_cursor
+        return cursor
+
+    def _keyset_page(self, cursor):
+        request = self._request(cursor)
+        started = time.perf_counter()
+        KeysetPagination().paginate_queryset(self._feed(), request)
+        return time.perf_counter() - started
+
+    def _offset_page(self, depth):
+        offset = (depth - 1) * self.page_size
+        started = time.perf_counter()
+        list(self._feed().order_by('-created_at', '-id')[offset:offset + self.page_size])
+        return time.perf_counter() - started
+
+    def _time(self, fn):
+        return statistics.median(fn() for _ in range(self.repeat)) * 1000
+
+    def _cleanup(self):
+        deleted, _ = P2PListing.objects.filter(seller_token=BENCH_SELLER).delete()
+        return deleted
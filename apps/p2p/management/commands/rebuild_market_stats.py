@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.p2p.stats import recompute
+
+
+class Command(BaseCommand):
+    help = "Recompute the P2P market statistics rows from the active listings"
+
+    def handle(self, *args, **options):
+        rows = recompute()
+        self.stdout.write(self.style.SUCCESS(f"Market stats rebuilt: {rows} rows"))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.p2p.expiry import DEFAULT_BATCH_SIZE, sweep
+
+
+class Command(BaseCommand):
+    help = "Expire overdue P2P listings and cancel timed-out trades"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping every --interval seconds")
+        parser.add_argument('--interval', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        while True:
+            result = sweep(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"{result['trades_canceled']} trades canceled, "
+                f"{result['listings_released']} listings released, "
+                f"{result['listings_expired']} listings expired"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
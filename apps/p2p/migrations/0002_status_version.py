@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='p2plisting',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped by every status transition'),
+        ),
+        migrations.AddField(
+            model_name='p2ptrade',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped by every status transition'),
+        ),
+    ]
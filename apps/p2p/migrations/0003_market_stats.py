@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p', '0002_status_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='P2PMarketStats',
+            fields=[
+                ('market', models.CharField(help_text='crypto_type:fiat_currency:payment_method', max_length=40, primary_key=True, serialize=False)),
+                ('active_listings', models.PositiveIntegerField(default=0)),
+                ('total_usdt', models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+                ('min_usdt', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('max_usdt', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('volume_24h', models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+                ('volume_refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='P2PVolumeBucket',
+            fields=[
+                ('minute', models.DateTimeField(primary_key=True, serialize=False)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+                ('trades', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
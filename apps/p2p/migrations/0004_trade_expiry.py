@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:44
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_trade_expiry(apps, schema_editor):
+    P2PTrade = apps.get_model('p2p', 'P2PTrade')
+    timeout = timedelta(hours=settings.XUSDT_SETTINGS['TRADE_TIMEOUT_HOURS'])
+    P2PTrade.objects.filter(expires_at__isnull=True).update(
+        expires_at=models.F('created_at') + timeout
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escrow', '0002_escrowwallet_amount_escrowwallet_buyer_address_and_more'),
+        ('p2p', '0003_market_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='p2ptrade',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, help_text='Created/Funded trades are canceled after this (TRADE_TIMEOUT_HOURS)', null=True),
+        ),
+        migrations.RunPython(backfill_trade_expiry, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='p2plisting',
+            index=models.Index(fields=['status', 'expires_at'], name='idx_listing_status_expiry'),
+        ),
+        migrations.AddIndex(
+            model_name='p2ptrade',
+            index=models.Index(fields=['status', 'expires_at'], name='idx_trade_status_expiry'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p', '0004_trade_expiry'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='p2plisting',
+            name='idx_listing_status',
+        ),
+        migrations.AddIndex(
+            model_name='p2plisting',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='idx_listing_feed'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_participants(apps, schema_editor):
+    P2PTrade = apps.get_model('p2p', 'P2PTrade')
+    TradeParticipant = apps.get_model('p2p', 'TradeParticipant')
+
+    batch = []
+    trades = P2PTrade.objects.values_list('id', 'buyer_token', 'seller_token', 'created_at').order_by()
+    for trade_id, buyer, seller, created_at in trades.iterator(chunk_size=1000):
+        batch.append(TradeParticipant(user_token=buyer, created_at=created_at, trade_id=trade_id, role=1))
+        batch.append(TradeParticipant(user_token=seller, created_at=created_at, trade_id=trade_id, role=2))
+        if len(batch) >= 2000:
+            TradeParticipant.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TradeParticipant.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p', '0005_listing_feed_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradeParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_token', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(help_text="Copy of the trade's created_at")),
+                ('role', models.SmallIntegerField(choices=[(1, 'Buyer'), (2, 'Seller')], help_text='1=Buyer,2=Seller')),
+                ('trade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='p2p.p2ptrade')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_token', '-created_at', '-trade'], name='idx_participant_user')],
+                'constraints': [models.UniqueConstraint(fields=('trade', 'role'), name='uniq_trade_participant_role')],
+            },
+        ),
+        migrations.RunPython(backfill_participants, migrations.RunPython.noop),
+    ]
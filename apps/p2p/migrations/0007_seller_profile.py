@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escrow', '0002_escrowwallet_amount_escrowwallet_buyer_address_and_more'),
+        ('p2p', '0006_trade_participant'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='p2plisting',
+            name='idx_listing_seller',
+        ),
+        migrations.AddField(
+            model_name='p2ptrade',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, help_text='When the buyer marked the payment as sent', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='p2plisting',
+            index=models.Index(fields=['seller_token', 'status', '-created_at', '-id'], name='idx_listing_seller_feed'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escrow', '0002_escrowwallet_amount_escrowwallet_buyer_address_and_more'),
+        ('p2p', '0007_seller_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='p2ptrade',
+            name='escrow_wallet',
+            field=models.ForeignKey(blank=True, help_text="Wallet holding this trade's USDT (the listing's, or one claimed at creation)", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trades', to='escrow.escrowwallet'),
+        ),
+    ]
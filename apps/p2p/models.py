@@ -49,26 +49,36 @@ class P2PListing(models.Model):
     instructions_enc = models.TextField(null=True, blank=True, help_text="Encrypted with session key")
 
     status = models.SmallIntegerField(choices=STATUS_CHOICES, default=1)
+    version = models.PositiveIntegerField(default=0, help_text="Bumped by every status transition")
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
 
     class Meta:
         indexes = [
-            models.Index(fields=['seller_token'], name='idx_listing_seller'),
-            models.Index(fields=['status'], name='idx_listing_status'),
+            # a seller's listings by status, newest first (seller profile);
+            # also serves every plain seller_token lookup
+            models.Index(fields=['seller_token', 'status', '-created_at', '-id'], name='idx_listing_seller_feed'),
             models.Index(fields=['payment_method'], name='idx_listing_payment_type'),
             models.Index(fields=['expires_at'], name='idx_listing_expiry'),
+            models.Index(fields=['status', 'expires_at'], name='idx_listing_status_expiry'),
+            # the public feed: status=1 ORDER BY created_at DESC, id DESC;
+            # also serves every plain status lookup
+            models.Index(fields=['status', '-created_at', '-id'], name='idx_listing_feed'),
         ]
         ordering = ['-created_at']
 
     def __str__(self):
         return f"Listing {self.id} - {self.get_status_display()}"
 
+    @staticmethod
+    def default_expires_at():
+        return timezone.now() + timezone.timedelta(
+            days=settings.XUSDT_SETTINGS['LISTING_EXPIRY_DAYS']
+        )
+
     def save(self, *args, **kwargs):
         if not self.expires_at:
-            self.expires_at = timezone.now() + timezone.timedelta(
-                days=settings.XUSDT_SETTINGS['LISTING_EXPIRY_DAYS']
-            )
+            self.expires_at = self.default_expires_at()
         super().save(*args, **kwargs)
 
 class P2PTrade(models.Model):
@@ -89,6 +99,14 @@ class P2PTrade(models.Model):
     )
     buyer_token = models.CharField(max_length=64)
     seller_token = models.CharField(max_length=64)
+    escrow_wallet = models.ForeignKey(
+        'escrow.EscrowWallet',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='trades',
+        help_text="Wallet holding this trade's USDT (the listing's, or one claimed at creation)"
+    )
     escrow_tx_hash = models.CharField(max_length=66)
     usdt_amount = models.DecimalField(
         max_digits=20,
@@ -106,6 +124,7 @@ class P2PTrade(models.Model):
         default=0,
         help_text="0=Created,1=Funded,2=PaymentSent,3=Completed,4=Disputed,5=Canceled"
     )
+    version = models.PositiveIntegerField(default=0, help_text="Bumped by every status transition")
     fee_amount = models.DecimalField(
         max_digits=20,
         decimal_places=6,
@@ -114,7 +133,13 @@ class P2PTrade(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    paid_at = models.DateTimeField(null=True, blank=True, help_text="When the buyer marked the payment as sent")
     completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Created/Funded trades are canceled after this (TRADE_TIMEOUT_HOURS)"
+    )
 
     class Meta:
         indexes = [
@@ -122,24 +147,109 @@ class P2PTrade(models.Model):
             models.Index(fields=['buyer_token'], name='idx_trade_buyer'),
             models.Index(fields=['seller_token'], name='idx_trade_seller'),
             models.Index(fields=['status'], name='idx_trade_status'),
+            models.Index(fields=['status', 'expires_at'], name='idx_trade_status_expiry'),
         ]
         ordering = ['-created_at']
 
     def __str__(self):
         return f"Trade {self.id} - {self.get_status_display()}"
 
+    def save(self, *args, **kwargs):
+        if not self.expires_at:
+            self.expires_at = timezone.now() + timezone.timedelta(
+                hours=settings.XUSDT_SETTINGS['TRADE_TIMEOUT_HOURS']
+            )
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def fee_for(usdt_amount):
+        """Platform fee for a trade of ``usdt_amount``: ESCROW_FEE_PERCENT, at least ESCROW_MIN_FEE."""
+        fee_percent = Decimal(str(settings.XUSDT_SETTINGS['ESCROW_FEE_PERCENT'])) / Decimal(100)
+        min_fee = Decimal(str(settings.XUSDT_SETTINGS['ESCROW_MIN_FEE']))
+        return max(usdt_amount * fee_percent, min_fee)
+
     def calculate_fee(self):
         """Calculate platform fee based on trade amount"""
-        from decimal import Decimal
         try:
-            fee_percent = Decimal(str(settings.XUSDT_SETTINGS['ESCROW_FEE_PERCENT'])) / Decimal(100)
-            calculated_fee = self.listing.usdt_amount * fee_percent
-            min_fee = Decimal(str(settings.XUSDT_SETTINGS['ESCROW_MIN_FEE']))
-            self.fee_amount = max(calculated_fee, min_fee)
+            self.fee_amount = self.fee_for(self.listing.usdt_amount)
             return self.fee_amount
         except (TypeError, ValueError, KeyError) as e:
             # Handle error appropriately - maybe log it and return a default fee
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Error calculating fee: {str(e)}")
-            return Decimal('0')
\ No newline at end of file
+            return Decimal('0')
+
+
+class TradeParticipant(models.Model):
+    """
+    One row per party of a trade, so "my trades" is a single range read on
+    (user_token, created_at) instead of an OR over buyer_token/seller_token.
+    """
+    ROLE_CHOICES = (
+        (1, 'Buyer'),
+        (2, 'Seller'),
+    )
+    ROLE_BUYER = 1
+    ROLE_SELLER = 2
+
+    user_token = models.CharField(max_length=64)
+    created_at = models.DateTimeField(help_text="Copy of the trade's created_at")
+    trade = models.ForeignKey(
+        P2PTrade,
+        on_delete=models.CASCADE,
+        related_name='participants'
+    )
+    role = models.SmallIntegerField(choices=ROLE_CHOICES, help_text="1=Buyer,2=Seller")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trade', 'role'], name='uniq_trade_participant_role'),
+        ]
+        indexes = [
+            models.Index(fields=['user_token', '-created_at', '-trade'], name='idx_participant_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_role_display()} of trade {self.trade_id}"
+
+    @classmethod
+    def for_trade(cls, trade):
+        """Unsaved rows for both parties of ``trade``."""
+        return [
+            cls(user_token=trade.buyer_token, created_at=trade.created_at, trade=trade, role=cls.ROLE_BUYER),
+            cls(user_token=trade.seller_token, created_at=trade.created_at, trade=trade, role=cls.ROLE_SELLER),
+        ]
+
+
+class P2PMarketStats(models.Model):
+    """
+    Aggregates over the active listings of one market, maintained
+    incrementally by apps.p2p.stats. Any part of the key may be "*", e.g.
+    "*:*:2" covers every Hawala listing and "*" the whole platform.
+    """
+    market = models.CharField(
+        max_length=40,
+        primary_key=True,
+        help_text="crypto_type:fiat_currency:payment_method"
+    )
+    active_listings = models.PositiveIntegerField(default=0)
+    total_usdt = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+    min_usdt = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    max_usdt = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    volume_24h = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+    volume_refreshed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Market {self.market}: {self.active_listings} active"
+
+
+class P2PVolumeBucket(models.Model):
+    """Traded USDT per minute; the rolling 24h volume sums the last 1440 buckets."""
+    minute = models.DateTimeField(primary_key=True)
+    volume = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+    trades = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.minute:%Y-%m-%d %H:%M} – {self.volume}"
@@ -0,0 +1,352 @@
+"""
+In-memory order book of active P2P listings.
+
+Listings are partitioned by market – (crypto_type, fiat_currency,
+payment_method) – and every partition is kept sorted best-price-first on
+the implied price ``usdt_amount / crypto_amount``: ascending for sell
+listings, descending for buy listings. Best price is the head of the list
+and depth is a slice, located with ``bisect`` in O(log n).
+
+The book is fed by the listing signals (see receivers.py). Each process
+keeps its own copy and reloads it from the DB every
+``ORDER_BOOK_TTL_SECONDS``, which bounds how long events handled by other
+workers can stay invisible here.
+
+A reload builds a complete new book without holding the lock: one query,
+one serializer for every row, and one sort per partition. Only swapping it
+in takes the lock. Listing events that arrive during the build are
+journaled and replayed onto the new book, so none are lost. Once a book is
+loaded, readers never wait for a reload. The reader that finds the book
+stale hands the rebuild to a background thread and keeps serving the
+current book. Only the first load of a process is waited for.
+"""
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import P2PListing
+
+logger = logging.getLogger(__name__)
+
+PRICE_QUANT = Decimal('0.000001')
+
+# Entry attributes with a per-market sorted secondary index for range search
+RANGE_FIELDS = ('usdt_amount', 'crypto_amount')
+
+# A range matching at most this many entries is answered from its amount
+# index (collect, filter, sort by price) instead of a filtered price scan
+INDEX_SCAN_LIMIT = 5000
+
+
+def market_key(crypto_type, fiat_currency, payment_method):
+    return (crypto_type, fiat_currency, int(payment_method))
+
+
+def implied_price(listing) -> Decimal | None:
+    try:
+        return (listing.usdt_amount / listing.crypto_amount).quantize(PRICE_QUANT)
+    except (InvalidOperation, ZeroDivisionError, TypeError):
+        return None
+
+
+class Entry:
+    __slots__ = (
+        'id', 'market', 'sort_key', 'price', 'crypto_amount', 'usdt_amount',
+        'seller_token', 'expires_at', 'payload',
+    )
+
+    def __init__(self, listing, payload):
+        self.id = str(listing.id)
+        self.market = market_key(listing.crypto_type, listing.fiat_currency, listing.payment_method)
+        self.price = implied_price(listing)
+        # head of every partition is the best price; ties go to the oldest listing
+        signed = self.price if listing.crypto_type == 'sell' else -self.price
+        self.sort_key = (signed, listing.created_at, self.id)
+        self.crypto_amount = listing.crypto_amount
+        self.usdt_amount = listing.usdt_amount
+        self.seller_token = listing.seller_token
+        self.expires_at = listing.expires_at
+        self.payload = payload
+
+    def as_dict(self, viewer_token=None):
+        return dict(self.payload, is_owner=viewer_token == self.seller_token)
+
+
+def listing_serializer():
+    """One serializer whose fields are built once and reused for every row."""
+    from .serializers import P2PListingSerializer
+
+    return P2PListingSerializer()
+
+
+def make_entry(listing, serializer) -> Entry | None:
+    if implied_price(listing) is None:
+        return None
+    payload = serializer.to_representation(listing)
+    payload.pop('is_owner', None)
+    return Entry(listing, payload)
+
+
+def build_index(listings) -> tuple:
+    """(keys, entries, by_key, ranges) of ``listings``, each partition sorted once."""
+    serializer = listing_serializer()
+    keys, entries, by_key = {}, {}, {}
+    ranges = {field: {} for field in RANGE_FIELDS}
+    for listing in listings:
+        entry = make_entry(listing, serializer)
+        if entry is None:
+            continue
+        keys.setdefault(entry.market, []).append(entry.sort_key)
+        entries[entry.id] = entry
+        by_key[entry.sort_key] = entry
+        for field, index in ranges.items():
+            index.setdefault(entry.market, []).append((getattr(entry, field), entry.sort_key))
+    for values in keys.values():
+        values.sort()
+    for index in ranges.values():
+        for values in index.values():
+            values.sort()
+    return keys, entries, by_key, ranges
+
+
+class OrderBook:
+    def __init__(self, ttl=None, background=True):
+        self.ttl = ttl
+        self.background = background
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()  # one rebuild at a time
+        self._keys = {}      # market -> sorted [sort_key, ...]
+        self._entries = {}   # listing id -> Entry
+        self._by_key = {}    # sort_key -> Entry
+        self._ranges = {field: {} for field in RANGE_FIELDS}  # field -> market -> sorted [(value, sort_key)]
+        self._journal = None  # listing events received while a rebuild runs
+        self._loaded_at = None
+
+    # ------------------------------------------------------------------ #
+    # Maintenance                                                        #
+    # ------------------------------------------------------------------ #
+
+    def _ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return settings.XUSDT_SETTINGS.get('ORDER_BOOK_TTL_SECONDS', 30)
+
+    def _ensure_loaded(self):
+        """Called without the lock: only the first load makes readers wait."""
+        if self._loaded_at is None:
+            with self._reload_lock:
+                if self._loaded_at is None:     # not loaded by another reader meanwhile
+                    self._rebuild()
+        elif time.monotonic() - self._loaded_at > self._ttl() and self._reload_lock.acquire(blocking=False):
+            # inside a transaction a separate connection would not see its writes
+            if self.background and not connection.in_atomic_block:
+                threading.Thread(target=self._refresh, name='order-book-reload', daemon=True).start()
+            else:
+                self._refresh(close_connection=False)
+
+    def _refresh(self, close_connection=True):
+        """Rebuild holding ``_reload_lock``, which the caller acquired."""
+        try:
+            self._rebuild()
+        except Exception:
+            logger.exception("Order book reload failed; serving the previous book")
+        finally:
+            self._reload_lock.release()
+            if close_connection:
+                connection.close()   # the reload thread's own connection
+
+    def reload(self):
+        with self._reload_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._journal = []
+        try:
+            listings = P2PListing.objects.filter(status=1).order_by()
+            index = build_index(listings.iterator(chunk_size=2000))
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            self._keys, self._entries, self._by_key, self._ranges = index
+            journal, self._journal = self._journal, None
+            # events are replayed in order: each leaves its listing as it last was
+            for listings, remove in journal:
+                self._apply(listings, remove)
+            self._loaded_at = time.monotonic()
+
+    def _insert(self, listing, serializer=None):
+        entry = make_entry(listing, serializer or listing_serializer())
+        if entry is None:
+            return
+        bisect.insort(self._keys.setdefault(entry.market, []), entry.sort_key)
+        self._entries[entry.id] = entry
+        self._by_key[entry.sort_key] = entry
+        for field, index in self._ranges.items():
+            bisect.insort(index.setdefault(entry.market, []), (getattr(entry, field), entry.sort_key))
+
+    def _delete(self, listing_id):
+        entry = self._entries.pop(str(listing_id), None)
+        if entry is None:
+            return
+        keys = self._keys[entry.market]
+        i = bisect.bisect_left(keys, entry.sort_key)
+        if i < len(keys) and keys[i] == entry.sort_key:
+            del keys[i]
+        del self._by_key[entry.sort_key]
+        if not keys:
+            del self._keys[entry.market]
+        for field, index in self._ranges.items():
+            values = index[entry.market]
+            item = (getattr(entry, field), entry.sort_key)
+            i = bisect.bisect_left(values, item)
+            if i < len(values) and values[i] == item:
+                del values[i]
+            if not values:
+                del index[entry.market]
+
+    def _apply(self, items, remove):
+        serializer = None
+        for item in items:
+            if remove:
+                self._delete(item)
+                continue
+            self._delete(item.id)
+            if item.status == 1:
+                serializer = serializer or listing_serializer()
+                self._insert(item, serializer)
+
+    def _record(self, items, remove):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((items, remove))
+            if self._loaded_at is not None:
+                self._apply(items, remove)
+            # else: the first load reads everything anyway
+
+    def upsert(self, listings):
+        """Add (or re-price) active listings and drop inactive ones."""
+        self._record(list(listings), remove=False)
+
+    def remove(self, listing_ids):
+        self._record(list(listing_ids), remove=True)
+
+    # ------------------------------------------------------------------ #
+    # Queries                                                            #
+    # ------------------------------------------------------------------ #
+
+    def _live(self, market, reverse=False):
+        """Yield entries best-first, skipping overdue ones the sweeper has not reached yet."""
+        now = timezone.now()
+        keys = self._keys.get(market, ())
+        for key in (reversed(keys) if reverse else keys):
+            entry = self._by_key.get(key)
+            if entry is not None and entry.expires_at > now:
+                yield entry
+
+    def best(self, market):
+        self._ensure_loaded()
+        with self._lock:
+            return next(self._live(market), None)
+
+    def top(self, market, limit):
+        self._ensure_loaded()
+        with self._lock:
+            entries = []
+            for entry in self._live(market):
+                entries.append(entry)
+                if len(entries) >= limit:
+                    break
+            return entries
+
+    def depth(self, market, levels):
+        """Aggregate crypto_amount per price level, best level first."""
+        self._ensure_loaded()
+        with self._lock:
+            book = []
+            for entry in self._live(market):
+                if book and book[-1]['price'] == entry.price:
+                    book[-1]['crypto_amount'] += entry.crypto_amount
+                    book[-1]['listings'] += 1
+                    continue
+                if len(book) >= levels:
+                    break
+                book.append({'price': entry.price, 'crypto_amount': entry.crypto_amount, 'listings': 1})
+            return book
+
+
+    def market_sizes(self):
+        """Listing count per market – the precomputed facet counts."""
+        self._ensure_loaded()
+        with self._lock:
+            return {market: len(keys) for market, keys in self._keys.items()}
+
+    def _range_slices(self, field, markets, low, high):
+        """(market values, start, stop) of every market's entries within [low, high]."""
+        slices = []
+        for market in markets:
+            values = self._ranges[field].get(market, [])
+            start = 0 if low is None else bisect.bisect_left(values, low, key=lambda item: item[0])
+            stop = len(values) if high is None else bisect.bisect_right(values, high, key=lambda item: item[0])
+            slices.append((values, start, stop))
+        return slices
+
+    def search(self, markets, ascending=True, ranges=None, limit=20, offset=0):
+        """
+        Entries of ``markets`` in implied-price order, optionally restricted
+        to ``ranges`` – {field: (low, high)} over RANGE_FIELDS, None = open.
+
+        Every partition is already sorted by price (sell ascending, buy
+        descending), so by default partitions are walked forwards or
+        backwards, k-way merged and filtered until ``offset + limit``
+        entries matched. When a range is narrow enough its amount index is
+        used instead: the few matching entries are collected and sorted.
+        """
+        ranges = {field: bounds for field, bounds in (ranges or {}).items() if bounds != (None, None)}
+
+        def matches(entry):
+            return all(
+                (low is None or getattr(entry, field) >= low) and (high is None or getattr(entry, field) <= high)
+                for field, (low, high) in ranges.items()
+            )
+
+        self._ensure_loaded()
+        with self._lock:
+
+            if ranges:
+                # the most selective range, counted in O(log n) per market
+                field, slices = min(
+                    ((field, self._range_slices(field, markets, *bounds)) for field, bounds in ranges.items()),
+                    key=lambda pair: sum(stop - start for _, start, stop in pair[1]),
+                )
+                if sum(stop - start for _, start, stop in slices) <= INDEX_SCAN_LIMIT:
+                    now = timezone.now()
+                    entries = [
+                        self._by_key[sort_key]
+                        for values, start, stop in slices
+                        for _, sort_key in values[start:stop]
+                    ]
+                    entries = [e for e in entries if e.expires_at > now and matches(e)]
+                    entries.sort(key=lambda entry: entry.price, reverse=not ascending)
+                    return entries[offset:offset + limit]
+
+            streams = [
+                self._live(market, reverse=(market[0] == 'sell') != ascending)
+                for market in markets
+            ]
+            merged = heapq.merge(*streams, key=lambda entry: entry.price, reverse=not ascending)
+            if ranges:
+                merged = filter(matches, merged)
+            return list(itertools.islice(merged, offset, offset + limit))
+
+order_book = OrderBook()
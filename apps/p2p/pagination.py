@@ -0,0 +1,30 @@
+from django.db.models import F
+
+from apps.core.pagination import KeysetPagination
+from .models import TradeParticipant
+
+
+class ParticipantPagination(KeysetPagination):
+    """
+    Keyset pages of a user's trades (or rows hanging off them) in the order
+    of idx_participant_user: the caller's TradeParticipant (created_at,
+    trade) descending.
+
+    The view's queryset must already be filtered on
+    ``<participant_path>__user_token``. The cursor columns are annotated
+    from that same join, so each page is one range read on the index.
+    """
+    ordering = ('-participant_created_at', '-participant_trade_id')
+    participant_path = 'participants'
+
+    CURSOR_FIELDS = {'participant_created_at': 'created_at', 'participant_trade_id': 'trade'}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = queryset.annotate(
+            participant_created_at=F(f'{self.participant_path}__created_at'),
+            participant_trade_id=F(f'{self.participant_path}__trade_id'),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_cursor_field(self, model, name):
+        return TradeParticipant._meta.get_field(self.CURSOR_FIELDS[name])
@@ -0,0 +1,81 @@
+"""
+Seller profile aggregates.
+
+A seller page shows how the seller's past trades went. The numbers come
+from two reads on the seller's trades (idx_trade_seller): one grouped
+aggregate and the most recent release times for the median. The result
+is cached per seller token. Receivers drop the entry whenever one of the
+seller's trades is created, transitions or is disputed, so the cache TTL
+only matters for the sliding 30-day volume window.
+"""
+import statistics
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import P2PTrade
+
+VOLUME_WINDOW = timedelta(days=30)
+
+# The median release time is taken over this many latest completions
+RELEASE_SAMPLE = 200
+
+
+def cache_key(seller_token: str) -> str:
+    return f"p2p:seller-profile:{seller_token}"
+
+
+def _rate(part: int, whole: int) -> float | None:
+    return round(part * 100.0 / whole, 2) if whole else None
+
+
+def compute(seller_token: str) -> dict:
+    now = timezone.now()
+    trades = P2PTrade.objects.filter(seller_token=seller_token).order_by()
+    agg = trades.aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status=3)),
+        canceled=Count('id', filter=Q(status=5)),
+        disputed=Count('id', filter=Q(status=4) | Q(dispute__isnull=False)),
+        volume_30d=Sum('usdt_amount', filter=Q(status=3, completed_at__gte=now - VOLUME_WINDOW)),
+    )
+
+    # Release time: from the buyer's "payment sent" (or the trade's start,
+    # for trades completed without it) until the seller released the escrow
+    releases = (
+        trades.filter(status=3, completed_at__isnull=False)
+        .annotate(started_at=Coalesce('paid_at', 'created_at'))
+        .order_by('-completed_at')
+        .values_list('started_at', 'completed_at')[:RELEASE_SAMPLE]
+    )
+    seconds = [(completed - started).total_seconds() for started, completed in releases]
+
+    finished = agg['completed'] + agg['canceled']
+    return {
+        'seller_token': seller_token,
+        'completed_trades': agg['completed'],
+        'completion_rate': _rate(agg['completed'], finished),
+        'median_release_seconds': round(statistics.median(seconds)) if seconds else None,
+        'dispute_rate': _rate(agg['disputed'], agg['total']),
+        'volume_30d': str((agg['volume_30d'] or Decimal('0')).quantize(Decimal('0.01'))),
+        'computed_at': now.isoformat(),
+    }
+
+
+def seller_profile(seller_token: str) -> dict:
+    """The seller's aggregates, from the cache when they are there."""
+    key = cache_key(seller_token)
+    profile = cache.get(key)
+    if profile is None:
+        profile = compute(seller_token)
+        cache.set(key, profile, settings.XUSDT_SETTINGS['SELLER_PROFILE_CACHE_SECONDS'])
+    return profile
+
+
+def invalidate(*seller_tokens) -> None:
+    cache.delete_many([cache_key(token) for token in seller_tokens if token])
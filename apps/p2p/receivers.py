@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.core import events
+from apps.core.reputation import record_dispute_deleted, record_dispute_opened, record_trade_transition
+from . import profiles, stats
+from .models import TradeParticipant
+from .orderbook import order_book
+from .signals import (
+    listing_transitioned,
+    listings_deleted,
+    listings_saved,
+    trade_created,
+    trade_transitioned,
+)
+
+
+@receiver(trade_transitioned)
+def update_reputation(sender, trade, previous_status, **kwargs):
+    record_trade_transition(trade, previous_status, trade.status)
+
+
+@receiver(post_save, sender='disputes.TradeDispute')
+def update_reputation_dispute_opened(sender, instance, created, **kwargs):
+    if created:
+        record_dispute_opened(instance)
+
+
+@receiver(post_delete, sender='disputes.TradeDispute')
+def update_reputation_dispute_deleted(sender, instance, **kwargs):
+    record_dispute_deleted(instance)
+
+
+@receiver(trade_created)
+def index_trade_participants(sender, trade, **kwargs):
+    TradeParticipant.objects.bulk_create(TradeParticipant.for_trade(trade))
+
+
+@receiver(listings_saved)
+def order_book_upsert(sender, listings, **kwargs):
+    transaction.on_commit(lambda: order_book.upsert(listings))
+
+
+@receiver(listing_transitioned)
+def order_book_transition(sender, listing, **kwargs):
+    transaction.on_commit(lambda: order_book.upsert([listing]))
+
+
+@receiver(listings_deleted)
+def order_book_remove(sender, listing_ids, **kwargs):
+    transaction.on_commit(lambda: order_book.remove(listing_ids))
+
+
+@receiver(listings_saved)
+def market_stats_saved(sender, listings, previous=None, **kwargs):
+    if previous is None:
+        stats.listings_added([listing for listing in listings if listing.status == 1])
+    else:
+        stats.listings_changed(previous, listings)
+
+
+@receiver(listing_transitioned)
+def market_stats_transition(sender, listing, previous_status, **kwargs):
+    if previous_status == 1 and listing.status != 1:
+        stats.listing_removed(listing)
+    elif listing.status == 1 and previous_status != 1:
+        stats.listing_added(listing)
+
+
+@receiver(listings_deleted)
+def market_stats_deleted(sender, listings=(), **kwargs):
+    stats.listings_removed([listing for listing in listings if listing.status == 1])
+
+
+@receiver(trade_created)
+def market_stats_volume(sender, trade, **kwargs):
+    stats.trade_created(trade)
+
+
+def _trade_event(trade, previous_status=None):
+    return {
+        "id": str(trade.pk),
+        "listing": str(trade.listing_id),
+        "status": trade.status,
+        "status_display": trade.get_status_display(),
+        "previous_status": previous_status,
+        "version": trade.version,
+    }
+
+
+@receiver(trade_created)
+def push_trade_created(sender, trade, **kwargs):
+    events.publish("trade", (trade.buyer_token, trade.seller_token), _trade_event(trade))
+
+
+@receiver(trade_transitioned)
+def push_trade_transition(sender, trade, previous_status, **kwargs):
+    events.publish(
+        "trade", (trade.buyer_token, trade.seller_token), _trade_event(trade, previous_status)
+    )
+
+
+@receiver(trade_created)
+@receiver(trade_transitioned)
+def invalidate_seller_profile(sender, trade, **kwargs):
+    transaction.on_commit(lambda: profiles.invalidate(trade.seller_token))
+
+
+@receiver(post_save, sender='disputes.TradeDispute')
+def invalidate_disputed_seller_profile(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: profiles.invalidate(instance.trade.seller_token))
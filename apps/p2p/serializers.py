@@ -1,8 +1,69 @@
-from rest_framework import serializers
 from django.conf import settings
+from rest_framework import serializers
 from .models import P2PListing, P2PTrade
-import hmac
-import hashlib
+
+
+def viewer_token(context):
+    """
+    The requesting user's token, looked up once per serializer context
+    (views.ViewerTokenMixin puts it there up front) instead of once per row.
+    """
+    if 'user_token' not in context:
+        request = context.get('request')
+        user = getattr(request, 'user', None)
+        context['user_token'] = getattr(user, 'user_token', None)
+    return context['user_token']
+
+
+class P2PListingBulkSerializer(serializers.ListSerializer):
+    """
+    ``many=True`` listing serializer that writes with one bulk_create /
+    bulk_update. Validation errors come back as a list aligned with the
+    input items.
+
+    For updates pass ``instance`` as {str(pk): listing}; every item names
+    its listing with an "id" key.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', settings.XUSDT_SETTINGS['P2P_BULK_MAX_LISTINGS'])
+        kwargs.setdefault('allow_empty', False)
+        super().__init__(*args, **kwargs)
+        self._seen = set()
+
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+
+        listing_id = str(data.get('id', '')) if isinstance(data, dict) else ''
+        if listing_id in self._seen:
+            raise serializers.ValidationError({'id': ['Duplicate listing.']})
+        self.child.instance = self.instance.get(listing_id)
+        if self.child.instance is None:
+            raise serializers.ValidationError({'id': ['Listing not found.']})
+        self._seen.add(listing_id)
+        return {**super().run_child_validation(data), 'id': self.child.instance.pk}
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        expires_at = model.default_expires_at()
+        listings = [model(**attrs) for attrs in validated_data]
+        for listing in listings:
+            listing.expires_at = listing.expires_at or expires_at
+        return model.objects.bulk_create(listings)
+
+    def update(self, instance, validated_data):
+        by_id = {listing.pk: listing for listing in instance.values()}
+        listings, fields = [], set()
+        for attrs in validated_data:
+            listing = by_id[attrs.pop('id')]
+            for field, value in attrs.items():
+                setattr(listing, field, value)
+            fields.update(attrs)
+            listings.append(listing)
+        if fields:
+            self.child.Meta.model.objects.bulk_update(listings, sorted(fields))
+        return listings
 
 
 class P2PListingSerializer(serializers.ModelSerializer):
@@ -10,6 +71,7 @@ class P2PListingSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = P2PListing
+        list_serializer_class = P2PListingBulkSerializer
         fields = [
             'id',
             'is_owner',  # Added instead of exposing raw token
@@ -47,13 +109,8 @@ class P2PListingSerializer(serializers.ModelSerializer):
         }
 
     def get_is_owner(self, obj):
-        request = self.context.get('request')
-        if request and hasattr(request, 'user'):
-            client_token = request.user.client_token
-            hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-            user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
-            return user_token == obj.seller_token
-        return False
+        user_token = viewer_token(self.context)
+        return user_token is not None and user_token == obj.seller_token
 
 
 class P2PTradeCreateSerializer(serializers.ModelSerializer):
@@ -61,10 +118,16 @@ class P2PTradeCreateSerializer(serializers.ModelSerializer):
         queryset=P2PListing.objects.filter(status=1),
         help_text="UUID of the listing being traded"
     )
+    escrow_wallet = serializers.UUIDField(
+        source='escrow_wallet_id',
+        required=False,
+        allow_null=True,
+        help_text="Escrow wallet to claim for this trade; defaults to the listing's"
+    )
 
     class Meta:
         model = P2PTrade
-        fields = ['id', 'listing', 'escrow_tx_hash', 'payment_proof_hash']
+        fields = ['id', 'listing', 'escrow_wallet', 'escrow_tx_hash', 'payment_proof_hash']
         extra_kwargs = {
             'escrow_tx_hash': {'required': True},
             'payment_proof_hash': {'required': False}  # Might be added later
@@ -92,14 +155,36 @@ class P2PTradeSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_role(self, obj):
-        request = self.context.get('request')
-        if request and hasattr(request, 'user'):
-            client_token = request.user.client_token
-            hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-            user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
-            
+        user_token = viewer_token(self.context)
+        if user_token is not None:
             if user_token == obj.buyer_token:
                 return 'buyer'
             elif user_token == obj.seller_token:
                 return 'seller'
-        return 'unknown'
\ No newline at end of file
+        return 'unknown'
+
+
+class ListingIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.XUSDT_SETTINGS['P2P_BULK_MAX_LISTINGS'],
+    )
+
+
+class ListingSearchSerializer(serializers.Serializer):
+    """Query parameters of the listing search endpoint."""
+    crypto_type = serializers.ChoiceField(choices=P2PListing.CRYPTO_TYPES, required=False)
+    fiat_currency = serializers.CharField(max_length=10, required=False)
+    payment_method = serializers.ChoiceField(choices=P2PListing.PAYMENT_METHODS, required=False)
+    min_usdt_amount = serializers.DecimalField(max_digits=20, decimal_places=2, required=False)
+    max_usdt_amount = serializers.DecimalField(max_digits=20, decimal_places=2, required=False)
+    min_crypto_amount = serializers.DecimalField(max_digits=20, decimal_places=6, required=False)
+    max_crypto_amount = serializers.DecimalField(max_digits=20, decimal_places=6, required=False)
+    sort = serializers.ChoiceField(
+        choices=(('price', 'Price ascending'), ('-price', 'Price descending')),
+        required=False,
+        help_text="Defaults to best price first: ascending for sell, descending for buy",
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    offset = serializers.IntegerField(min_value=0, max_value=10000, default=0)
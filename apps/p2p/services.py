@@ -0,0 +1,96 @@
+"""
+Trade creation and funding.
+
+A trade is opened in one transaction:
+
+1. the listing is reserved with the state machine's conditional UPDATE –
+   of two buyers racing for it, only one gets a row back;
+2. the escrow wallet – the one the buyer names (owned by a party, still
+   'created'), or else the listing's own – is locked with SELECT ... FOR
+   UPDATE and refused if it backs another open trade. The lock makes a
+   concurrent trade on the same wallet wait for this one to commit, so
+   its check then sees this trade;
+3. the trade row is INSERTed with its amount and fee already computed.
+
+The listing instance passed in is the one the serializer already loaded,
+so nothing is read again.
+
+A trade starts out Created and moves to Funded once its escrow wallet has
+received the deposit (``fund_trades``); only then can the buyer mark it paid.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from apps.escrow.models import EscrowWallet
+from .exceptions import EscrowUnavailable, InvalidTransition, ListingUnavailable, TransitionConflict
+from .models import P2PListing, P2PTrade
+from .signals import trade_created
+from .transitions import bulk_transition_trades, transition_listing
+
+# Trade statuses during which an escrow wallet is tied to its trade
+OPEN_TRADE_STATUSES = (0, 1, 2, 4)
+
+
+def _lock_escrow(wallet_id, **filters) -> bool:
+    """Lock the wallet row; False if it does not match ``filters`` or backs an open trade."""
+    locked = EscrowWallet.objects.select_for_update().filter(pk=wallet_id, **filters).exists()
+    return locked and not P2PTrade.objects.filter(
+        escrow_wallet_id=wallet_id, status__in=OPEN_TRADE_STATUSES
+    ).exists()
+
+
+def _claim_escrow(wallet_id, listing: P2PListing, buyer_token: str, now) -> None:
+    claimable = _lock_escrow(
+        wallet_id,
+        user_token__in=(buyer_token, listing.seller_token),
+        status=EscrowWallet.STATUS_CREATED,
+    )
+    if not claimable:
+        raise EscrowUnavailable("This escrow wallet cannot be used for this trade")
+    EscrowWallet.objects.filter(pk=wallet_id).update(amount=listing.usdt_amount, last_used=now)
+
+
+def create_trade(listing: P2PListing, buyer_token: str, escrow_wallet_id=None, **fields) -> P2PTrade:
+    """
+    Reserve ``listing`` for ``buyer_token`` and open a trade on it.
+
+    ``fields`` are extra P2PTrade columns (escrow_tx_hash, payment_proof_hash).
+    Raises ListingUnavailable / EscrowUnavailable; nothing is written then.
+    """
+    now = timezone.now()
+    if buyer_token == listing.seller_token:
+        raise ListingUnavailable("You cannot create a trade with your own listing")
+    if listing.expires_at <= now:
+        raise ListingUnavailable("This listing is not available for trading")
+
+    with transaction.atomic():
+        try:
+            transition_listing(listing, 'reserve')
+        except (InvalidTransition, TransitionConflict):
+            raise ListingUnavailable("This listing is not available for trading")
+
+        if escrow_wallet_id is not None:
+            _claim_escrow(escrow_wallet_id, listing, buyer_token, now)
+        else:
+            escrow_wallet_id = listing.escrow_wallet_id
+            if escrow_wallet_id is not None and not _lock_escrow(escrow_wallet_id):
+                raise EscrowUnavailable("The listing's escrow wallet is backing another open trade")
+
+        trade = P2PTrade(
+            listing=listing,
+            buyer_token=buyer_token,
+            seller_token=listing.seller_token,
+            escrow_wallet_id=escrow_wallet_id,
+            usdt_amount=listing.usdt_amount,
+            fee_amount=P2PTrade.fee_for(listing.usdt_amount),
+            **fields,
+        )
+        trade.save(force_insert=True)
+        trade_created.send(sender=P2PTrade, trade=trade)
+    return trade
+
+
+def fund_trades(wallet: EscrowWallet) -> list[P2PTrade]:
+    """Move the Created trades backed by the now funded ``wallet`` to Funded."""
+    trades = list(P2PTrade.objects.filter(escrow_wallet=wallet, status=0))
+    return bulk_transition_trades(trades, 'fund')
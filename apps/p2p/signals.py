@@ -0,0 +1,15 @@
+from django.dispatch import Signal
+
+# Sent by apps.p2p.transitions after a conditional status UPDATE succeeded.
+# kwargs: trade / listing, transition (name), previous_status
+trade_transitioned = Signal()
+listing_transitioned = Signal()
+
+# Sent by the listing views after listings were created or edited / deleted.
+# kwargs: listings (saved instances), previous (their pre-edit copies, None
+# for new listings) / listing_ids, listings (the deleted instances)
+listings_saved = Signal()
+listings_deleted = Signal()
+
+# Sent by trade creation. kwargs: trade
+trade_created = Signal()
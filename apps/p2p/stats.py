@@ -0,0 +1,244 @@
+"""
+Incrementally maintained P2P market statistics.
+
+Every active listing is counted in three P2PMarketStats rows: its exact
+market ("sell:USD:1"), its payment method ("*:*:1") and the platform-wide
+row ("*"). Listing events add or subtract listings with F-expression
+UPDATEs over those rows – one per distinct delta, so a batch of listings
+costs a handful of statements; min/max are only re-aggregated when a
+listing that left was the current extreme.
+
+Trade volume goes into per-minute P2PVolumeBucket rows. The rolling 24h
+volume is re-summed from at most 1440 buckets, no more than once every
+``VOLUME_REFRESH_SECONDS``, and cached on the "*" row.
+
+``recompute()`` rebuilds every row from a single grouped query and is the
+fallback for a cold start or suspected drift.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from .models import P2PListing, P2PMarketStats, P2PTrade, P2PVolumeBucket
+
+logger = logging.getLogger(__name__)
+
+ALL_MARKETS = '*'
+VOLUME_WINDOW = timedelta(hours=24)
+VOLUME_REFRESH_SECONDS = 60
+
+
+def market_id(crypto_type, fiat_currency, payment_method) -> str:
+    return f"{crypto_type}:{fiat_currency}:{int(payment_method)}"
+
+
+def payment_method_id(payment_method) -> str:
+    return market_id('*', '*', payment_method)
+
+
+def listing_markets(listing) -> list[str]:
+    """Every stats row ``listing`` is counted in."""
+    return [
+        market_id(listing.crypto_type, listing.fiat_currency, listing.payment_method),
+        payment_method_id(listing.payment_method),
+        ALL_MARKETS,
+    ]
+
+
+def _active_listings():
+    return P2PListing.objects.filter(status=1)
+
+
+def _market_filter(market):
+    """Q() selecting the active listings that belong to stats row ``market``."""
+    if market == ALL_MARKETS:
+        return Q()
+    crypto_type, fiat_currency, payment_method = market.split(':')
+    q = Q(payment_method=int(payment_method))
+    if crypto_type != '*':
+        q &= Q(crypto_type=crypto_type)
+    if fiat_currency != '*':
+        q &= Q(fiat_currency=fiat_currency)
+    return q
+
+
+def _refresh_extremes(markets, counts=False):
+    """Re-aggregate min/max (and optionally count/total) for ``markets``."""
+    listings = _active_listings()
+    for market in markets:
+        agg = listings.filter(_market_filter(market)).aggregate(
+            n=Count('id'), total=Sum('usdt_amount'), low=Min('usdt_amount'), high=Max('usdt_amount'),
+        )
+        values = {'min_usdt': agg['low'], 'max_usdt': agg['high']}
+        if counts:
+            values.update(active_listings=agg['n'], total_usdt=agg['total'] or 0)
+        P2PMarketStats.objects.filter(pk=market).update(**values)
+
+
+# --------------------------------------------------------------------------- #
+# Hooks                                                                       #
+# --------------------------------------------------------------------------- #
+
+def _group(listings) -> dict:
+    """{market: [usdt amounts of the given listings counted in it]}."""
+    groups = defaultdict(list)
+    for listing in listings:
+        for market in listing_markets(listing):
+            groups[market].append(listing.usdt_amount)
+    return groups
+
+
+def _by_delta(groups, delta):
+    """Markets sharing the same ``delta(amounts)``, so each distinct delta is one UPDATE."""
+    batches = defaultdict(list)
+    for market, amounts in groups.items():
+        batches[delta(amounts)].append(market)
+    return batches.items()
+
+
+def listings_added(listings) -> None:
+    """Count listings that just became active."""
+    missing = []
+    deltas = _by_delta(_group(listings), lambda amounts: (len(amounts), sum(amounts), min(amounts), max(amounts)))
+    for (count, total, low, high), markets in deltas:
+        low, high = Value(low), Value(high)
+        updated = P2PMarketStats.objects.filter(pk__in=markets).update(
+            active_listings=F('active_listings') + count,
+            total_usdt=F('total_usdt') + Value(total),
+            min_usdt=Least(Coalesce(F('min_usdt'), low), low),
+            max_usdt=Greatest(Coalesce(F('max_usdt'), high), high),
+        )
+        if updated < len(markets):
+            missing += markets
+    if missing:
+        # first listing in a new market: create its row from the DB state
+        P2PMarketStats.objects.bulk_create(
+            [P2PMarketStats(market=market) for market in missing],
+            ignore_conflicts=True,
+        )
+        _refresh_extremes(missing, counts=True)
+
+
+def listings_removed(listings) -> None:
+    """Uncount listings that are no longer active (reserved, expired, deleted...)."""
+    groups = _group(listings)
+    if not groups:
+        return
+    for (count, total), markets in _by_delta(groups, lambda amounts: (len(amounts), sum(amounts))):
+        P2PMarketStats.objects.filter(pk__in=markets, active_listings__gt=0).update(
+            active_listings=Greatest(F('active_listings') - count, Value(0)),
+            total_usdt=F('total_usdt') - Value(total),
+        )
+    rows = P2PMarketStats.objects.filter(pk__in=list(groups)).values_list(
+        'pk', 'min_usdt', 'max_usdt', 'active_listings'
+    )
+    _refresh_extremes([
+        market for market, low, high, count in rows
+        if not count or low in groups[market] or high in groups[market]
+    ])
+
+
+def listings_changed(previous, listings) -> None:
+    """Move edited listings between amounts/markets."""
+    listings_removed([before for before in previous if before.status == 1])
+    listings_added([after for after in listings if after.status == 1])
+
+
+def listing_added(listing) -> None:
+    listings_added([listing])
+
+
+def listing_removed(listing) -> None:
+    listings_removed([listing])
+
+
+def trade_created(trade: P2PTrade) -> None:
+    """Add the trade's USDT amount to its minute bucket."""
+    if not trade.usdt_amount:
+        return
+    minute = (trade.created_at or timezone.now()).replace(second=0, microsecond=0)
+    updates = {'volume': F('volume') + Value(trade.usdt_amount), 'trades': F('trades') + 1}
+
+    if P2PVolumeBucket.objects.filter(pk=minute).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            P2PVolumeBucket.objects.create(minute=minute, volume=trade.usdt_amount, trades=1)
+    except IntegrityError:
+        # another trade in the same minute created the bucket first
+        P2PVolumeBucket.objects.filter(pk=minute).update(**updates)
+
+
+# --------------------------------------------------------------------------- #
+# Reads                                                                       #
+# --------------------------------------------------------------------------- #
+
+def volume_24h(now=None) -> Decimal:
+    now = now or timezone.now()
+    total = P2PVolumeBucket.objects.filter(minute__gt=now - VOLUME_WINDOW).aggregate(
+        total=Sum('volume')
+    )['total']
+    return total or Decimal('0')
+
+
+def refresh_volume(row: P2PMarketStats) -> P2PMarketStats:
+    """Re-sum the 24h volume onto ``row`` when the cached figure is stale."""
+    now = timezone.now()
+    if row.volume_refreshed_at and (now - row.volume_refreshed_at).total_seconds() < VOLUME_REFRESH_SECONDS:
+        return row
+    row.volume_24h = volume_24h(now)
+    row.volume_refreshed_at = now
+    P2PMarketStats.objects.filter(pk=row.pk).update(
+        volume_24h=row.volume_24h, volume_refreshed_at=now
+    )
+    return row
+
+
+# --------------------------------------------------------------------------- #
+# Full recompute                                                              #
+# --------------------------------------------------------------------------- #
+
+@transaction.atomic
+def recompute() -> int:
+    """
+    Rebuild every stats row from one grouped query over the active listings.
+
+    Payment-method and platform-wide rows are folded from the per-market
+    groups in Python. Old volume buckets are pruned. Returns the row count.
+    """
+    groups = (
+        _active_listings()
+        .values('crypto_type', 'fiat_currency', 'payment_method')
+        .annotate(n=Count('id'), total=Sum('usdt_amount'), low=Min('usdt_amount'), high=Max('usdt_amount'))
+        .order_by()
+    )
+
+    rows = {ALL_MARKETS: P2PMarketStats(market=ALL_MARKETS)}
+    for payment_method, _ in P2PListing.PAYMENT_METHODS:
+        key = payment_method_id(payment_method)
+        rows[key] = P2PMarketStats(market=key)
+
+    for group in groups:
+        exact = market_id(group['crypto_type'], group['fiat_currency'], group['payment_method'])
+        for key in (exact, payment_method_id(group['payment_method']), ALL_MARKETS):
+            row = rows.setdefault(key, P2PMarketStats(market=key))
+            row.active_listings += group['n']
+            row.total_usdt += group['total']
+            row.min_usdt = group['low'] if row.min_usdt is None else min(row.min_usdt, group['low'])
+            row.max_usdt = group['high'] if row.max_usdt is None else max(row.max_usdt, group['high'])
+
+    now = timezone.now()
+    rows[ALL_MARKETS].volume_24h = volume_24h(now)
+    rows[ALL_MARKETS].volume_refreshed_at = now
+    P2PVolumeBucket.objects.filter(minute__lte=now - VOLUME_WINDOW).delete()
+
+    P2PMarketStats.objects.all().delete()
+    P2PMarketStats.objects.bulk_create(rows.values())
+    logger.info("Market stats recomputed: %s rows", len(rows))
+    return len(rows)
@@ -1,3 +1,648 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.core.models import AnonymousUser
+from apps.disputes.models import TradeDispute
+from apps.escrow.models import EscrowWallet
+from . import expiry, orderbook, stats
+from .admin import P2PTradeAdmin
+from .exceptions import EscrowUnavailable, InvalidTransition, TransitionConflict
+from .models import P2PListing, P2PMarketStats, P2PTrade, P2PVolumeBucket, TradeParticipant
+from .services import create_trade, fund_trades
+from .transitions import transition_listing, transition_trade
+from .views import P2PListingDetailView
+
+
+def create_user(exchange_code):
+    user = AnonymousUser(exchange_code=exchange_code)
+    user.set_password('pw123456')
+    user.save()
+    return user
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TradeQueryCountTests(TestCase):
+    """Trade endpoints must not issue a query per trade (or per nested listing)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = create_user('EX-BUYER01')
+        cls.seller = create_user('EX-SELLR01')
+
+    def create_trades(self, count, status=1):
+        trades = []
+        for i in range(count):
+            listing = P2PListing.objects.create(
+                seller_token=self.seller.user_token,
+                crypto_type='sell',
+                crypto_amount=Decimal('100'),
+                usdt_amount=Decimal('100') + i,
+                payment_method=1,
+                status=3,
+            )
+            trade = P2PTrade.objects.create(
+                listing=listing,
+                buyer_token=self.buyer.user_token,
+                seller_token=self.seller.user_token,
+                escrow_tx_hash=f'0x{i:064x}',
+                usdt_amount=listing.usdt_amount,
+                status=status,
+            )
+            TradeParticipant.objects.bulk_create(TradeParticipant.for_trade(trade))
+            trades.append(trade)
+        return trades
+
+    def count_queries(self, method, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, HTTP_X_CLIENT_TOKEN=self.buyer.client_token)
+        self.assertLess(response.status_code, 300, response.content)
+        return len(ctx), response
+
+    def test_my_trades_query_count_is_constant(self):
+        url = reverse('p2p-my-trades')
+        self.create_trades(1)
+        few, response = self.count_queries('get', url)
+        self.assertEqual(len(response.json()['results']), 1)
+
+        self.create_trades(9)
+        many, response = self.count_queries('get', url)
+        trades = response.json()['results']
+        self.assertEqual(len(trades), 10)
+        self.assertEqual(few, many)
+        self.assertTrue(all(t['role'] == 'buyer' for t in trades))
+        self.assertTrue(all(t['listing']['is_owner'] is False for t in trades))
+
+        small, response = self.count_queries('get', f'{url}?page_size=3')
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertEqual(small, many)
+
+    def test_my_trades_pages_follow_the_participant_index(self):
+        trades = self.create_trades(5)
+        now = timezone.now()
+        for minutes, trade in enumerate(trades[:3]):
+            TradeParticipant.objects.filter(trade=trade).update(created_at=now - timedelta(minutes=minutes))
+        # two trades opened in the same instant: the trade id breaks the tie
+        TradeParticipant.objects.filter(trade__in=trades[3:]).update(created_at=now + timedelta(hours=1))
+        tied = sorted(trades[3:], key=lambda trade: trade.pk, reverse=True)
+        expected = [str(t.pk) for t in tied + trades[:3]]
+
+        url, seen = f"{reverse('p2p-my-trades')}?page_size=2", []
+        while url:
+            response = self.client.get(url, HTTP_X_CLIENT_TOKEN=self.buyer.client_token)
+            self.assertEqual(response.status_code, 200, response.content)
+            seen.extend(trade['id'] for trade in response.json()['results'])
+            url = response.json()['next']
+        self.assertEqual(seen, expected)
+
+    def test_trade_detail_query_count_is_constant(self):
+        trades = self.create_trades(5)
+        counts = {
+            self.count_queries('get', reverse('p2p-trade-detail', args=[trade.pk]))[0]
+            for trade in trades
+        }
+        self.assertEqual(len(counts), 1)
+
+    def test_mark_paid_does_not_lazy_load_the_listing(self):
+        first, second = self.create_trades(2)
+        count, response = self.count_queries('post', reverse('p2p-trade-mark-paid', args=[first.pk]))
+        self.assertEqual(response.json()['role'], 'buyer')
+        self.assertEqual(response.json()['listing']['id'], str(first.listing_id))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(
+                reverse('p2p-trade-mark-paid', args=[second.pk]),
+                HTTP_X_CLIENT_TOKEN=self.buyer.client_token,
+            )
+        self.assertEqual(count, len(ctx))
+        listing_reads = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "p2p_p2plisting"' in q['sql']
+        ]
+        self.assertEqual(listing_reads, [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TradeParticipantTests(TestCase):
+
+    def setUp(self):
+        self.buyer = create_user('EX-BUYER02')
+        self.seller = create_user('EX-SELLR02')
+        self.other = create_user('EX-OTHER02')
+        self.listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token,
+            crypto_type='sell',
+            crypto_amount=Decimal('100'),
+            usdt_amount=Decimal('100'),
+            payment_method=1,
+        )
+
+    def test_trade_creation_indexes_both_parties(self):
+        response = self.client.post(
+            reverse('p2p-trade-create'),
+            {'listing': str(self.listing.pk), 'escrow_tx_hash': '0xabc'},
+            HTTP_X_CLIENT_TOKEN=self.buyer.client_token,
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+        rows = TradeParticipant.objects.filter(trade_id=response.json()['id'])
+        self.assertEqual(
+            {(row.user_token, row.role) for row in rows},
+            {
+                (self.buyer.user_token, TradeParticipant.ROLE_BUYER),
+                (self.seller.user_token, TradeParticipant.ROLE_SELLER),
+            },
+        )
+
+        for user, expected in ((self.buyer, 1), (self.seller, 1), (self.other, 0)):
+            response = self.client.get(reverse('p2p-my-trades'), HTTP_X_CLIENT_TOKEN=user.client_token)
+            self.assertEqual(len(response.json()['results']), expected)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BulkListingTests(TestCase):
+
+    def setUp(self):
+        self.seller = create_user('EX-SELLR03')
+        self.other = create_user('EX-OTHER03')
+
+    def item(self, amount, **extra):
+        return {
+            'crypto_type': 'sell',
+            'crypto_currency': 'USDT',
+            'crypto_amount': '100',
+            'fiat_currency': 'USD',
+            'usdt_amount': str(amount),
+            'payment_method': 1,
+            **extra,
+        }
+
+    def send(self, method, url, data, user=None):
+        return getattr(self.client, method)(
+            url, data, content_type='application/json',
+            HTTP_X_CLIENT_TOKEN=(user or self.seller).client_token,
+        )
+
+    def test_bulk_create_is_one_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.send('post', reverse('p2p-listing-bulk'), [self.item(100 + i) for i in range(5)])
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()), 5)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "p2p_p2plisting"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(P2PListing.objects.filter(seller_token=self.seller.user_token, status=1).count(), 5)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        response = self.send('post', reverse('p2p-listing-bulk'), [self.item(100), self.item(100, payment_method=9)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn('payment_method', response.json()[1])
+        self.assertFalse(P2PListing.objects.exists())
+
+    def test_bulk_update_only_touches_own_listings(self):
+        mine = self.send('post', reverse('p2p-listing-bulk'), [self.item(100), self.item(200)]).json()
+        theirs = self.send('post', reverse('p2p-listing-bulk'), [self.item(300)], user=self.other).json()
+
+        response = self.send('patch', reverse('p2p-listing-bulk'), [
+            {'id': mine[0]['id'], 'usdt_amount': '150'},
+            {'id': theirs[0]['id'], 'usdt_amount': '1'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[1], {'id': ['Listing not found.']})
+
+        response = self.send('patch', reverse('p2p-listing-bulk'), [
+            {'id': mine[0]['id'], 'usdt_amount': '150'},
+            {'id': mine[1]['id'], 'description': 'fast'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(P2PListing.objects.get(pk=mine[0]['id']).usdt_amount, Decimal('150'))
+        self.assertEqual(P2PListing.objects.get(pk=mine[1]['id']).description, 'fast')
+        self.assertEqual(P2PListing.objects.get(pk=theirs[0]['id']).usdt_amount, Decimal('300'))
+
+    def test_bulk_cancel(self):
+        mine = self.send('post', reverse('p2p-listing-bulk'), [self.item(100), self.item(200)]).json()
+        theirs = self.send('post', reverse('p2p-listing-bulk'), [self.item(300)], user=self.other).json()
+        ids = [listing['id'] for listing in mine]
+
+        response = self.send('post', reverse('p2p-listing-bulk-cancel'), {'ids': ids + [theirs[0]['id']]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['ids'], [{}, {}, {'id': ['Listing not found.']}])
+
+        response = self.send('post', reverse('p2p-listing-bulk-cancel'), {'ids': ids})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(set(P2PListing.objects.filter(pk__in=ids).values_list('status', flat=True)), {5})
+        self.assertEqual(P2PListing.objects.get(pk=theirs[0]['id']).status, 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ListingDetailTests(TestCase):
+
+    def setUp(self):
+        self.seller = create_user('EX-SELLR04')
+        self.buyer = create_user('EX-BUYER04')
+        self.listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type='sell',
+            crypto_amount=Decimal('100'), usdt_amount=Decimal('100'), payment_method=1,
+        )
+        self.url = reverse('p2p-listing-detail', args=[self.listing.pk])
+
+    def send(self, method, user, data=None):
+        return getattr(self.client, method)(
+            self.url, data, content_type='application/json', HTTP_X_CLIENT_TOKEN=user.client_token,
+        )
+
+    def test_only_the_seller_edits_an_active_listing(self):
+        self.assertEqual(self.send('patch', self.buyer, {'usdt_amount': '1'}).status_code, 403)
+
+        response = self.send('patch', self.seller, {'usdt_amount': '120'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['usdt_amount'], '120.00')
+
+        create_trade(self.listing, self.buyer.user_token)
+        self.assertEqual(self.send('patch', self.seller, {'usdt_amount': '90'}).status_code, 400)
+        self.assertEqual(P2PListing.objects.get(pk=self.listing.pk).usdt_amount, Decimal('120'))
+
+    def test_edit_racing_a_reservation_is_a_conflict(self):
+        load = P2PListingDetailView.get_object
+
+        def reserved_after_loading(view):
+            listing = load(view)
+            transition_listing(P2PListing.objects.get(pk=listing.pk), 'reserve')
+            return listing
+
+        with mock.patch.object(P2PListingDetailView, 'get_object', reserved_after_loading):
+            response = self.send('patch', self.seller, {'usdt_amount': '90'})
+        self.assertEqual(response.status_code, 409)
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.status, self.listing.usdt_amount), (3, Decimal('100')))
+
+    def test_listing_with_trades_is_not_deleted(self):
+        self.assertEqual(self.send('delete', self.buyer).status_code, 403)
+
+        trade = create_trade(self.listing, self.buyer.user_token)
+        transition_trade(trade, 'cancel')
+        self.assertEqual(self.send('delete', self.seller).status_code, 409)
+        self.assertTrue(P2PListing.objects.filter(pk=self.listing.pk).exists())
+
+        trade.delete()
+        self.assertEqual(self.send('delete', self.seller).status_code, 204)
+        self.assertFalse(P2PListing.objects.filter(pk=self.listing.pk).exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TradeStateMachineTests(TestCase):
+
+    def setUp(self):
+        self.buyer = create_user('EX-SMBUY01')
+        self.seller = create_user('EX-SMSEL01')
+        self.listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type='sell',
+            crypto_amount=Decimal('100'), usdt_amount=Decimal('100'), payment_method=1,
+        )
+        self.wallet = EscrowWallet.objects.create(
+            address='0x' + 'ee' * 20, user_token=self.seller.user_token, balance_commitment='0' * 64,
+        )
+        self.trade = create_trade(
+            self.listing, self.buyer.user_token, escrow_wallet_id=self.wallet.pk,
+            escrow_tx_hash='0x' + '0' * 64,
+        )
+
+    def post(self, name, user, data=None, **kwargs):
+        return self.client.post(
+            reverse(name, kwargs=kwargs), data, content_type='application/json',
+            HTTP_X_CLIENT_TOKEN=user.client_token,
+        )
+
+    def admin_action(self, action):
+        admin = P2PTradeAdmin(P2PTrade, site)
+        admin.message_user = mock.Mock()
+        getattr(admin, action)(RequestFactory().post('/'), P2PTrade.objects.filter(pk=self.trade.pk))
+        self.trade.refresh_from_db()
+        self.listing.refresh_from_db()
+        return admin.message_user
+
+    def test_trade_is_paid_only_once_its_escrow_is_funded(self):
+        self.assertEqual((self.trade.status, self.listing.status), (0, 3))
+        self.assertEqual(self.post('p2p-trade-mark-paid', self.buyer, pk=self.trade.pk).status_code, 400)
+
+        self.assertEqual(fund_trades(self.wallet), [self.trade])
+        self.assertEqual(fund_trades(self.wallet), [])
+        response = self.post('p2p-trade-mark-paid', self.buyer, pk=self.trade.pk)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(P2PTrade.objects.get(pk=self.trade.pk).status, 2)
+
+    def test_transitions_are_guarded_by_status_and_version(self):
+        with self.assertRaises(InvalidTransition):
+            transition_trade(self.trade, 'complete')
+        stale = P2PTrade.objects.get(pk=self.trade.pk)
+        transition_trade(self.trade, 'fund')
+        with self.assertRaises(TransitionConflict):
+            transition_trade(stale, 'cancel')
+
+    def test_wallet_backing_an_open_trade_cannot_be_claimed(self):
+        listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type='sell',
+            crypto_amount=Decimal('50'), usdt_amount=Decimal('50'), payment_method=1,
+        )
+        with self.assertRaises(EscrowUnavailable):
+            create_trade(listing, self.buyer.user_token, escrow_wallet_id=self.wallet.pk)
+        listing.refresh_from_db()
+        self.assertEqual(listing.status, 1)     # the reservation was rolled back
+
+        transition_trade(self.trade, 'cancel')
+        listing = P2PListing.objects.get(pk=listing.pk)
+        trade = create_trade(listing, self.buyer.user_token, escrow_wallet_id=self.wallet.pk)
+        self.assertEqual(trade.escrow_wallet_id, self.wallet.pk)
+
+    def test_listing_wallet_backing_an_open_trade_is_refused(self):
+        listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type='sell', escrow_wallet=self.wallet,
+            crypto_amount=Decimal('50'), usdt_amount=Decimal('50'), payment_method=1,
+        )
+        with self.assertRaises(EscrowUnavailable):
+            create_trade(listing, self.buyer.user_token)
+
+    def test_admin_complete_completes_the_listing(self):
+        fund_trades(self.wallet)
+        P2PTrade.objects.filter(pk=self.trade.pk).update(status=2)
+        self.admin_action('complete_trades')
+        self.assertEqual((self.trade.status, self.listing.status), (3, 4))
+
+    def test_admin_cancel_releases_the_listing(self):
+        self.admin_action('cancel_trades')
+        self.assertEqual((self.trade.status, self.listing.status), (5, 1))
+
+    def test_admin_transition_rolls_back_with_the_listing(self):
+        # the listing moved on concurrently: the trade must not be canceled alone
+        conflict = TransitionConflict('P2PListing was modified concurrently')
+        with mock.patch('apps.p2p.admin.transition_listing', side_effect=conflict):
+            message_user = self.admin_action('cancel_trades')
+        self.assertEqual((self.trade.status, self.listing.status), (0, 3))
+        self.assertIn('modified concurrently', message_user.call_args_list[0].args[1])
+
+    def test_dispute_is_rolled_back_with_a_conflicting_transition(self):
+        with mock.patch('apps.disputes.views.transition_trade', side_effect=TransitionConflict('moved')):
+            response = self.post('dispute-create', self.buyer, {'trade': str(self.trade.pk)})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(TradeDispute.objects.exists())
+
+        response = self.post('dispute-create', self.buyer, {'trade': str(self.trade.pk)})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.trade.refresh_from_db()
+        self.assertEqual(self.trade.status, 4)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SpecificUserViewTests(TestCase):
+
+    def setUp(self):
+        self.viewer = create_user('EX-VIEWER1')
+        self.seller = create_user('EX-SELLER1')
+        self.listings = [
+            P2PListing.objects.create(
+                seller_token=self.seller.user_token, crypto_type='sell',
+                crypto_amount=Decimal('100'), usdt_amount=Decimal('100') + i, payment_method=1,
+                status=5 if i == 3 else 1,
+            )
+            for i in range(5)
+        ]
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params, HTTP_X_CLIENT_TOKEN=self.viewer.client_token)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_listings_are_keyset_paginated(self):
+        page = self.get(reverse('p2p-specific-user'), {'user_id': self.seller.user_token, 'page_size': 3})
+        self.assertEqual(page['user_info']['id'], self.seller.user_token)
+        ids = [listing['id'] for listing in page['listings']['results']]
+        self.assertIsNotNone(page['listings']['next'])
+
+        page = self.get(page['listings']['next'])
+        ids += [listing['id'] for listing in page['listings']['results']]
+        self.assertIsNone(page['listings']['next'])
+
+        # newest first, without the Expired one
+        expected = [str(listing.pk) for listing in reversed(self.listings) if listing.status != 5]
+        self.assertEqual(ids, expected)
+
+    def test_defaults_to_the_current_user(self):
+        page = self.get(reverse('p2p-specific-user'))
+        self.assertEqual(page['user_info']['id'], self.viewer.user_token)
+        self.assertEqual(page['listings'], {'next': None, 'results': []})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MarketStatsTests(TestCase):
+
+    def setUp(self):
+        self.buyer = create_user('EX-STBUY01')
+        self.seller = create_user('EX-STSEL01')
+
+    def add(self, usdt_amount, payment_method=1, crypto_type='sell'):
+        listing = P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type=crypto_type,
+            crypto_amount=Decimal('100'), usdt_amount=Decimal(usdt_amount), payment_method=payment_method,
+        )
+        stats.listing_added(listing)    # what the listings_saved receiver does
+        return listing
+
+    def snapshot(self):
+        return {
+            row.market: (row.active_listings, row.total_usdt, row.min_usdt, row.max_usdt)
+            for row in P2PMarketStats.objects.filter(active_listings__gt=0)
+        }
+
+    def assert_matches_recompute(self):
+        incremental = self.snapshot()
+        stats.recompute()
+        self.assertEqual(self.snapshot(), incremental)
+        return incremental
+
+    def test_added_listings_are_counted_in_every_row(self):
+        self.add('100')
+        self.add('300')
+        self.add('50', payment_method=2, crypto_type='buy')
+
+        rows = self.assert_matches_recompute()
+        self.assertEqual(rows['sell:USD:1'], (2, Decimal('400'), Decimal('100'), Decimal('300')))
+        self.assertEqual(rows['*:*:2'], (1, Decimal('50'), Decimal('50'), Decimal('50')))
+        self.assertEqual(rows['*'], (3, Decimal('450'), Decimal('50'), Decimal('300')))
+
+    def test_reserved_extreme_is_re_aggregated(self):
+        self.add('100')
+        highest = self.add('300')
+        self.add('200')
+
+        trade = create_trade(highest, self.buyer.user_token, escrow_tx_hash='0x' + '0' * 64)
+        rows = self.assert_matches_recompute()
+        self.assertEqual(rows['*'], (2, Decimal('300'), Decimal('100'), Decimal('200')))
+        self.assertEqual(stats.volume_24h(), trade.usdt_amount)
+        self.assertEqual(P2PVolumeBucket.objects.get().trades, 1)
+
+    def test_edited_listing_moves_between_rows(self):
+        listing = self.add('100')
+        self.add('200')
+        before = P2PListing.objects.get(pk=listing.pk)
+        listing.payment_method, listing.usdt_amount = 3, Decimal('400')
+        listing.save()
+        stats.listings_changed([before], [listing])
+
+        rows = self.assert_matches_recompute()
+        self.assertEqual(rows['*:*:1'], (1, Decimal('200'), Decimal('200'), Decimal('200')))
+        self.assertEqual(rows['*:*:3'], (1, Decimal('400'), Decimal('400'), Decimal('400')))
+
+    def test_endpoint_reads_the_precomputed_rows(self):
+        self.add('100')
+        self.add('300', payment_method=2)
+        response = self.client.get(reverse('p2p-market-stats'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_active_listings'], 2)
+        self.assertEqual(Decimal(str(data['average_price'])), Decimal('200'))
+        self.assertEqual({item['payment_method'] for item in data['payment_methods_distribution']}, {1, 2})
+
+
+class ExpirySweepTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.buyer = create_user('EX-EXBUY01')
+        self.seller = create_user('EX-EXSEL01')
+
+    def listing(self, expires_in, status=1):
+        return P2PListing.objects.create(
+            seller_token=self.seller.user_token, crypto_type='sell',
+            crypto_amount=Decimal('100'), usdt_amount=Decimal('100'), payment_method=1,
+            status=status, expires_at=self.now + timedelta(hours=expires_in),
+        )
+
+    def trade(self, listing, expires_in, status=0):
+        return P2PTrade.objects.create(
+            listing=listing, buyer_token=self.buyer.user_token, seller_token=self.seller.user_token,
+            escrow_tx_hash='0x' + '0' * 64, usdt_amount=listing.usdt_amount, status=status,
+            expires_at=self.now + timedelta(hours=expires_in),
+        )
+
+    def statuses(self, *rows):
+        return [type(row).objects.get(pk=row.pk).status for row in rows]
+
+    def test_timed_out_trades_are_canceled_and_their_listings_released(self):
+        open_listing = self.listing(24, status=3)
+        lapsed_listing = self.listing(-1, status=3)    # released past its own deadline
+        paid_listing = self.listing(24, status=3)
+        created = self.trade(open_listing, -1)
+        funded = self.trade(lapsed_listing, -1, status=1)
+        paid = self.trade(paid_listing, -1, status=2)  # waiting on the seller: not timed out
+        pending = self.trade(self.listing(24, status=3), 1)
+
+        result = expiry.sweep(now=self.now)
+        self.assertEqual(result, {'trades_canceled': 2, 'listings_released': 2, 'listings_expired': 1})
+        self.assertEqual(self.statuses(created, funded, paid, pending), [5, 5, 2, 0])
+        self.assertEqual(self.statuses(open_listing, lapsed_listing, paid_listing), [1, 5, 3])
+
+    def test_listings_are_expired_in_batches(self):
+        due = [self.listing(-hours) for hours in range(1, 6)]
+        live = self.listing(1)
+        withdrawn = self.listing(-1, status=4)
+
+        self.assertEqual(expiry.sweep_listings(now=self.now, batch_size=2), 5)
+        self.assertEqual(self.statuses(*due), [5] * 5)
+        self.assertEqual(self.statuses(live, withdrawn), [1, 4])
+        self.assertEqual(expiry.sweep(now=self.now)['listings_expired'], 0)
+
+
+class OrderBookReloadTests(TestCase):
+    MARKET = orderbook.market_key('sell', 'USD', 1)
+
+    def listing(self, usdt_amount):
+        return P2PListing.objects.create(
+            seller_token='seller',
+            crypto_type='sell',
+            crypto_amount=Decimal('100'),
+            usdt_amount=Decimal(usdt_amount),
+            payment_method=1,
+        )
+
+    def slow_build(self):
+        """build_index() that holds until the test lets it finish."""
+        started, release = threading.Event(), threading.Event()
+        build = orderbook.build_index
+
+        def slow(listings):
+            listings = list(listings)   # the query runs in the reloading thread
+            started.set()
+            release.wait(5)
+            return build(listings)
+
+        return mock.patch.object(orderbook, 'build_index', slow), started, release
+
+    def test_reads_are_served_from_the_current_book_during_a_reload(self):
+        best = self.listing('99')
+        book = orderbook.OrderBook(ttl=3600)
+        self.assertEqual(book.best(self.MARKET).id, str(best.pk))
+        cheaper = self.listing('98')
+
+        patch, started, release = self.slow_build()
+        latencies, seen = [], []
+
+        def reader():
+            started.wait(5)
+            for _ in range(50):
+                began = time.perf_counter()
+                seen.append(book.best(self.MARKET).id)
+                book.search([self.MARKET], limit=5)
+                latencies.append(time.perf_counter() - began)
+            release.set()
+
+        thread = threading.Thread(target=reader)
+        with patch:
+            thread.start()
+            book.reload()
+        thread.join()
+
+        self.assertEqual(set(seen), {str(best.pk)})
+        self.assertLess(max(latencies), 0.05)
+        self.assertEqual(book.best(self.MARKET).id, str(cheaper.pk))
+
+    def test_events_received_during_a_reload_are_replayed(self):
+        kept, dropped = self.listing('99'), self.listing('97')
+        book = orderbook.OrderBook(ttl=3600)
+        book.best(self.MARKET)
+
+        patch, started, release = self.slow_build()
+        added = self.listing('95')
+
+        def events():
+            started.wait(5)
+            # the build already read these rows; the events must still win
+            book.upsert([added])
+            dropped.status = 5
+            book.upsert([dropped])
+            release.set()
+
+        thread = threading.Thread(target=events)
+        with patch:
+            thread.start()
+            book.reload()
+        thread.join()
+
+        ids = [entry.id for entry in book.top(self.MARKET, 10)]
+        self.assertEqual(ids, [str(added.pk), str(kept.pk)])
+
+    def test_stale_book_is_rebuilt_by_one_reader(self):
+        self.listing('99')
+        book = orderbook.OrderBook(ttl=0)
+        book.best(self.MARKET)
+        cheaper = self.listing('90')
+        # inside a transaction the stale reader rebuilds synchronously, seeing its writes
+        self.assertEqual(book.best(self.MARKET).id, str(cheaper.pk))
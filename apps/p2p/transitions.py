@@ -0,0 +1,164 @@
+"""
+Trade and listing state machine.
+
+Every status change is a single conditional UPDATE:
+
+    UPDATE ... SET status = <target>, version = version + 1, ...
+    WHERE id = <pk> AND status = <current> AND version = <loaded version>
+
+A row count of 0 means somebody else moved the row first, which surfaces as
+``TransitionConflict`` instead of silently overwriting their change. Only
+the columns listed in the UPDATE are written – never the whole row.
+
+The ``bulk_*`` variants move a whole batch with one UPDATE (same status and
+version guards) and report back only the rows that statement moved.
+
+Seller edits of a listing (``update_listing``) take the same guard, so an
+edit that races a reservation fails instead of writing ``status`` back.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .exceptions import InvalidTransition, TransitionConflict
+from .models import P2PListing, P2PTrade
+from .signals import listing_transitioned, trade_transitioned
+
+# name: (allowed source statuses, target status)
+TRADE_TRANSITIONS = {
+    'fund':      ((0,), 1),
+    'mark_paid': ((1,), 2),
+    'complete':  ((2, 4), 3),
+    'dispute':   ((0, 1, 2), 4),
+    'cancel':    ((0, 1, 4), 5),
+    'timeout':   ((0, 1), 5),
+}
+
+LISTING_TRANSITIONS = {
+    'reserve':  ((1,), 3),
+    'release':  ((3,), 1),
+    'complete': ((3,), 4),
+    'expire':   ((1,), 5),
+    'cancel':   ((1,), 5),   # withdrawn by the seller; leaves the market like an expiry
+}
+
+
+def _transition(instance, table, name, changes):
+    try:
+        sources, target = table[name]
+    except KeyError:
+        raise InvalidTransition(f"Unknown transition '{name}'")
+
+    previous_status = instance.status
+    if previous_status not in sources:
+        raise InvalidTransition(
+            f"Cannot {name} {type(instance).__name__} {instance.pk} "
+            f"from status {instance.get_status_display()}"
+        )
+
+    updated = type(instance).objects.filter(
+        pk=instance.pk,
+        status=previous_status,
+        version=instance.version,
+    ).update(status=target, version=F('version') + 1, **changes)
+
+    if not updated:
+        raise TransitionConflict(
+            f"{type(instance).__name__} {instance.pk} was modified concurrently"
+        )
+
+    instance.status = target
+    instance.version += 1
+    for field, value in changes.items():
+        setattr(instance, field, value)
+    return previous_status
+
+
+def _bulk_transition(model, instances, table, name, changes):
+    sources, target = table[name]
+    candidates = [instance for instance in instances if instance.status in sources]
+    if not candidates:
+        return []
+
+    guard = reduce(or_, (Q(pk=i.pk, version=i.version) for i in candidates))
+    updated = model.objects.filter(guard, status__in=sources).update(
+        status=target, version=F('version') + 1, **changes
+    )
+    if updated < len(candidates):
+        # some rows moved concurrently; keep the ones this UPDATE bumped
+        current = dict(
+            model.objects.filter(pk__in=[i.pk for i in candidates], status=target)
+            .values_list('pk', 'version')
+        )
+        candidates = [i for i in candidates if current.get(i.pk) == i.version + 1]
+
+    moved = []
+    for instance in candidates:
+        moved.append((instance, instance.status))
+        instance.status = target
+        instance.version += 1
+        for field, value in changes.items():
+            setattr(instance, field, value)
+    return moved
+
+
+def transition_trade(trade: P2PTrade, name: str, **changes) -> P2PTrade:
+    """Apply TRADE_TRANSITIONS[name] to ``trade`` (and any extra column ``changes``)."""
+    now = timezone.now()
+    changes.setdefault('updated_at', now)
+    target = TRADE_TRANSITIONS.get(name, (None, None))[1]
+    if target == 2:
+        changes.setdefault('paid_at', now)
+    elif target == 3:
+        changes.setdefault('completed_at', now)
+
+    previous_status = _transition(trade, TRADE_TRANSITIONS, name, changes)
+    trade_transitioned.send(
+        sender=P2PTrade, trade=trade, transition=name, previous_status=previous_status
+    )
+    return trade
+
+
+def transition_listing(listing: P2PListing, name: str, **changes) -> P2PListing:
+    """Apply LISTING_TRANSITIONS[name] to ``listing``."""
+    previous_status = _transition(listing, LISTING_TRANSITIONS, name, changes)
+    listing_transitioned.send(
+        sender=P2PListing, listing=listing, transition=name, previous_status=previous_status
+    )
+    return listing
+
+
+def update_listing(listing: P2PListing, **changes) -> P2PListing:
+    """Write ``changes`` to ``listing`` if it is still Active at the version loaded."""
+    if changes:
+        updated = P2PListing.objects.filter(
+            pk=listing.pk, status=1, version=listing.version,
+        ).update(**changes)
+        if not updated:
+            raise TransitionConflict(f"P2PListing {listing.pk} was modified concurrently")
+    for field, value in changes.items():
+        setattr(listing, field, value)
+    return listing
+
+
+def bulk_transition_trades(trades, name: str, **changes) -> list[P2PTrade]:
+    """Apply TRADE_TRANSITIONS[name] to every eligible trade in one UPDATE."""
+    changes.setdefault('updated_at', timezone.now())
+    moved = _bulk_transition(P2PTrade, trades, TRADE_TRANSITIONS, name, changes)
+    for trade, previous_status in moved:
+        trade_transitioned.send(
+            sender=P2PTrade, trade=trade, transition=name, previous_status=previous_status
+        )
+    return [trade for trade, _ in moved]
+
+
+def bulk_transition_listings(listings, name: str, **changes) -> list[P2PListing]:
+    """Apply LISTING_TRANSITIONS[name] to every eligible listing in one UPDATE."""
+    moved = _bulk_transition(P2PListing, listings, LISTING_TRANSITIONS, name, changes)
+    for listing, previous_status in moved:
+        listing_transitioned.send(
+            sender=P2PListing, listing=listing, transition=name, previous_status=previous_status
+        )
+    return [listing for listing, _ in moved]
@@ -8,15 +8,25 @@ from .views import (
     MarketStatsView,
     SpecificUserView,
     MarkTradeAsPaidView, 
+    OrderBookView,
+    ListingSearchView,
+    P2PListingBulkView,
+    P2PListingBulkCancelView,
+    SellerProfileView,
 )
 
 urlpatterns = [
     path('listings/', P2PListingListView.as_view(), name='p2p-listing-list'),
+    path('listings/bulk/', P2PListingBulkView.as_view(), name='p2p-listing-bulk'),
+    path('listings/bulk/cancel/', P2PListingBulkCancelView.as_view(), name='p2p-listing-bulk-cancel'),
+    path('listings/search/', ListingSearchView.as_view(), name='p2p-listing-search'),
     path('listings/<uuid:pk>/', P2PListingDetailView.as_view(), name='p2p-listing-detail'),
     path('trades/', P2PTradeCreateView.as_view(), name='p2p-trade-create'),
     path('trades/<uuid:pk>/', P2PTradeDetailView.as_view(), name='p2p-trade-detail'),
     path('trades/<uuid:pk>/mark-paid/', MarkTradeAsPaidView.as_view(), name='p2p-trade-mark-paid'),
     path('my-trades/', MyTradesListView.as_view(), name='p2p-my-trades'),
     path('market-stats/', MarketStatsView.as_view(), name='p2p-market-stats'),
+    path('order-book/', OrderBookView.as_view(), name='p2p-order-book'),
     path('specific-user/', SpecificUserView.as_view(), name='p2p-specific-user'),
+    path('sellers/<str:seller_token>/', SellerProfileView.as_view(), name='p2p-seller-profile'),
 ]
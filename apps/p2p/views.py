@@ -1,28 +1,61 @@
+import copy
+import uuid
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from .models import P2PListing, P2PTrade
-from .serializers import P2PListingSerializer, P2PTradeSerializer, P2PTradeCreateSerializer
-from django.utils import timezone
+from .exceptions import EscrowUnavailable, InvalidTransition, ListingUnavailable, TransitionConflict
+from .models import P2PListing, P2PMarketStats, P2PTrade
+from .orderbook import market_key, order_book
+from .pagination import ParticipantPagination
+from .serializers import (
+    ListingIdsSerializer,
+    ListingSearchSerializer,
+    P2PListingSerializer,
+    P2PTradeCreateSerializer,
+    P2PTradeSerializer,
+)
+from .services import create_trade
+from . import profiles, stats
+from .signals import listings_deleted, listings_saved
+from .transitions import LISTING_TRANSITIONS, bulk_transition_listings, transition_trade, update_listing
 from django.conf import settings
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import RestrictedError
 from rest_framework import serializers
-import hmac
-import hashlib
 from rest_framework.views import APIView
-from django.db.models import Avg, Count, Min, Max, Sum
 from rest_framework.permissions import IsAuthenticated
+from apps.core.pagination import KeysetPagination
 
-class P2PListingListView(generics.ListCreateAPIView):
-    """List active listings and allow authenticated users to create a listing."""
+class ViewerTokenMixin:
+    """Hand the viewer's token to the serializers once instead of per row."""
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["user_token"] = getattr(self.request.user, "user_token", None)
+        return context
+
+
+def _uuids(items):
+    """The valid UUIDs among the "id" keys of ``items``."""
+    ids = []
+    for item in items:
+        try:
+            ids.append(uuid.UUID(str(item["id"])))
+        except (TypeError, KeyError, ValueError):
+            continue
+    return ids
+
+
+class P2PListingListView(ViewerTokenMixin, generics.ListCreateAPIView):
+    """List active listings (newest first, cursor paginated) and allow authenticated users to create a listing."""
 
     serializer_class = P2PListingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return (
-            P2PListing.objects.filter(status=1, expires_at__gt=timezone.now())
-            .order_by("-created_at")
-        )
+        # Served by idx_listing_feed; overdue listings are moved to
+        # Expired by the sweep_expired command
+        return P2PListing.objects.filter(status=1).order_by("-created_at", "-id")
 
     def perform_create(self, serializer):
         # Validate required fields - UPDATED to use usdt_amount
@@ -38,176 +71,446 @@ class P2PListingListView(generics.ListCreateAPIView):
             if field not in serializer.validated_data:
                 raise serializers.ValidationError({field: "This field is required"})
 
-        # Generate seller token
-        client_token = self.request.user.client_token
-        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-        seller_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
-
         # Save with status Active
-        serializer.save(seller_token=seller_token, status=1)
+        with transaction.atomic():
+            listing = serializer.save(seller_token=self.request.user.user_token, status=1)
+            listings_saved.send(sender=P2PListing, listings=[listing], previous=None)
 
 
-class P2PListingDetailView(generics.RetrieveUpdateDestroyAPIView):
+class P2PListingDetailView(ViewerTokenMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update or delete a single listing while it is not expired."""
 
     serializer_class = P2PListingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return P2PListing.objects.filter(expires_at__gt=timezone.now())
+        return P2PListing.objects.exclude(status=5)
+
+    def update(self, request, *args, **kwargs):
+        listing = self.get_object()
+        if listing.seller_token != request.user.user_token:
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+        if listing.status != 1:
+            return Response({"detail": "Only active listings can be edited."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(listing, data=request.data, partial=kwargs.get("partial", False))
+        serializer.is_valid(raise_exception=True)
+        before = copy.copy(listing)
+        try:
+            with transaction.atomic():
+                # only the edited columns, and only if nobody reserved it meanwhile
+                update_listing(listing, **serializer.validated_data)
+                listings_saved.send(sender=P2PListing, listings=[listing], previous=[before])
+        except TransitionConflict:
+            return Response(
+                {"detail": "Listing was updated by another request, please retry."},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(serializer.data)
 
-class P2PTradeCreateView(generics.CreateAPIView):
-    """Create a new trade from an active listing."""
+    def destroy(self, request, *args, **kwargs):
+        listing = self.get_object()
+        if listing.seller_token != request.user.user_token:
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
 
-    queryset = P2PTrade.objects.all()
-    serializer_class = P2PTradeCreateSerializer
+        try:
+            with transaction.atomic():
+                deleted, _ = P2PListing.objects.filter(pk=listing.pk, version=listing.version).delete()
+                if deleted:
+                    listings_deleted.send(sender=P2PListing, listing_ids=[listing.pk], listings=[listing])
+        except RestrictedError:
+            return Response(
+                {"detail": "Listings with trades cannot be deleted, cancel them instead."},
+                status=status.HTTP_409_CONFLICT
+            )
+        if not deleted:
+            return Response(
+                {"detail": "Listing was updated by another request, please retry."},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class P2PListingBulkView(ViewerTokenMixin, generics.GenericAPIView):
+    """
+    Manage many of the caller's own listings in one request and one transaction.
+
+    POST  /api/p2p/listings/bulk/  [{listing}, ...]           -> create (one INSERT)
+    PATCH /api/p2p/listings/bulk/  [{"id": ..., fields}, ...] -> partial update (one UPDATE)
+
+    All or nothing: if any item is invalid the response is 400 with a list
+    of errors aligned with the input ({} for the valid items).
+    """
+
+    serializer_class = P2PListingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def perform_create(self, serializer):
-        listing = serializer.validated_data["listing"]
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            listings = serializer.save(seller_token=request.user.user_token, status=1)
+            listings_saved.send(sender=P2PListing, listings=listings, previous=None)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        items = request.data if isinstance(request.data, list) else []
+        with transaction.atomic():
+            listings = (
+                P2PListing.objects.select_for_update(of=("self",))
+                .filter(seller_token=request.user.user_token, pk__in=_uuids(items))
+                .exclude(status=5)
+            )
+            serializer = self.get_serializer(
+                {str(listing.pk): listing for listing in listings},
+                data=request.data,
+                many=True,
+                partial=True,
+            )
+            serializer.is_valid(raise_exception=True)
+
+            before = {pk: copy.copy(listing) for pk, listing in serializer.instance.items()}
+            listings = serializer.save()
+            listings_saved.send(
+                sender=P2PListing,
+                listings=listings,
+                previous=[before[str(listing.pk)] for listing in listings],
+            )
+        return Response(serializer.data)
 
-        # Prevent users from trading with themselves
-        client_token = self.request.user.client_token
-        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-        user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
 
-        if user_token == listing.seller_token:
-            raise serializers.ValidationError(
-                {"listing": "You cannot create a trade with your own listing"}
+class P2PListingBulkCancelView(ViewerTokenMixin, generics.GenericAPIView):
+    """
+    POST /api/p2p/listings/bulk/cancel/  {"ids": [...]}
+    Take several of the caller's Active listings off the market with one
+    UPDATE. Errors are reported per id, aligned with ``ids``; nothing is
+    canceled unless every id can be.
+    """
+
+    serializer_class = P2PListingSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        params = ListingIdsSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        ids = params.validated_data["ids"]
+        sources, _ = LISTING_TRANSITIONS["cancel"]
+
+        with transaction.atomic():
+            listings = (
+                P2PListing.objects.select_for_update(of=("self",))
+                .filter(seller_token=request.user.user_token)
+                .in_bulk(ids)
             )
+            errors = [
+                {} if pk in listings and listings[pk].status in sources
+                else {"id": ["Listing not found."] if pk not in listings else ["Only active listings can be canceled."]}
+                for pk in ids
+            ]
+            if any(errors):
+                return Response({"ids": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+            canceled = bulk_transition_listings(listings.values(), "cancel")
+            if len(canceled) < len(listings):
+                transaction.set_rollback(True)
+                return Response(
+                    {"detail": "Some listings were updated by another request, please retry."},
+                    status=status.HTTP_409_CONFLICT
+                )
 
-        # Check if listing is still active
-        if listing.status != 1 or listing.expires_at < timezone.now():
-            raise serializers.ValidationError({"listing": "This listing is not available for trading"})
+        serializer = self.get_serializer([listings[pk] for pk in ids], many=True)
+        return Response(serializer.data)
 
-        # Create and save the trade
-        trade = serializer.save(buyer_token=user_token, seller_token=listing.seller_token)
 
-        # Calculate and save fee
-        trade.calculate_fee()
-        trade.save()
+class P2PTradeCreateView(generics.CreateAPIView):
+    """Create a new trade from an active listing."""
 
-        # Mark listing as reserved
-        if listing.status == 1:
-            listing.status = 3  # Reserved
-            listing.save()
+    queryset = P2PTrade.objects.all()
+    serializer_class = P2PTradeCreateSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        try:
+            serializer.instance = create_trade(
+                data["listing"],
+                self.request.user.user_token,
+                escrow_wallet_id=data.get("escrow_wallet_id"),
+                escrow_tx_hash=data["escrow_tx_hash"],
+                payment_proof_hash=data.get("payment_proof_hash"),
+            )
+        except ListingUnavailable as e:
+            raise serializers.ValidationError({"listing": str(e)})
+        except EscrowUnavailable as e:
+            raise serializers.ValidationError({"escrow_wallet": str(e)})
 
 
-class P2PTradeDetailView(generics.RetrieveUpdateAPIView):
+class P2PTradeDetailView(ViewerTokenMixin, generics.RetrieveUpdateAPIView):
     """Retrieve or update a trade visible to either the buyer or the seller."""
 
     serializer_class = P2PTradeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        client_token = self.request.user.client_token
-        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-        user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
-        return P2PTrade.objects.filter(Q(buyer_token=user_token) | Q(seller_token=user_token))
+        user_token = self.request.user.user_token
+        return (
+            P2PTrade.objects.filter(participants__user_token=user_token)
+            .select_related("listing")
+        )
 
 
-class MyTradesListView(generics.ListAPIView):
-    """List all trades where the authenticated user is either buyer or seller."""
+class MyTradesListView(ViewerTokenMixin, generics.ListAPIView):
+    """Trades where the authenticated user is either buyer or seller, newest first and cursor paginated."""
 
     serializer_class = P2PTradeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ParticipantPagination
 
     def get_queryset(self):
-        client_token = self.request.user.client_token
-        hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-        user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
-        return (
-            P2PTrade.objects.filter(Q(buyer_token=user_token) | Q(seller_token=user_token))
-            .order_by("-created_at")
-        )
+        # One range read on idx_participant_user per page, joined to trades by pk
+        user_token = self.request.user.user_token
+        return P2PTrade.objects.filter(participants__user_token=user_token).select_related("listing")
     
 class MarketStatsView(APIView):
-    """Provides market statistics for P2P trading"""
+    """
+    Provides market statistics for P2P trading.
+
+    Reads the precomputed P2PMarketStats rows (see stats.py) by primary key
+    instead of aggregating over listings and trades on every hit.
+    """
     authentication_classes = []
     permission_classes = []
 
     def get(self, request, format=None):
-        # Get active listings
-        active_listings = P2PListing.objects.filter(
-            status=1,  # Active
-            expires_at__gt=timezone.now()
-        )
-        
-        # Calculate statistics - using usdt_amount instead of fiat_amount
-        stats = {
-            'total_active_listings': active_listings.count(),
-            'average_price': active_listings.aggregate(avg_price=Avg('usdt_amount'))['avg_price'],
-            'min_price': active_listings.aggregate(min_price=Min('usdt_amount'))['min_price'],
-            'max_price': active_listings.aggregate(max_price=Max('usdt_amount'))['max_price'],
-            'payment_methods_distribution': active_listings.values('payment_method').annotate(
-                count=Count('payment_method')
-            ).order_by('-count'),
-            'volume_24h': P2PTrade.objects.filter(
-                created_at__gte=timezone.now() - timezone.timedelta(days=1)
-            ).aggregate(total_volume=Sum('usdt_amount'))['total_volume'] or 0,
+        methods = [method for method, _ in P2PListing.PAYMENT_METHODS]
+        keys = [stats.ALL_MARKETS] + [stats.payment_method_id(method) for method in methods]
+        rows = P2PMarketStats.objects.in_bulk(keys)
+
+        if stats.ALL_MARKETS not in rows:
+            stats.recompute()
+            rows = P2PMarketStats.objects.in_bulk(keys)
+
+        overall = stats.refresh_volume(rows[stats.ALL_MARKETS])
+        distribution = [
+            {'payment_method': method, 'count': rows[key].active_listings}
+            for method, key in zip(methods, keys[1:])
+            if key in rows and rows[key].active_listings
+        ]
+        distribution.sort(key=lambda item: -item['count'])
+
+        count = overall.active_listings
+        stats_data = {
+            'total_active_listings': count,
+            'average_price': overall.total_usdt / count if count else None,
+            'min_price': overall.min_usdt,
+            'max_price': overall.max_usdt,
+            'payment_methods_distribution': distribution,
+            'volume_24h': overall.volume_24h,
         }
-        
-        return Response(stats)
+
+        return Response(stats_data)
 
 class MarkTradeAsPaidView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
         try:
-            trade = P2PTrade.objects.get(pk=kwargs['pk'])
+            trade = P2PTrade.objects.select_related('listing').get(pk=kwargs['pk'])
 
             # Check if user is the buyer
-            client_token = request.user.client_token
-            hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-            user_token = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
-
-            if trade.buyer_token != user_token:
+            if trade.buyer_token != request.user.user_token:
                 return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
 
-            if trade.status != 1:  # Must be in Funded state
+            # Update status to PaymentSent
+            try:
+                transition_trade(trade, "mark_paid")
+            except InvalidTransition:
                 return Response(
                     {"detail": "Trade must be in Funded state to mark as paid."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            except TransitionConflict:
+                return Response(
+                    {"detail": "Trade was updated by another request, please retry."},
+                    status=status.HTTP_409_CONFLICT
+                )
 
-            # Update status to PaymentSent
-            trade.status = 2
-            trade.updated_at = timezone.now()
-            trade.save()
-
-            serializer = P2PTradeSerializer(trade)
+            serializer = P2PTradeSerializer(trade, context={"user_token": request.user.user_token})
             return Response(serializer.data)
 
         except P2PTrade.DoesNotExist:
             return Response({"detail": "Trade not found."}, status=status.HTTP_404_NOT_FOUND)
         
         
-class SpecificUserView(APIView):
+class SpecificUserView(ViewerTokenMixin, generics.GenericAPIView):
     """
-    Get listings for a specific user or current user if no ID provided
+    GET /api/p2p/specific-user/?user_id=&cursor=&page_size=
+    Listings (all but Expired) of a specific user, or of the current user if
+    no ID is provided, newest first and cursor paginated
     """
+    serializer_class = P2PListingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get(self, request):
         user_id = request.query_params.get('user_id')
         
         # If no user_id provided, get current user's token
         if not user_id:
-            client_token = request.user.client_token
-            hmac_key = settings.XUSDT_SETTINGS["USER_TOKEN_HMAC_KEY"].encode()
-            user_id = hmac.new(hmac_key, client_token.encode(), hashlib.sha256).hexdigest()
-
-        listings = P2PListing.objects.filter(
-            seller_token=user_id,
-            expires_at__gt=timezone.now()
-        ).order_by('-created_at')
+            user_id = request.user.user_token
 
-        serializer = P2PListingSerializer(listings, many=True)
+        listings = self.paginate_queryset(
+            P2PListing.objects.filter(seller_token=user_id).exclude(status=5)
+        )
+        serializer = self.get_serializer(listings, many=True)
         return Response({
-            "listings": serializer.data,
+            "listings": {
+                "next": self.paginator.get_next_link(),
+                "results": serializer.data,
+            },
             "user_info": {
                 "id": user_id,
-                # Add other user info if available
+                **profiles.seller_profile(user_id),
             }
-        })
\ No newline at end of file
+        })
+
+
+class SellerProfileView(ViewerTokenMixin, generics.GenericAPIView):
+    """
+    GET /api/p2p/sellers/<seller_token>/?cursor=&page_size=
+    A seller's cached trade aggregates (see profiles.py) plus their Active
+    listings, newest first and cursor paginated on idx_listing_seller_feed.
+    """
+
+    serializer_class = P2PListingSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get(self, request, seller_token):
+        listings = self.paginate_queryset(
+            P2PListing.objects.filter(seller_token=seller_token, status=1)
+        )
+        serializer = self.get_serializer(listings, many=True)
+        return Response({
+            "seller": profiles.seller_profile(seller_token),
+            "listings": {
+                "next": self.paginator.get_next_link(),
+                "results": serializer.data,
+            },
+        })
+
+
+class OrderBookView(APIView):
+    """
+    GET /api/p2p/order-book/?crypto_type=&fiat_currency=&payment_method=
+    Best price, price-level depth and the top listings of one market,
+    served from the in-memory order book.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            market = market_key(
+                params["crypto_type"],
+                params.get("fiat_currency", "USD"),
+                params["payment_method"],
+            )
+            levels = min(int(params.get("levels", 20)), 100)
+            limit = min(int(params.get("limit", 20)), 100)
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "crypto_type and a numeric payment_method are required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        viewer = request.user.user_token
+        best = order_book.best(market)
+        return Response({
+            "market": {
+                "crypto_type": market[0],
+                "fiat_currency": market[1],
+                "payment_method": market[2],
+            },
+            "best_price": str(best.price) if best else None,
+            "depth": [
+                {"price": str(level["price"]), "crypto_amount": str(level["crypto_amount"]), "listings": level["listings"]}
+                for level in order_book.depth(market, levels)
+            ],
+            "listings": [entry.as_dict(viewer) for entry in order_book.top(market, limit)],
+        })
+
+
+class ListingSearchView(APIView):
+    """
+    GET /api/p2p/listings/search/?crypto_type=&fiat_currency=&payment_method=
+        &min_usdt_amount=&max_usdt_amount=&min_crypto_amount=&max_crypto_amount=
+        &sort=price|-price&limit=&offset=
+    Active listings sorted by implied price, plus facet counts per payment
+    method and fiat currency. Served from the in-memory order book: each
+    market partition is pre-sorted by price and its size is the facet count.
+    Facets honour the other market filters but not the amount ranges.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    RANGES = {
+        "usdt_amount": ("min_usdt_amount", "max_usdt_amount"),
+        "crypto_amount": ("min_crypto_amount", "max_crypto_amount"),
+    }
+
+    def get(self, request):
+        params = ListingSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+
+        crypto_type = query.get("crypto_type")
+        fiat_currency = query.get("fiat_currency")
+        payment_method = query.get("payment_method")
+
+        def matches(market, skip=None):
+            return (
+                (crypto_type is None or market[0] == crypto_type)
+                and (skip == "fiat_currency" or fiat_currency is None or market[1] == fiat_currency)
+                and (skip == "payment_method" or payment_method is None or market[2] == payment_method)
+            )
+
+        sizes = order_book.market_sizes()
+        markets = [market for market in sizes if matches(market)]
+
+        ranges = {
+            field: (query.get(low), query.get(high))
+            for field, (low, high) in self.RANGES.items()
+        }
+        sort = query.get("sort") or ("-price" if crypto_type == "buy" else "price")
+        limit, offset = query["limit"], query["offset"]
+        entries = order_book.search(
+            markets,
+            ascending=sort == "price",
+            ranges=ranges,
+            limit=limit + 1,
+            offset=offset,
+        )
+
+        payment_methods, currencies = {}, {}
+        for market, size in sizes.items():
+            if matches(market, skip="payment_method"):
+                payment_methods[market[2]] = payment_methods.get(market[2], 0) + size
+            if matches(market, skip="fiat_currency"):
+                currencies[market[1]] = currencies.get(market[1], 0) + size
+
+        viewer = request.user.user_token
+        return Response({
+            "results": [entry.as_dict(viewer) for entry in entries[:limit]],
+            "next_offset": offset + limit if len(entries) > limit else None,
+            "facets": {
+                "payment_method": [
+                    {"payment_method": method, "count": count}
+                    for method, count in sorted(payment_methods.items(), key=lambda i: -i[1])
+                ],
+                "fiat_currency": [
+                    {"fiat_currency": currency, "count": count}
+                    for currency, count in sorted(currencies.items(), key=lambda i: -i[1])
+                ],
+            },
+        })
+
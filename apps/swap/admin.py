@@ -4,7 +4,7 @@ from django.utils import timezone
 from .models import (
     SwapToken, SwapRoute, SwapQuote,
     SwapTransaction, SwapAllowance,
-    SwapPrice, MarketStats
+    SwapPrice, SwapCandle, MarketStats
 )
 
 @admin.register(SwapToken)
@@ -53,8 +53,8 @@ class SwapTransactionAdmin(admin.ModelAdmin):
         'to_address_short', 'created_at', 'execution_time'
     )
     list_filter = ('status', 'quote__token_in__network')
-    search_fields = ('from_address', 'to_address', 'tx_hash')
-    readonly_fields = ('id', 'created_at', 'executed_at', 'completed_at')
+    search_fields = ('from_address', 'to_address', 'tx_hash', 'deposit_tx_hash', 'refund_tx_hash')
+    readonly_fields = ('id', 'created_at', 'executed_at', 'completed_at', 'nonce', 'signed_tx', 'amount_received')
     date_hierarchy = 'created_at'
     actions = ['mark_as_completed']
 
@@ -107,6 +107,16 @@ class SwapPriceAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('token')
 
+@admin.register(SwapCandle)
+class SwapCandleAdmin(admin.ModelAdmin):
+    list_display = ('token', 'interval', 'open_time', 'open', 'high', 'low', 'close', 'ticks')
+    list_filter = ('interval', 'token__network')
+    search_fields = ('token__symbol',)
+    date_hierarchy = 'open_time'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('token')
+
 @admin.register(MarketStats)
 class MarketStatsAdmin(admin.ModelAdmin):
     list_display = ('token_pair', 'volume_24h', 'change_24h', 'last_updated')
@@ -0,0 +1,189 @@
+"""
+On-chain ERC-20 allowances for SwapAllowance.
+
+``read_allowances()`` reads ``allowance(owner, spender)`` for any number of
+(token, owner, spender) tuples through Multicall3's ``aggregate3``. It makes
+one eth_call per ``MULTICALL_BATCH_SIZE`` tuples, all pinned to the same
+block. Results are cached per block, so every request within a block shares
+one read. A failed call (a non-ERC-20 token, say) comes back as None and
+does not fail the batch. Addresses are checked before anything is sent: a
+malformed one raises InvalidAddress, only chain failures raise
+AllowanceUnavailable.
+
+``refresh()`` brings SwapAllowance rows up to date in bulk. The allowance
+view uses it for the caller's stale rows, and the ``refresh_allowances``
+command for the whole table.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from eth_abi import decode, encode
+from eth_abi.exceptions import DecodingError
+from web3 import Web3
+from web3.exceptions import Web3Exception
+
+from .exceptions import AllowanceUnavailable, InvalidAddress
+from .models import SwapAllowance
+
+logger = logging.getLogger(__name__)
+
+MULTICALL_BATCH_SIZE = 200
+CACHE_TIMEOUT = 60                      # a block's results are only reused within the block
+ALLOWANCE_SELECTOR = Web3.keccak(text='allowance(address,address)')[:4]
+# SwapAllowance.allowance_amount is DECIMAL(30, 18): unlimited approvals are stored as this
+MAX_AMOUNT = Decimal('999999999999')
+
+MULTICALL3_ABI = [{
+    'name': 'aggregate3',
+    'type': 'function',
+    'stateMutability': 'payable',
+    'inputs': [{
+        'name': 'calls', 'type': 'tuple[]',
+        'components': [
+            {'name': 'target', 'type': 'address'},
+            {'name': 'allowFailure', 'type': 'bool'},
+            {'name': 'callData', 'type': 'bytes'},
+        ],
+    }],
+    'outputs': [{
+        'name': 'returnData', 'type': 'tuple[]',
+        'components': [
+            {'name': 'success', 'type': 'bool'},
+            {'name': 'returnData', 'type': 'bytes'},
+        ],
+    }],
+}]
+
+w3 = Web3(Web3.HTTPProvider(settings.WEB3_RPC_URL))
+multicall = w3.eth.contract(
+    address=Web3.to_checksum_address(settings.XUSDT_SETTINGS['MULTICALL3_ADDRESS']),
+    abi=MULTICALL3_ABI,
+)
+
+
+def cache_key(block: int, token: str, owner: str, spender: str) -> str:
+    return f"swap:allowance:{block}:{token}:{owner}:{spender}".lower()
+
+
+def valid_key(key) -> bool:
+    """Whether token, owner and spender of ``key`` are all well-formed addresses."""
+    return all(isinstance(address, str) and address.startswith('0x') and Web3.is_address(address) for address in key)
+
+
+def read_allowances(keys, block=None) -> tuple[int, dict]:
+    """
+    (block, {(token, owner, spender): raw allowance or None}) for ``keys``,
+    read at ``block`` (default: the latest). Raises InvalidAddress or
+    AllowanceUnavailable.
+    """
+    keys = list(dict.fromkeys(keys))
+    for key in keys:
+        if not valid_key(key):
+            raise InvalidAddress(f"Invalid address in {key}")
+    try:
+        if block is None:
+            block = w3.eth.block_number
+        cached = cache.get_many([cache_key(block, *key) for key in keys])
+        values = {key: cached[cache_key(block, *key)] for key in keys if cache_key(block, *key) in cached}
+        missing = [key for key in keys if key not in values]
+
+        for start in range(0, len(missing), MULTICALL_BATCH_SIZE):
+            batch = missing[start:start + MULTICALL_BATCH_SIZE]
+            calls = [
+                (
+                    Web3.to_checksum_address(token), True,
+                    ALLOWANCE_SELECTOR + encode(
+                        ['address', 'address'],
+                        [Web3.to_checksum_address(owner), Web3.to_checksum_address(spender)],
+                    ),
+                )
+                for token, owner, spender in batch
+            ]
+            results = multicall.functions.aggregate3(calls).call(block_identifier=block)
+            read = {}
+            for key, (success, data) in zip(batch, results):
+                read[key] = decode(['uint256'], data)[0] if success and len(data) >= 32 else None
+            cache.set_many({cache_key(block, *key): value for key, value in read.items()}, CACHE_TIMEOUT)
+            values.update(read)
+    except (Web3Exception, DecodingError, OSError) as e:
+        # OSError covers the provider's connection errors and timeouts
+        raise AllowanceUnavailable(f"Failed to read allowances: {e}")
+    return block, values
+
+
+def to_amount(raw: int, decimals: int) -> Decimal:
+    return min(Decimal(raw) / Decimal(10 ** decimals), MAX_AMOUNT)
+
+
+def _key(allowance: SwapAllowance):
+    return (allowance.token.contract_address, allowance.owner_address, allowance.contract_address)
+
+
+def refresh(allowances) -> int:
+    """
+    Read ``allowances`` (SwapAllowance rows with their token) on-chain in
+    one batch and bulk-update the ones that could be read. Returns that count.
+    """
+    allowances = [a for a in allowances if a.owner_address and valid_key(_key(a))]
+    if not allowances:
+        return 0
+    block, values = read_allowances([_key(a) for a in allowances])
+    now = timezone.now()
+    updated = []
+    for allowance in allowances:
+        raw = values.get(_key(allowance))
+        if raw is None:
+            continue
+        allowance.allowance_amount = to_amount(raw, allowance.token.decimals)
+        allowance.block_number = block
+        allowance.last_updated = now
+        updated.append(allowance)
+    SwapAllowance.objects.bulk_update(updated, ['allowance_amount', 'block_number', 'last_updated'])
+    return len(updated)
+
+
+def _max_age(max_age=None) -> timedelta:
+    if max_age is None:
+        max_age = settings.XUSDT_SETTINGS['SWAP_ALLOWANCE_MAX_AGE_SECONDS']
+    return timedelta(seconds=max_age)
+
+
+def is_stale(allowance: SwapAllowance, max_age=None) -> bool:
+    return bool(
+        allowance.owner_address
+        and allowance.token.contract_address
+        and allowance.last_updated < timezone.now() - _max_age(max_age)
+    )
+
+
+def stale(queryset=None, max_age=None):
+    """Rows with an owner address whose on-chain read is older than ``max_age`` seconds."""
+    queryset = SwapAllowance.objects.all() if queryset is None else queryset
+    return (
+        queryset.exclude(owner_address='')
+        .exclude(token__contract_address__isnull=True)
+        .exclude(token__contract_address='')
+        .filter(last_updated__lt=timezone.now() - _max_age(max_age))
+        .select_related('token')
+    )
+
+
+def refresh_stale(max_age=None, batch_size=MULTICALL_BATCH_SIZE * 5) -> int:
+    """Refresh every stale row, ``batch_size`` rows (one block read) at a time."""
+    refreshed = 0
+    last = 0
+    while True:
+        batch = list(stale(max_age=max_age).filter(pk__gt=last).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        refreshed += refresh(batch)
+        last = batch[-1].pk
+        if len(batch) < batch_size:
+            break
+    if refreshed:
+        logger.info("Refreshed %s allowances from the chain", refreshed)
+    return refreshed
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SwapConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.swap'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
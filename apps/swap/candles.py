@@ -0,0 +1,180 @@
+"""
+OHLC candle rollups of SwapPrice.
+
+``rollup()`` folds the price ticks written since the last run into 1m, 5m,
+1h and 1d candles. Progress is kept in a SwapRollupWatermark row: the
+highest SwapPrice id already folded. Each batch reads the next ticks after
+it, merges them into the candles they fall in (one query per interval for
+the candles that already exist, then one bulk_update and one bulk_create),
+and moves the watermark in the same transaction. A run costs the same
+however long the history is, and two runs cannot fold a tick twice.
+
+Ticks are folded in id order, which is the order ingest() writes them in:
+the first tick of a candle is its open and the latest is its close.
+
+A tick can commit after a higher id has been folded, so each run re-reads
+the last ``ROLLUP_ID_LAG`` ids below the watermark and skips the ones listed
+in its ``folded_ids``. Such a late tick widens its candle's high/low and
+tick count but leaves the stored close alone.
+
+``apply_retention()`` keeps the raw table small once the candles hold the
+history:
+
+* rolled-up ticks older than ``SWAP_PRICE_RAW_RETENTION_DAYS`` are thinned
+  to the last tick per token and hour;
+* candles of the intervals listed in ``SWAP_CANDLE_RETENTION_DAYS`` are
+  dropped past their age. The 1h and 1d candles are kept.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from apps.core.compaction import compact
+from .models import SwapCandle, SwapPrice, SwapRollupWatermark
+
+# Candle interval -> length in seconds. Candles are aligned to the epoch (UTC).
+INTERVALS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+WATERMARK = 'candles'
+DEFAULT_BATCH_SIZE = 5000
+# Ticks may commit after a higher id: runs re-read this many ids back
+ROLLUP_ID_LAG = 500
+
+
+def _bucket(epoch: int, seconds: int) -> datetime:
+    return datetime.fromtimestamp(epoch - epoch % seconds, dt_timezone.utc)
+
+
+# --------------------------------------------------------------------------- #
+# Rollup                                                                      #
+# --------------------------------------------------------------------------- #
+
+def _fold(ticks, last_id=0) -> dict:
+    """{(token_id, interval, open_time): [open, high, low, close, ticks, closes]} of ``ticks``.
+
+    ``closes`` is false while only late ticks (id <= ``last_id``) fell in the
+    candle: their close must not replace a stored one.
+    """
+    candles = {}
+    for price_id, token_id, price, at in ticks:
+        epoch = int(at.timestamp())
+        closes = price_id > last_id
+        for interval, seconds in INTERVALS.items():
+            key = (token_id, interval, _bucket(epoch, seconds))
+            candle = candles.get(key)
+            if candle is None:
+                candles[key] = [price, price, price, price, 1, closes]
+            else:
+                candle[1] = max(candle[1], price)
+                candle[2] = min(candle[2], price)
+                candle[3] = price
+                candle[4] += 1
+                candle[5] = candle[5] or closes
+    return candles
+
+
+def _merge(candles: dict) -> None:
+    """Write folded candles, extending the ones already stored."""
+    existing = {}
+    for interval in INTERVALS:
+        keys = [key for key in candles if key[1] == interval]
+        if not keys:
+            continue
+        stored = SwapCandle.objects.filter(
+            interval=interval,
+            token_id__in={key[0] for key in keys},
+            open_time__gte=min(key[2] for key in keys),
+            open_time__lte=max(key[2] for key in keys),
+        )
+        existing.update({(c.token_id, c.interval, c.open_time): c for c in stored})
+
+    updated, created = [], []
+    for key, (open_, high, low, close, ticks, closes) in candles.items():
+        candle = existing.get(key)
+        if candle is None:
+            token_id, interval, open_time = key
+            created.append(SwapCandle(
+                token_id=token_id, interval=interval, open_time=open_time,
+                open=open_, high=high, low=low, close=close, ticks=ticks,
+            ))
+        else:
+            candle.high = max(candle.high, high)
+            candle.low = min(candle.low, low)
+            if closes:
+                candle.close = close
+            candle.ticks += ticks
+            updated.append(candle)
+
+    SwapCandle.objects.bulk_update(updated, ['high', 'low', 'close', 'ticks'])
+    SwapCandle.objects.bulk_create(created)
+
+
+def rollup(batch_size=DEFAULT_BATCH_SIZE) -> int:
+    """Fold the ticks written since the last run into candles. Returns the ticks folded."""
+    folded = 0
+    after = 0
+    while True:
+        with transaction.atomic():
+            # the locked watermark row serializes concurrent runs
+            mark, _ = SwapRollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            after = max(after, mark.last_id - ROLLUP_ID_LAG)
+            rows = list(
+                SwapPrice.objects.filter(id__gt=after)
+                .order_by('id')
+                .values_list('id', 'token_id', 'price_usd', 'timestamp')[:batch_size]
+            )
+            if not rows:
+                break
+            seen = set(mark.folded_ids)
+            ticks = [tick for tick in rows if tick[0] not in seen]
+            if ticks:
+                _merge(_fold(ticks, mark.last_id))
+                mark.last_id = max(mark.last_id, rows[-1][0])
+                # only ids inside the next run's overlap can be read twice
+                horizon = mark.last_id - ROLLUP_ID_LAG
+                mark.folded_ids = sorted(i for i in seen.union(tick[0] for tick in ticks) if i > horizon)
+                mark.save(update_fields=['last_id', 'folded_ids', 'updated_at'])
+            after = rows[-1][0]
+        folded += len(ticks)
+        if len(rows) < batch_size:
+            break
+    return folded
+
+
+# --------------------------------------------------------------------------- #
+# Retention                                                                   #
+# --------------------------------------------------------------------------- #
+
+def thinnable_ticks(before, upto_id):
+    """Rolled-up ticks older than ``before`` that are not the last of their token and hour."""
+    later = SwapPrice.objects.annotate(hour=TruncHour('timestamp')).filter(
+        token_id=OuterRef('token_id'),
+        hour=OuterRef('hour'),
+        id__gt=OuterRef('pk'),
+    )
+    return (
+        SwapPrice.objects.filter(timestamp__lt=before, id__lte=upto_id)
+        .annotate(hour=TruncHour('timestamp'))
+        .filter(Exists(later))
+    )
+
+
+def apply_retention(now=None, batch_size=DEFAULT_BATCH_SIZE) -> dict:
+    now = now or timezone.now()
+    mark = SwapRollupWatermark.objects.filter(name=WATERMARK).first()
+    thinned = 0
+    if mark is not None:
+        raw_days = settings.XUSDT_SETTINGS['SWAP_PRICE_RAW_RETENTION_DAYS']
+        thinned = compact(thinnable_ticks(now - timedelta(days=raw_days), mark.last_id), batch_size)
+
+    expired = 0
+    for interval, days in settings.XUSDT_SETTINGS['SWAP_CANDLE_RETENTION_DAYS'].items():
+        expired += compact(
+            SwapCandle.objects.filter(interval=interval, open_time__lt=now - timedelta(days=days)),
+            batch_size,
+        )
+    return {'ticks_thinned': thinned, 'candles_expired': expired}
@@ -0,0 +1,7 @@
+"""
+Swap token and route catalog responses, invalidated by the SwapToken and
+SwapRoute receivers (see apps.core.catalog).
+"""
+from apps.core.catalog import Catalog
+
+catalog = Catalog('swap')
@@ -0,0 +1,31 @@
+class SwapError(Exception):
+    """Base exception for swap-related errors"""
+    pass
+
+class PriceUnavailable(SwapError):
+    """Raised when no price has been ingested for a token"""
+    pass
+
+class StalePrice(PriceUnavailable):
+    """Raised when the latest price of a token is older than the allowed age"""
+    pass
+
+class AllowanceUnavailable(SwapError):
+    """Raised when allowances cannot be read from the chain"""
+    pass
+
+class InvalidAddress(SwapError):
+    """Raised when an address to read on-chain is malformed"""
+    pass
+
+class ExecutionError(SwapError):
+    """Raised when a swap (or its refund) cannot be turned into a transaction"""
+    pass
+
+class ChainUnavailable(SwapError):
+    """Raised when the chain backend cannot be reached; the work is retried"""
+    pass
+
+class NonceConflict(ChainUnavailable):
+    """Raised when a transaction's nonce was already used by another transaction"""
+    pass
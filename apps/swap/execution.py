@@ -0,0 +1,608 @@
+"""
+Asynchronous swap execution.
+
+ExecuteSwapView only queues a swap. ``execute_swaps`` workers run a
+``SwapExecutor``, which moves it on:
+
+    queued -> collecting -> collected -> submitted -> completed
+
+A swap fails from any of these steps. Once its funds were collected, a
+failed swap goes on to refunding -> refunded (or refund_failed).
+
+The executor never pays out before it holds the user's funds:
+
+* collecting: the executor's hot wallet pulls the quote's ``amount_in`` of
+  token_in from ``from_address`` with ``transferFrom``. The user must have
+  approved the executor address for it. Swaps whose on-chain allowance or
+  balance is short fail here without a transaction;
+* submitted: once the pull is mined, ``amount_out`` of token_out is paid
+  to ``to_address``;
+* refunding: a swap that fails after its funds were collected sends
+  ``amount_received`` (what the pull moved) back to ``from_address``. A
+  swap whose pull never succeeded has nothing to refund.
+
+Each transaction is signed and stored, with its nonce, in the same database
+transaction that claims the swap and takes the nonce from the locked
+SwapExecutorNonce row. It is broadcast only after that commit. A crash or an
+RPC error after the commit is recovered by broadcasting the stored bytes
+again (same hash), so a swap is never paid twice and no nonce is skipped.
+Receipts of all outstanding transactions are fetched in one JSON-RPC batch
+per pass. Settled swaps are written with one bulk_update, which sends no
+post_save, so the executor pushes their new status to the event stream
+itself.
+
+Backends (``SWAP_EXECUTION_BACKEND``):
+
+* ``Web3Backend`` signs with ``SWAP_EXECUTOR_PRIVATE_KEY`` and talks to
+  ``WEB3_RPC_URL``: a node, or a local EVM such as anvil or hardhat;
+* ``LocalChainBackend`` is an in-process stand-in with node-like nonce,
+  balance, allowance and receipt rules, for tests and development.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from decimal import ROUND_DOWN, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from eth_account import Account
+from web3 import Web3
+
+from apps.core import events
+from .exceptions import ChainUnavailable, ExecutionError, NonceConflict
+from .models import SwapExecutorNonce, SwapTransaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+GAS_LIMIT = 100000
+REBROADCAST_SECONDS = 30        # an unmined transaction is sent again after this long
+ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+ERC20_ABI = [
+    {
+        'name': 'transfer',
+        'type': 'function',
+        'stateMutability': 'nonpayable',
+        'inputs': [
+            {'name': 'to', 'type': 'address'},
+            {'name': 'amount', 'type': 'uint256'},
+        ],
+        'outputs': [{'name': '', 'type': 'bool'}],
+    },
+    {
+        'name': 'transferFrom',
+        'type': 'function',
+        'stateMutability': 'nonpayable',
+        'inputs': [
+            {'name': 'from', 'type': 'address'},
+            {'name': 'to', 'type': 'address'},
+            {'name': 'amount', 'type': 'uint256'},
+        ],
+        'outputs': [{'name': '', 'type': 'bool'}],
+    },
+    {
+        'name': 'allowance',
+        'type': 'function',
+        'stateMutability': 'view',
+        'inputs': [
+            {'name': 'owner', 'type': 'address'},
+            {'name': 'spender', 'type': 'address'},
+        ],
+        'outputs': [{'name': '', 'type': 'uint256'}],
+    },
+    {
+        'name': 'balanceOf',
+        'type': 'function',
+        'stateMutability': 'view',
+        'inputs': [{'name': 'owner', 'type': 'address'}],
+        'outputs': [{'name': '', 'type': 'uint256'}],
+    },
+]
+
+
+def to_units(amount: Decimal, decimals: int) -> int:
+    return int((amount * 10 ** decimals).to_integral_value(rounding=ROUND_DOWN))
+
+
+def from_units(units: int, decimals: int) -> Decimal:
+    return Decimal(units) / Decimal(10 ** decimals)
+
+
+def _check_addresses(*addresses) -> None:
+    for address in addresses:
+        if not ADDRESS_RE.match(address or ''):
+            raise ExecutionError(f"Invalid address {address!r}")
+
+
+# --------------------------------------------------------------------------- #
+# Backends                                                                    #
+# --------------------------------------------------------------------------- #
+
+class ChainBackend:
+    """
+    Signs ERC-20 transfers from one hot wallet (``address``), broadcasts them
+    and reads receipts.
+    """
+    address = None
+
+    def pending_nonce(self) -> int:
+        raise NotImplementedError
+
+    def spendable(self, token_address: str, owner: str) -> int:
+        """What ``transferFrom(owner, ...)`` can move: min(balance, allowance to ``address``)."""
+        raise NotImplementedError
+
+    def sign_transfer(self, token_address: str, to: str, amount: int, nonce: int, owner=None) -> tuple[str, str]:
+        """
+        (tx hash, signed raw transaction) of ``transfer(to, amount)``, or of
+        ``transferFrom(owner, to, amount)`` when ``owner`` is given. Raises
+        ExecutionError for a transfer that cannot be built.
+        """
+        raise NotImplementedError
+
+    def broadcast(self, raw_tx: str) -> None:
+        """
+        Send a signed transaction. Sending one the chain already has is not an
+        error. Raises NonceConflict if its nonce was taken by another one.
+        """
+        raise NotImplementedError
+
+    def receipts(self, tx_hashes) -> dict:
+        """{tx hash: True (succeeded), False (reverted) or None (not mined yet)}"""
+        raise NotImplementedError
+
+
+class Web3Backend(ChainBackend):
+    def __init__(self, private_key=None, rpc_url=None):
+        private_key = private_key or settings.XUSDT_SETTINGS['SWAP_EXECUTOR_PRIVATE_KEY']
+        if not private_key:
+            raise ExecutionError("SWAP_EXECUTOR_PRIVATE_KEY is not set")
+        self.w3 = Web3(Web3.HTTPProvider(rpc_url or settings.WEB3_RPC_URL))
+        self.account = Account.from_key(private_key)
+        self.address = self.account.address
+        self._chain_id = None
+
+    def _token(self, token_address):
+        return self.w3.eth.contract(address=Web3.to_checksum_address(token_address), abi=ERC20_ABI)
+
+    def pending_nonce(self) -> int:
+        try:
+            return self.w3.eth.get_transaction_count(self.address, 'pending')
+        except Exception as e:
+            raise ChainUnavailable(f"Failed to read the executor nonce: {e}")
+
+    def spendable(self, token_address, owner):
+        _check_addresses(token_address, owner)
+        token = self._token(token_address)
+        owner = Web3.to_checksum_address(owner)
+        try:
+            block = self.w3.eth.block_number
+            balance = token.functions.balanceOf(owner).call(block_identifier=block)
+            allowance = token.functions.allowance(owner, self.address).call(block_identifier=block)
+        except Exception as e:
+            raise ChainUnavailable(f"Failed to read the allowance of {owner}: {e}")
+        return min(balance, allowance)
+
+    def sign_transfer(self, token_address, to, amount, nonce, owner=None):
+        _check_addresses(token_address, to, *([owner] if owner else []))
+        try:
+            if self._chain_id is None:
+                self._chain_id = self.w3.eth.chain_id
+            functions = self._token(token_address).functions
+            if owner:
+                call = functions.transferFrom(Web3.to_checksum_address(owner), Web3.to_checksum_address(to), amount)
+            else:
+                call = functions.transfer(Web3.to_checksum_address(to), amount)
+            tx = call.build_transaction({
+                'from': self.address,
+                'nonce': nonce,
+                'gas': GAS_LIMIT,
+                'gasPrice': self.w3.eth.gas_price,
+                'chainId': self._chain_id,
+            })
+        except Exception as e:
+            raise ChainUnavailable(f"Failed to build the transfer: {e}")
+        signed = self.account.sign_transaction(tx)
+        return signed.hash.to_0x_hex(), signed.raw_transaction.to_0x_hex()
+
+    def broadcast(self, raw_tx):
+        try:
+            self.w3.eth.send_raw_transaction(raw_tx)
+        except Exception as e:
+            message = str(e).lower()
+            if 'already known' in message or 'known transaction' in message:
+                return
+            if 'nonce too low' in message:
+                raise NonceConflict(str(e))
+            raise ChainUnavailable(f"Failed to broadcast: {e}")
+
+    def receipts(self, tx_hashes):
+        tx_hashes = list(tx_hashes)
+        if not tx_hashes:
+            return {}
+        try:
+            responses = self.w3.provider.make_batch_request(
+                [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes]
+            )
+        except Exception as e:
+            raise ChainUnavailable(f"Failed to read receipts: {e}")
+        results = {}
+        for tx_hash, response in zip(tx_hashes, responses):
+            if response.get('error'):
+                raise ChainUnavailable(f"Failed to read receipt {tx_hash}: {response['error']}")
+            receipt = response.get('result')
+            results[tx_hash] = None if receipt is None else int(receipt['status'], 16) == 1
+        return results
+
+
+class LocalChain:
+    """
+    In-process stand-in for an EVM node holding ERC-20 balances and
+    allowances. Transactions from one sender are mined in nonce order; a
+    transfer larger than the source's balance (or, for transferFrom, the
+    sender's allowance) is mined as reverted.
+    """
+    def __init__(self, automine=True):
+        self.automine = automine
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.balances = defaultdict(int)     # (token, address) -> units
+        self.allowances = defaultdict(int)   # (token, owner, spender) -> units
+        self.nonces = defaultdict(int)       # address -> next nonce to mine
+        self.mempool = {}                    # tx hash -> tx
+        self.mined = {}                      # tx hash -> succeeded
+        self.block_number = 0
+
+    def mint(self, token: str, address: str, amount: int) -> None:
+        with self._lock:
+            self.balances[(token.lower(), address.lower())] += amount
+
+    def approve(self, token: str, owner: str, spender: str, amount: int) -> None:
+        with self._lock:
+            self.allowances[(token.lower(), owner.lower(), spender.lower())] = amount
+
+    def balance_of(self, token: str, address: str) -> int:
+        return self.balances[(token.lower(), address.lower())]
+
+    def allowance(self, token: str, owner: str, spender: str) -> int:
+        return self.allowances[(token.lower(), owner.lower(), spender.lower())]
+
+    def pending_nonce(self, address: str) -> int:
+        address = address.lower()
+        with self._lock:
+            nonce = self.nonces[address]
+            queued = {tx['nonce'] for tx in self.mempool.values() if tx['from'] == address}
+            while nonce in queued:
+                nonce += 1
+            return nonce
+
+    def send(self, raw_tx: str) -> str:
+        tx_hash = '0x' + hashlib.sha256(raw_tx.encode()).hexdigest()
+        tx = json.loads(raw_tx)
+        with self._lock:
+            if tx_hash in self.mined or tx_hash in self.mempool:
+                return tx_hash
+            if tx['nonce'] < self.nonces[tx['from']]:
+                raise NonceConflict(f"nonce too low: {tx['nonce']} < {self.nonces[tx['from']]}")
+            self.mempool[tx_hash] = tx
+        if self.automine:
+            self.mine()
+        return tx_hash
+
+    def _execute(self, tx) -> bool:
+        owner = tx.get('owner') or tx['from']
+        source = (tx['token'], owner)
+        approval = (tx['token'], owner, tx['from'])
+        if self.balances[source] < tx['amount']:
+            return False
+        if tx.get('owner'):
+            if self.allowances[approval] < tx['amount']:
+                return False
+            self.allowances[approval] -= tx['amount']
+        self.balances[source] -= tx['amount']
+        self.balances[(tx['token'], tx['to'])] += tx['amount']
+        return True
+
+    def mine(self) -> int:
+        """Mine every executable transaction into one block. Returns how many."""
+        with self._lock:
+            mined = 0
+            progress = True
+            while progress:
+                progress = False
+                for tx_hash, tx in list(self.mempool.items()):
+                    if tx['nonce'] != self.nonces[tx['from']]:
+                        continue
+                    self.mined[tx_hash] = self._execute(tx)
+                    self.nonces[tx['from']] += 1
+                    del self.mempool[tx_hash]
+                    mined += 1
+                    progress = True
+            if mined:
+                self.block_number += 1
+            return mined
+
+
+local_chain = LocalChain()
+
+LOCAL_EXECUTOR_ADDRESS = '0x' + 'e0' * 20
+
+
+class LocalChainBackend(ChainBackend):
+    def __init__(self, chain=None, address=LOCAL_EXECUTOR_ADDRESS):
+        self.chain = chain or local_chain
+        self.address = address
+
+    def pending_nonce(self):
+        return self.chain.pending_nonce(self.address)
+
+    def spendable(self, token_address, owner):
+        _check_addresses(token_address, owner)
+        return min(
+            self.chain.balance_of(token_address, owner),
+            self.chain.allowance(token_address, owner, self.address),
+        )
+
+    def sign_transfer(self, token_address, to, amount, nonce, owner=None):
+        _check_addresses(token_address, to, *([owner] if owner else []))
+        tx = {
+            'from': self.address.lower(),
+            'token': token_address.lower(),
+            'to': to.lower(),
+            'amount': amount,
+            'nonce': nonce,
+        }
+        if owner:
+            tx['owner'] = owner.lower()
+        raw_tx = json.dumps(tx, sort_keys=True)
+        return '0x' + hashlib.sha256(raw_tx.encode()).hexdigest(), raw_tx
+
+    def broadcast(self, raw_tx):
+        self.chain.send(raw_tx)
+
+    def receipts(self, tx_hashes):
+        return {tx_hash: self.chain.mined.get(tx_hash) for tx_hash in tx_hashes}
+
+
+def load_backend(spec=None) -> ChainBackend:
+    return import_string(spec or settings.XUSDT_SETTINGS['SWAP_EXECUTION_BACKEND'])()
+
+
+# --------------------------------------------------------------------------- #
+# Executor                                                                    #
+# --------------------------------------------------------------------------- #
+
+# Status of a swap with a transaction in flight -> field holding its hash
+OUTSTANDING = {
+    'collecting': 'deposit_tx_hash',
+    'submitted': 'tx_hash',
+    'refunding': 'refund_tx_hash',
+}
+
+# Status -> (status, cleared fields) when its transaction lost its nonce and must be signed again
+RESIGN = {
+    'collecting': ('queued', {'deposit_tx_hash': None}),
+    'submitted': ('collected', {'tx_hash': None, 'executed_at': None}),
+    'refunding': ('failed', {'refund_tx_hash': None}),
+}
+
+
+def _push_status(swaps) -> None:
+    """Stream the status of swaps written without post_save (sent on commit)."""
+    for swap in swaps:
+        events.publish('swap', [swap.user_token], {'id': str(swap.pk), 'status': swap.status})
+
+
+class SwapExecutor:
+    def __init__(self, backend=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.backend = backend or load_backend()
+        self.batch_size = batch_size
+        self._sent = {}          # tx hash -> monotonic time of the last broadcast
+
+    def _sign(self, token, to, units, owner=None):
+        """(nonce, tx hash, raw tx) of a transfer. Runs inside the caller's transaction."""
+        address = self.backend.address.lower()
+        row, _ = SwapExecutorNonce.objects.select_for_update().get_or_create(address=address)
+        if row.next_nonce is None:
+            row.next_nonce = self.backend.pending_nonce()
+        nonce = row.next_nonce
+        tx_hash, raw_tx = self.backend.sign_transfer(token.contract_address, to, units, nonce, owner=owner)
+        row.next_nonce = nonce + 1
+        row.save(update_fields=['next_nonce', 'updated_at'])
+        return nonce, tx_hash, raw_tx
+
+    def _claim(self, **filters):
+        return (
+            SwapTransaction.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('quote__token_in', 'quote__token_out')
+            .filter(**filters)
+            .order_by('created_at')
+            .first()
+        )
+
+    def _broadcast(self, swap) -> None:
+        tx_hash = getattr(swap, OUTSTANDING[swap.status])
+        self._sent[tx_hash] = time.monotonic()
+        try:
+            self.backend.broadcast(swap.signed_tx)
+        except NonceConflict:
+            self._nonce_conflict(swap, tx_hash)
+        except ChainUnavailable as e:
+            logger.warning("Broadcast of swap %s failed, will retry: %s", swap.id, e)
+
+    def _nonce_conflict(self, swap, tx_hash) -> None:
+        """The nonce went to another transaction: sign the swap's transfer again with a fresh one."""
+        if self.backend.receipts([tx_hash]).get(tx_hash) is not None:
+            return      # it was ours, mined since the last look
+        logger.warning("Nonce %s of swap %s was taken, resyncing from the chain", swap.nonce, swap.id)
+        status, cleared = RESIGN[swap.status]
+        with transaction.atomic():
+            SwapExecutorNonce.objects.filter(address=self.backend.address.lower()).update(next_nonce=None)
+            updated = SwapTransaction.objects.filter(
+                pk=swap.pk, status=swap.status, signed_tx=swap.signed_tx,
+            ).update(status=status, nonce=None, signed_tx='', **cleared)
+            if updated:
+                swap.status, swap.nonce, swap.signed_tx = status, None, ''
+                for field, value in cleared.items():
+                    setattr(swap, field, value)
+                _push_status([swap])
+        self._sent.pop(tx_hash, None)
+
+    def _fail(self, swap, status, error) -> None:
+        swap.status = status
+        swap.error = str(error)[:255]
+        swap.save(update_fields=['status', 'error'])
+
+    # ------------------------------------------------------------------ #
+    # Stages                                                             #
+    # ------------------------------------------------------------------ #
+
+    def collect(self) -> int:
+        """Pull ``amount_in`` from up to ``batch_size`` queued swaps' senders. Returns how many pulls were sent."""
+        collecting = 0
+        for _ in range(self.batch_size):
+            with transaction.atomic():
+                swap = self._claim(status='queued')
+                if swap is None:
+                    break
+                token = swap.quote.token_in
+                units = to_units(swap.quote.amount_in, token.decimals)
+                try:
+                    if units <= 0:
+                        raise ExecutionError("Nothing to collect")
+                    if self.backend.spendable(token.contract_address, swap.from_address) < units:
+                        raise ExecutionError(
+                            f"{token.symbol} balance or allowance of {swap.from_address} "
+                            f"for {self.backend.address} is below the swap amount"
+                        )
+                    swap.nonce, swap.deposit_tx_hash, swap.signed_tx = self._sign(
+                        token, self.backend.address, units, owner=swap.from_address,
+                    )
+                except ExecutionError as e:
+                    self._fail(swap, 'failed', e)
+                    continue
+                swap.status = 'collecting'
+                swap.save(update_fields=['status', 'nonce', 'deposit_tx_hash', 'signed_tx'])
+            self._broadcast(swap)
+            collecting += 1
+        return collecting
+
+    def submit(self) -> int:
+        """Pay out up to ``batch_size`` collected swaps. Returns how many were submitted."""
+        submitted = 0
+        for _ in range(self.batch_size):
+            with transaction.atomic():
+                swap = self._claim(status='collected')
+                if swap is None:
+                    break
+                token = swap.quote.token_out
+                try:
+                    swap.nonce, swap.tx_hash, swap.signed_tx = self._sign(
+                        token, swap.to_address, to_units(swap.quote.amount_out, token.decimals),
+                    )
+                except ExecutionError as e:
+                    self._fail(swap, 'failed', e)
+                    continue
+                swap.status = 'submitted'
+                swap.executed_at = timezone.now()
+                swap.save(update_fields=['status', 'nonce', 'tx_hash', 'signed_tx', 'executed_at'])
+            self._broadcast(swap)
+            submitted += 1
+        return submitted
+
+    def refund(self) -> int:
+        """Send failed swaps' ``amount_received`` back to their sender. Returns how many were sent."""
+        refunding = 0
+        for _ in range(self.batch_size):
+            with transaction.atomic():
+                swap = self._claim(status='failed', refund_tx_hash__isnull=True, amount_received__isnull=False)
+                if swap is None:
+                    break
+                token = swap.quote.token_in
+                try:
+                    swap.nonce, swap.refund_tx_hash, swap.signed_tx = self._sign(
+                        token, swap.from_address, to_units(swap.amount_received, token.decimals),
+                    )
+                except ExecutionError as e:
+                    self._fail(swap, 'refund_failed', e)
+                    continue
+                swap.status = 'refunding'
+                swap.save(update_fields=['status', 'nonce', 'refund_tx_hash', 'signed_tx'])
+            self._broadcast(swap)
+            refunding += 1
+        return refunding
+
+    def _settle(self, swap, succeeded, now) -> None:
+        if swap.status == 'collecting':
+            if succeeded:
+                token = swap.quote.token_in
+                swap.status = 'collected'
+                swap.amount_received = from_units(to_units(swap.quote.amount_in, token.decimals), token.decimals)
+            else:
+                # nothing was received, so nothing is refunded
+                swap.status, swap.error = 'failed', 'Deposit transfer reverted'
+        elif swap.status == 'submitted':
+            if succeeded:
+                swap.status, swap.completed_at = 'completed', now
+            else:
+                swap.status, swap.error = 'failed', 'Swap transaction reverted'
+        elif succeeded:
+            swap.status = 'refunded'
+        else:
+            swap.status, swap.error = 'refund_failed', 'Refund transaction reverted'
+        swap.signed_tx = ''
+
+    def track(self) -> dict:
+        """Settle outstanding transactions from one batch of receipts; re-broadcast the unmined."""
+        counts = dict.fromkeys(['collected', 'completed', 'failed', 'refunded', 'refund_failed', 'pending'], 0)
+        with transaction.atomic():
+            outstanding = list(
+                SwapTransaction.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('quote__token_in')
+                .filter(status__in=OUTSTANDING)
+                .order_by('nonce')[:self.batch_size]
+            )
+            if not outstanding:
+                return counts
+            hashes = {swap.pk: getattr(swap, OUTSTANDING[swap.status]) for swap in outstanding}
+            receipts = self.backend.receipts(hashes.values())
+
+            now = timezone.now()
+            settled, unmined = [], []
+            for swap in outstanding:
+                succeeded = receipts.get(hashes[swap.pk])
+                if succeeded is None:
+                    unmined.append(swap)
+                    continue
+                self._settle(swap, succeeded, now)
+                self._sent.pop(hashes[swap.pk], None)
+                counts[swap.status] += 1
+                settled.append(swap)
+            SwapTransaction.objects.bulk_update(
+                settled, ['status', 'amount_received', 'completed_at', 'error', 'signed_tx'],
+            )
+            _push_status(settled)
+
+        counts['pending'] = len(unmined)
+        due = time.monotonic() - REBROADCAST_SECONDS
+        for swap in unmined:
+            sent = self._sent.get(hashes[swap.pk])
+            if sent is None or sent < due:
+                self._broadcast(swap)
+        return counts
+
+    def run_once(self) -> dict:
+        counts = self.track()
+        counts['refunding'] = self.refund()
+        counts['submitted'] = self.submit()
+        counts['collecting'] = self.collect()
+        return counts
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.swap.stats import StatsEngine
+
+
+class Command(BaseCommand):
+    help = "Compute the rolling 24h swap MarketStats and refresh their read cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep the engine running, flushing every --interval seconds")
+        parser.add_argument('--interval', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        engine = StatsEngine()
+        engine.warm()
+        while True:
+            pairs = engine.flush()
+            self.stdout.write(f"Market stats written for {pairs} pairs")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            engine.poll()
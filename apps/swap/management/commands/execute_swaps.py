@@ -0,0 +1,33 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.swap.exceptions import ChainUnavailable
+from apps.swap.execution import DEFAULT_BATCH_SIZE, SwapExecutor, load_backend
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Sign, broadcast and track queued swaps, and refund the ones that fail"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--backend', help="Dotted path of the chain backend (default: SWAP_EXECUTION_BACKEND)")
+        parser.add_argument('--loop', action='store_true', help="Keep running, one pass every --interval seconds")
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        executor = SwapExecutor(load_backend(options['backend']), batch_size=options['batch_size'])
+        while True:
+            try:
+                counts = executor.run_once()
+            except ChainUnavailable as e:
+                logger.warning("Swap execution pass failed, will retry: %s", e)
+            else:
+                if any(counts.values()):
+                    self.stdout.write(", ".join(f"{key}: {value}" for key, value in counts.items()))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
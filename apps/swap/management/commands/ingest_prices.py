@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.swap.prices import DEFAULT_BATCH_SIZE, configured_feeds, ingest, load_feed, warm
+
+
+class Command(BaseCommand):
+    help = "Poll the token price feeds, store the prices and refresh the latest-price cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--feed', action='append', dest='feeds',
+            help="Feed URL, JSON file or PriceFeed class (repeatable; default: SWAP_PRICE_FEEDS)",
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep polling every --interval seconds")
+        parser.add_argument('--interval', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        feeds = [load_feed(spec) for spec in options['feeds']] if options['feeds'] else configured_feeds()
+        self.stdout.write(f"Warmed the cache with {warm()} stored prices")
+        while True:
+            count = ingest(feeds, batch_size=options['batch_size'])
+            self.stdout.write(f"{count} prices ingested from {len(feeds)} feeds")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
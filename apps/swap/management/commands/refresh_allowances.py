@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.swap.allowances import refresh_stale
+from apps.swap.exceptions import AllowanceUnavailable
+
+
+class Command(BaseCommand):
+    help = "Re-read stale swap allowances from the chain in multicall batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows read per block")
+        parser.add_argument('--max-age', type=float, help="Seconds (default: SWAP_ALLOWANCE_MAX_AGE_SECONDS)")
+        parser.add_argument('--loop', action='store_true', help="Keep refreshing every --interval seconds")
+        parser.add_argument('--interval', type=float, default=15.0)
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                count = refresh_stale(max_age=options['max_age'], batch_size=options['batch_size'])
+                self.stdout.write(f"{count} allowances refreshed")
+            except AllowanceUnavailable as e:
+                if not options['loop']:
+                    raise
+                self.stderr.write(str(e))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.swap.candles import DEFAULT_BATCH_SIZE, apply_retention, rollup
+
+
+class Command(BaseCommand):
+    help = "Roll new price ticks up into OHLC candles and apply the tick/candle retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep rolling up every --interval seconds")
+        parser.add_argument('--interval', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        while True:
+            folded = rollup(batch_size=options['batch_size'])
+            result = apply_retention(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"{folded} ticks rolled up, "
+                f"{result['ticks_thinned']} old ticks thinned, "
+                f"{result['candles_expired']} candles expired"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swapquote',
+            name='path',
+            field=models.JSONField(blank=True, default=list, help_text='Routes the swap goes through, in order'),
+        ),
+    ]
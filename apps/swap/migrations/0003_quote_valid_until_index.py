@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0002_quote_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='swapquote',
+            index=models.Index(fields=['valid_until'], name='swap_swapqu_valid_u_1a73af_idx'),
+        ),
+    ]
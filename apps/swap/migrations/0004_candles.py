@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0003_quote_valid_until_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SwapRollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SwapCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 minute'), ('5m', '5 minutes'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('open_time', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('high', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('low', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('close', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('ticks', models.PositiveIntegerField(default=0)),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='swap.swaptoken')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('token', 'interval', 'open_time'), name='uniq_swap_candle')],
+            },
+        ),
+    ]
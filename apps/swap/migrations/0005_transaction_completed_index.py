@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0004_candles'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='swaptransaction',
+            index=models.Index(fields=['status', 'completed_at'], name='swap_swaptr_status_827fe8_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0005_transaction_completed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swapallowance',
+            name='block_number',
+            field=models.BigIntegerField(blank=True, help_text='Block the amount was read at; empty if client-reported', null=True),
+        ),
+        migrations.AddField(
+            model_name='swapallowance',
+            name='owner_address',
+            field=models.CharField(blank=True, default='', help_text='Approving wallet; allowances with one are read on-chain', max_length=42),
+        ),
+    ]
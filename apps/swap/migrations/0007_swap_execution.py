@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0006_allowance_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SwapExecutorNonce',
+            fields=[
+                ('address', models.CharField(max_length=42, primary_key=True, serialize=False)),
+                ('next_nonce', models.BigIntegerField(blank=True, help_text='Empty: read from the chain on next use', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='swaptransaction',
+            name='error',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='swaptransaction',
+            name='nonce',
+            field=models.BigIntegerField(blank=True, help_text='Executor nonce of the outstanding transaction', null=True),
+        ),
+        migrations.AddField(
+            model_name='swaptransaction',
+            name='refund_tx_hash',
+            field=models.CharField(blank=True, max_length=66, null=True),
+        ),
+        migrations.AddField(
+            model_name='swaptransaction',
+            name='signed_tx',
+            field=models.TextField(blank=True, default='', help_text='Outstanding signed transaction, re-broadcast until mined'),
+        ),
+        migrations.AlterField(
+            model_name='swaptransaction',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('submitted', 'Submitted'), ('completed', 'Completed'), ('failed', 'Failed'), ('refunding', 'Refunding'), ('refunded', 'Refunded'), ('refund_failed', 'Refund failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0007_swap_execution'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='swaptransaction',
+            name='swap_swaptr_user_to_330c11_idx',
+        ),
+        migrations.AddIndex(
+            model_name='swaptransaction',
+            index=models.Index(fields=['user_token', '-created_at', '-id'], name='idx_swap_user_history'),
+        ),
+    ]
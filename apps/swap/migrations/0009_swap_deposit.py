@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0008_user_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swaptransaction',
+            name='amount_received',
+            field=models.DecimalField(blank=True, decimal_places=18, help_text='token_in collected from from_address; what a refund returns', max_digits=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='swaptransaction',
+            name='deposit_tx_hash',
+            field=models.CharField(blank=True, help_text="Executor's transferFrom of amount_in", max_length=66, null=True),
+        ),
+        migrations.AlterField(
+            model_name='swaptransaction',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('collecting', 'Collecting'), ('collected', 'Collected'), ('submitted', 'Submitted'), ('completed', 'Completed'), ('failed', 'Failed'), ('refunding', 'Refunding'), ('refunded', 'Refunded'), ('refund_failed', 'Refund failed')], default='pending', max_length=20),
+        ),
+    ]
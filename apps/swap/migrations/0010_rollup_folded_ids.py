@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+ROLLUP_ID_LAG = 500   # candles.ROLLUP_ID_LAG when this migration was written
+
+
+def seed_folded_ids(apps, schema_editor):
+    # ticks already under the watermark were folded; don't fold them again
+    SwapPrice = apps.get_model('swap', 'SwapPrice')
+    SwapRollupWatermark = apps.get_model('swap', 'SwapRollupWatermark')
+    for mark in SwapRollupWatermark.objects.all():
+        mark.folded_ids = list(
+            SwapPrice.objects.filter(id__gt=mark.last_id - ROLLUP_ID_LAG, id__lte=mark.last_id)
+            .order_by('id').values_list('id', flat=True)
+        )
+        mark.save(update_fields=['folded_ids'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swap', '0009_swap_deposit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swaprollupwatermark',
+            name='folded_ids',
+            field=models.JSONField(blank=True, default=list, help_text='Ids folded in the window re-read for late commits'),
+        ),
+        migrations.RunPython(seed_folded_ids, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from uuid import uuid4
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from apps.core import quotes
+
 class SwapToken(models.Model):
     """
     Supported tokens for swapping
@@ -48,8 +51,38 @@ class SwapQuote(models.Model):
     amount_out = models.DecimalField(max_digits=30, decimal_places=18, validators=[MinValueValidator(0)])
     rate = models.DecimalField(max_digits=30, decimal_places=18, validators=[MinValueValidator(0)])
     fee_amount = models.DecimalField(max_digits=30, decimal_places=18, validators=[MinValueValidator(0)])
+    path = models.JSONField(default=list, blank=True, help_text="Routes the swap goes through, in order")
     valid_until = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['valid_until']),
+        ]
+
+    # Carried by the signed quote token (see apps.core.quotes)
+    SIGNED_FIELDS = ('token_in_id', 'token_out_id', 'amount_in', 'amount_out', 'rate', 'fee_amount', 'path')
+    SIGNED_DECIMALS = ('amount_in', 'amount_out', 'rate', 'fee_amount')
+
+    def sign(self) -> str:
+        data = {field: getattr(self, field) for field in self.SIGNED_FIELDS}
+        data.update({field: str(data[field]) for field in self.SIGNED_DECIMALS})
+        return quotes.sign('swap', self.id, data, self.valid_until)
+
+    @classmethod
+    def from_token(cls, token):
+        """Unsaved quote from a signed token. Raises quotes.InvalidQuote."""
+        payload = quotes.load('swap', token)
+        for field in cls.SIGNED_DECIMALS:
+            payload[field] = Decimal(payload[field])
+        return cls(**payload)
+    
+    @classmethod
+    def compactable(cls, before):
+        """Quotes that expired before ``before`` and were never executed."""
+        return cls.objects.filter(valid_until__lt=before).exclude(
+            Exists(SwapTransaction.objects.filter(quote=OuterRef('pk')))
+        )
     
     def __str__(self):
         return f"Quote {self.id}: {self.amount_in} {self.token_in.symbol} → {self.amount_out} {self.token_out.symbol}"
@@ -60,15 +93,27 @@ class SwapTransaction(models.Model):
     """
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('queued', 'Queued'),
+        ('collecting', 'Collecting'),
+        ('collected', 'Collected'),
+        ('submitted', 'Submitted'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
+        ('refunding', 'Refunding'),
         ('refunded', 'Refunded'),
+        ('refund_failed', 'Refund failed'),
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     user_token = models.CharField(max_length=64)  # HMAC-SHA256(user_identity)
     quote = models.ForeignKey(SwapQuote, on_delete=models.PROTECT)
     tx_hash = models.CharField(max_length=66, blank=True, null=True)
+    deposit_tx_hash = models.CharField(max_length=66, blank=True, null=True, help_text="Executor's transferFrom of amount_in")
+    amount_received = models.DecimalField(max_digits=30, decimal_places=18, blank=True, null=True, help_text="token_in collected from from_address; what a refund returns")
+    refund_tx_hash = models.CharField(max_length=66, blank=True, null=True)
+    nonce = models.BigIntegerField(blank=True, null=True, help_text="Executor nonce of the outstanding transaction")
+    signed_tx = models.TextField(blank=True, default='', help_text="Outstanding signed transaction, re-broadcast until mined")
+    error = models.CharField(max_length=255, blank=True, default='')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     from_address = models.CharField(max_length=42)
     to_address = models.CharField(max_length=42)
@@ -78,14 +123,27 @@ class SwapTransaction(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['user_token']),
+            # history pages: WHERE user_token = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user_token', '-created_at', '-id'], name='idx_swap_user_history'),
             models.Index(fields=['status']),
             models.Index(fields=['tx_hash']),
+            models.Index(fields=['status', 'completed_at']),
         ]
     
     def __str__(self):
         return f"Swap {self.id} ({self.status})"
 
+class SwapExecutorNonce(models.Model):
+    """
+    Next nonce of an executor hot wallet (see execution.py)
+    """
+    address = models.CharField(max_length=42, primary_key=True)
+    next_nonce = models.BigIntegerField(blank=True, null=True, help_text="Empty: read from the chain on next use")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.address} @ {self.next_nonce}"
+
 class SwapAllowance(models.Model):
     """
     Token allowances for swap contracts
@@ -93,7 +151,9 @@ class SwapAllowance(models.Model):
     user_token = models.CharField(max_length=64)
     token = models.ForeignKey(SwapToken, on_delete=models.CASCADE)
     contract_address = models.CharField(max_length=42)
+    owner_address = models.CharField(max_length=42, blank=True, default='', help_text="Approving wallet; allowances with one are read on-chain")
     allowance_amount = models.DecimalField(max_digits=30, decimal_places=18, default=Decimal('0'))
+    block_number = models.BigIntegerField(blank=True, null=True, help_text="Block the amount was read at; empty if client-reported")
     last_updated = models.DateTimeField(auto_now=True)
     
     class Meta:
@@ -118,6 +178,47 @@ class SwapPrice(models.Model):
     def __str__(self):
         return f"{self.token.symbol} @ ${self.price_usd}"
 
+class SwapCandle(models.Model):
+    """
+    OHLC candles rolled up from SwapPrice (see candles.py)
+    """
+    INTERVAL_CHOICES = [
+        ('1m', '1 minute'),
+        ('5m', '5 minutes'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    token = models.ForeignKey(SwapToken, on_delete=models.CASCADE, related_name='candles')
+    interval = models.CharField(max_length=2, choices=INTERVAL_CHOICES)
+    open_time = models.DateTimeField()
+    open = models.DecimalField(max_digits=30, decimal_places=18)
+    high = models.DecimalField(max_digits=30, decimal_places=18)
+    low = models.DecimalField(max_digits=30, decimal_places=18)
+    close = models.DecimalField(max_digits=30, decimal_places=18)
+    ticks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the index for range queries on one token's candles
+            models.UniqueConstraint(fields=['token', 'interval', 'open_time'], name='uniq_swap_candle'),
+        ]
+
+    def __str__(self):
+        return f"{self.token.symbol} {self.interval} @ {self.open_time}"
+
+class SwapRollupWatermark(models.Model):
+    """
+    Last SwapPrice id folded into a rollup
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    folded_ids = models.JSONField(default=list, blank=True, help_text="Ids folded in the window re-read for late commits")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
 class MarketStats(models.Model):
     """
     Market statistics for swap pairs
@@ -0,0 +1,225 @@
+"""
+Token price ingestion and the latest-price cache.
+
+``ingest()`` polls every configured feed, takes the median per symbol when
+several feeds quote it, appends the result to ``SwapPrice`` with one
+bulk_create and publishes it to the cache as ``swap:price:<symbol>`` with
+the time it was taken.
+
+Quotes read rates through ``rate()``: one ``cache.get_many`` for both
+tokens, and prices older than ``SWAP_PRICE_MAX_AGE_SECONDS`` are refused
+instead of quoted. A symbol missing from the cache (evicted, or flushed)
+is read from its newest SwapPrice row and published again.
+
+Feeds are listed in ``XUSDT_SETTINGS['SWAP_PRICE_FEEDS']``: an http(s)://
+URL or a file path serving a JSON object of {symbol: usd_price}, or the
+dotted path of a PriceFeed subclass.
+"""
+import json
+import logging
+import statistics
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .exceptions import PriceUnavailable, StalePrice
+from .models import SwapPrice, SwapToken
+
+logger = logging.getLogger(__name__)
+
+PRICE_QUANT = Decimal('1e-18')   # SwapPrice.price_usd / SwapQuote.rate precision
+CACHE_TIMEOUT = 24 * 3600        # stale entries stay readable so they can be refused as stale
+DEFAULT_BATCH_SIZE = 500
+
+
+# --------------------------------------------------------------------------- #
+# Feeds                                                                       #
+# --------------------------------------------------------------------------- #
+
+class PriceFeed:
+    """A source of USD prices. ``fetch()`` returns {symbol: Decimal}."""
+    name = 'feed'
+
+    def fetch(self) -> dict:
+        raise NotImplementedError
+
+    @staticmethod
+    def parse(data) -> dict:
+        prices = {}
+        for symbol, value in (data or {}).items():
+            try:
+                price = Decimal(str(value))
+            except InvalidOperation:
+                logger.warning("Ignoring non-numeric price %r for %s", value, symbol)
+                continue
+            if price.is_finite() and price > 0:
+                prices[symbol] = price
+        return prices
+
+
+class FilePriceFeed(PriceFeed):
+    def __init__(self, path):
+        self.path = path
+        self.name = f"file:{path}"
+
+    def fetch(self) -> dict:
+        with open(self.path) as f:
+            return self.parse(json.load(f))
+
+
+class HttpPriceFeed(PriceFeed):
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+        self.name = url
+
+    def fetch(self) -> dict:
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return self.parse(response.json())
+
+
+def load_feed(spec: str) -> PriceFeed:
+    if spec.startswith(('http://', 'https://')):
+        return HttpPriceFeed(spec)
+    if spec.startswith('file://'):
+        return FilePriceFeed(spec[len('file://'):])
+    if spec.endswith('.json'):
+        return FilePriceFeed(spec)
+    return import_string(spec)()
+
+
+def configured_feeds() -> list:
+    return [load_feed(spec) for spec in settings.XUSDT_SETTINGS['SWAP_PRICE_FEEDS']]
+
+
+# --------------------------------------------------------------------------- #
+# Cache                                                                       #
+# --------------------------------------------------------------------------- #
+
+@dataclass(frozen=True)
+class LatestPrice:
+    symbol: str
+    price: Decimal
+    at: datetime
+    sources: int
+
+    @property
+    def age(self) -> float:
+        return (timezone.now() - self.at).total_seconds()
+
+
+def cache_key(symbol: str) -> str:
+    return f"swap:price:{symbol}"
+
+
+def publish(prices: dict, at: datetime, sources: dict | None = None) -> None:
+    """Store {symbol: price} taken at ``at`` as the latest prices."""
+    cache.set_many(
+        {
+            cache_key(symbol): (price, at.timestamp(), (sources or {}).get(symbol, 1))
+            for symbol, price in prices.items()
+        },
+        CACHE_TIMEOUT,
+    )
+
+
+def latest_prices(symbols) -> dict:
+    """{symbol: LatestPrice} for the given symbols that have a price."""
+    keys = {cache_key(symbol): symbol for symbol in symbols}
+    found = {}
+    for key, (price, at, sources) in cache.get_many(keys).items():
+        symbol = keys[key]
+        found[symbol] = LatestPrice(symbol, price, datetime.fromtimestamp(at, dt_timezone.utc), sources)
+    missing = [symbol for symbol in keys.values() if symbol not in found]
+    if missing:
+        found.update(stored_prices(missing))
+    return found
+
+
+def stored_prices(symbols) -> dict:
+    """{symbol: LatestPrice} from each symbol's newest SwapPrice row, published to the cache."""
+    found = {}
+    for symbol in symbols:
+        latest = (
+            SwapPrice.objects.filter(token__symbol=symbol)
+            .order_by('-timestamp')
+            .values_list('price_usd', 'timestamp')
+            .first()
+        )
+        if latest:
+            found[symbol] = LatestPrice(symbol, latest[0], latest[1], 1)
+            publish({symbol: latest[0]}, latest[1])
+    return found
+
+
+def fresh_prices(symbols, max_age: float | None = None) -> dict:
+    """{symbol: price} of the given symbols whose cached price is not stale."""
+    if max_age is None:
+        max_age = settings.XUSDT_SETTINGS['SWAP_PRICE_MAX_AGE_SECONDS']
+    return {
+        symbol: latest.price
+        for symbol, latest in latest_prices(symbols).items()
+        if latest.age <= max_age
+    }
+
+
+def rate(symbol_in: str, symbol_out: str, max_age: float | None = None) -> Decimal:
+    """
+    Units of ``symbol_out`` per unit of ``symbol_in`` from the cached USD
+    prices. Raises PriceUnavailable (or its subclass StalePrice).
+    """
+    if max_age is None:
+        max_age = settings.XUSDT_SETTINGS['SWAP_PRICE_MAX_AGE_SECONDS']
+    prices = latest_prices((symbol_in, symbol_out))
+    for symbol in (symbol_in, symbol_out):
+        if symbol not in prices:
+            raise PriceUnavailable(f"No price available for {symbol}")
+        if prices[symbol].age > max_age:
+            raise StalePrice(f"Price of {symbol} is {prices[symbol].age:.0f}s old")
+    return (prices[symbol_in].price / prices[symbol_out].price).quantize(PRICE_QUANT)
+
+
+def warm() -> int:
+    """Seed the cache with each active token's newest stored price (after a restart)."""
+    return len(stored_prices(SwapToken.objects.filter(is_active=True).values_list('symbol', flat=True)))
+
+
+# --------------------------------------------------------------------------- #
+# Ingestion                                                                   #
+# --------------------------------------------------------------------------- #
+
+def ingest(feeds=None, batch_size=DEFAULT_BATCH_SIZE) -> int:
+    """Poll ``feeds`` once, store and publish the prices. Returns the rows written."""
+    feeds = configured_feeds() if feeds is None else feeds
+    quotes = {}
+    for feed in feeds:
+        try:
+            prices = feed.fetch()
+        except Exception:
+            # one broken feed must not stop the others
+            logger.exception("Price feed %s failed", feed.name)
+            continue
+        for symbol, price in prices.items():
+            quotes.setdefault(symbol, []).append(price)
+
+    tokens = dict(
+        SwapToken.objects.filter(is_active=True, symbol__in=list(quotes)).values_list('symbol', 'id')
+    )
+    now = timezone.now()
+    prices = {
+        symbol: statistics.median(quotes[symbol]).quantize(PRICE_QUANT)
+        for symbol in tokens
+    }
+    SwapPrice.objects.bulk_create(
+        [SwapPrice(token_id=tokens[symbol], price_usd=price, timestamp=now) for symbol, price in prices.items()],
+        batch_size=batch_size,
+    )
+    publish(prices, now, {symbol: len(quotes[symbol]) for symbol in prices})
+    return len(prices)
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import catalog
+from .models import SwapRoute, SwapToken
+from .routing import route_graph
+
+
+@receiver(post_save, sender=SwapRoute)
+def route_graph_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: route_graph.route_saved(instance))
+
+
+@receiver(post_delete, sender=SwapRoute)
+def route_graph_deleted(sender, instance, **kwargs):
+    route_id = instance.pk  # cleared on the instance once the delete finishes
+    transaction.on_commit(lambda: route_graph.route_deleted(route_id))
+
+
+@receiver(post_save, sender=SwapToken)
+def route_graph_token_saved(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(route_graph.tokens_changed)
+
+
+@receiver([post_save, post_delete], sender=SwapRoute)
+@receiver([post_save, post_delete], sender=SwapToken)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(catalog.bump)
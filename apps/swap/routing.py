@@ -0,0 +1,197 @@
+"""
+In-memory swap route graph.
+
+Active SwapRoute rows are edges between token symbols, carrying the
+route's fee and its min/max input bounds. ``best_path()`` walks every
+simple path of up to ``MAX_HOPS`` edges from the input token and keeps the
+one that delivers the most output. Each hop converts at the ratio of the
+cached latest USD prices (see prices.py) minus the route fee, and must
+respect that route's bounds for the amount it receives.
+
+The graph is fed by the SwapRoute/SwapToken signals (see receivers.py).
+Every change bumps a version number in the shared cache. The process that
+made the change patches its own graph in place. Other processes see the
+new version on their next read and reload. ``SWAP_ROUTE_GRAPH_TTL_SECONDS``
+bounds staleness when the cache is not shared.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SwapRoute
+
+MAX_HOPS = 3
+AMOUNT_QUANT = Decimal('1e-18')
+VERSION_KEY = 'swap:route-graph:version'
+
+
+class Edge:
+    __slots__ = ('route_id', 'token_in', 'token_out', 'fee_percentage', 'keep', 'min_in', 'max_in')
+
+    def __init__(self, route):
+        self.route_id = route.id
+        self.token_in = route.token_in.symbol
+        self.token_out = route.token_out.symbol
+        self.fee_percentage = route.fee_percentage
+        self.keep = 1 - route.fee_percentage / 100   # share of the converted amount delivered
+        self.min_in = route.min_amount_in
+        self.max_in = route.max_amount_in
+
+
+@dataclass
+class Path:
+    amount_in: Decimal
+    hops: list = field(default_factory=list)   # [(Edge, amount_in, amount_out), ...]
+
+    @property
+    def amount_out(self) -> Decimal:
+        return self.hops[-1][2] if self.hops else self.amount_in
+
+    def as_list(self) -> list:
+        return [
+            {
+                'route': edge.route_id,
+                'token_in': edge.token_in,
+                'token_out': edge.token_out,
+                'fee_percentage': str(edge.fee_percentage),
+                'amount_in': str(amount_in.quantize(AMOUNT_QUANT)),
+                'amount_out': str(amount_out.quantize(AMOUNT_QUANT)),
+            }
+            for edge, amount_in, amount_out in self.hops
+        ]
+
+
+def _bump_version() -> int:
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(VERSION_KEY, 1, None)
+        return 1
+
+
+class RouteGraph:
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._edges = {}     # route id -> Edge
+        self._out = {}       # symbol -> {route id: Edge}
+        self._loaded_at = None
+        self._version = None
+
+    # ------------------------------------------------------------------ #
+    # Maintenance                                                        #
+    # ------------------------------------------------------------------ #
+
+    def _ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return settings.XUSDT_SETTINGS.get('SWAP_ROUTE_GRAPH_TTL_SECONDS', 300)
+
+    def _ensure_loaded(self):
+        if (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self._ttl()
+            or cache.get(VERSION_KEY) != self._version
+        ):
+            self.reload()
+
+    def reload(self):
+        # read the version first: a change racing with the load triggers another reload
+        version = cache.get(VERSION_KEY)
+        routes = SwapRoute.objects.filter(
+            is_active=True, token_in__is_active=True, token_out__is_active=True,
+        ).select_related('token_in', 'token_out')
+        with self._lock:
+            self._edges, self._out = {}, {}
+            for route in routes:
+                self._insert(route)
+            self._loaded_at = time.monotonic()
+            self._version = version
+
+    def _insert(self, route):
+        edge = Edge(route)
+        self._edges[edge.route_id] = edge
+        self._out.setdefault(edge.token_in, {})[edge.route_id] = edge
+
+    def _delete(self, route_id):
+        edge = self._edges.pop(route_id, None)
+        if edge is not None:
+            edges = self._out[edge.token_in]
+            del edges[route_id]
+            if not edges:
+                del self._out[edge.token_in]
+
+    def _apply(self, change):
+        """Run ``change`` on this graph and tell the other processes."""
+        version = _bump_version()
+        with self._lock:
+            if self._loaded_at is None or self._version != version - 1:
+                # not loaded, or behind on other changes: the next read reloads
+                return
+            change()
+            self._version = version
+
+    def route_saved(self, route):
+        def change():
+            self._delete(route.id)
+            if route.is_active and route.token_in.is_active and route.token_out.is_active:
+                self._insert(route)
+        self._apply(change)
+
+    def route_deleted(self, route_id):
+        self._apply(lambda: self._delete(route_id))
+
+    def tokens_changed(self):
+        """A token was renamed or (de)activated: every process reloads."""
+        _bump_version()
+
+    # ------------------------------------------------------------------ #
+    # Queries                                                            #
+    # ------------------------------------------------------------------ #
+
+    def symbols(self) -> set:
+        with self._lock:
+            self._ensure_loaded()
+            return set(self._out) | {edge.token_out for edge in self._edges.values()}
+
+    def best_path(self, symbol_in, symbol_out, amount_in, prices, max_hops=MAX_HOPS) -> Path | None:
+        """
+        Highest-output path of 1..max_hops routes from ``symbol_in`` to
+        ``symbol_out``, or None. ``prices`` maps symbols to fresh USD
+        prices; tokens without one are not routed through.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            out = self._out
+            best = None
+
+            def walk(symbol, amount, hops, visited):
+                nonlocal best
+                for edge in out.get(symbol, {}).values():
+                    target = edge.token_out
+                    if target in visited or target not in prices:
+                        continue
+                    if amount < edge.min_in or amount > edge.max_in:
+                        continue
+                    received = amount * prices[symbol] / prices[target] * edge.keep
+                    step = hops + [(edge, amount, received)]
+                    if target == symbol_out:
+                        if best is None or received > best.amount_out:
+                            best = Path(amount_in, step)
+                    elif len(step) < max_hops:
+                        visited.add(target)
+                        walk(target, received, step, visited)
+                        visited.discard(target)
+
+            if symbol_in in prices and symbol_out in prices:
+                walk(symbol_in, amount_in, [], {symbol_in})
+            return best
+
+
+route_graph = RouteGraph()
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from web3 import Web3
 from .models import (
     SwapToken, SwapRoute, SwapQuote,
     SwapTransaction, SwapAllowance,
-    SwapPrice, MarketStats
+    SwapPrice, SwapCandle, MarketStats
 )
 from django.utils import timezone
 from decimal import Decimal
@@ -39,7 +40,7 @@ class QuoteSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'token_in', 'token_out',
             'amount_in', 'amount_out', 'rate',
-            'fee_amount', 'valid_until'
+            'fee_amount', 'path', 'valid_until'
         ]
     
     def get_valid_until(self, obj):
@@ -53,8 +54,9 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = SwapTransaction
         fields = [
-            'id', 'quote', 'tx_hash', 'status',
-            'status_display', 'from_address',
+            'id', 'quote', 'deposit_tx_hash', 'amount_received',
+            'tx_hash', 'refund_tx_hash', 'status',
+            'status_display', 'error', 'from_address',
             'to_address', 'executed_at',
             'completed_at', 'created_at',
             'execution_time'
@@ -69,16 +71,21 @@ class TransactionSerializer(serializers.ModelSerializer):
 class AllowanceSerializer(serializers.ModelSerializer):
     token = TokenSerializer()
     last_updated = serializers.SerializerMethodField()
+    verified = serializers.SerializerMethodField()
     
     class Meta:
         model = SwapAllowance
         fields = [
-            'token', 'contract_address',
-            'allowance_amount', 'last_updated'
+            'token', 'contract_address', 'owner_address',
+            'allowance_amount', 'block_number', 'verified', 'last_updated'
         ]
     
     def get_last_updated(self, obj):
         return obj.last_updated.timestamp()
+    
+    def get_verified(self, obj):
+        # False: the amount was reported by the client, not read on-chain
+        return obj.block_number is not None
 
 class PriceSerializer(serializers.ModelSerializer):
     token = TokenSerializer()
@@ -91,6 +98,30 @@ class PriceSerializer(serializers.ModelSerializer):
     def get_timestamp(self, obj):
         return obj.timestamp.timestamp()
 
+class CandleSerializer(serializers.ModelSerializer):
+    open_time = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = SwapCandle
+        fields = ['open_time', 'open', 'high', 'low', 'close', 'ticks']
+    
+    def get_open_time(self, obj):
+        return obj.open_time.timestamp()
+
+class CandleQuerySerializer(serializers.Serializer):
+    MAX_CANDLES = 1000
+
+    token = serializers.CharField(max_length=20)
+    interval = serializers.ChoiceField(choices=SwapCandle.INTERVAL_CHOICES, default='1h')
+    start = serializers.FloatField(required=False, help_text="Unix time, inclusive")
+    end = serializers.FloatField(required=False, help_text="Unix time, exclusive")
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_CANDLES, default=500)
+    
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] >= data['end']:
+            raise serializers.ValidationError("start must be before end")
+        return data
+
 class MarketStatsSerializer(serializers.ModelSerializer):
     last_updated = serializers.SerializerMethodField()
     
@@ -115,27 +146,43 @@ class SwapQuoteRequestSerializer(serializers.Serializer):
             raise serializers.ValidationError("Amount must be positive")
         return value
 
+def checksum_address(value, message="Invalid Ethereum address"):
+    # is_address() also rejects a mixed-case address with a wrong checksum
+    if not value.startswith('0x') or not Web3.is_address(value):
+        raise serializers.ValidationError(message)
+    return Web3.to_checksum_address(value)
+
 class SwapExecuteRequestSerializer(serializers.Serializer):
-    quote_id = serializers.UUIDField()
+    quote_token = serializers.CharField(required=False)
+    quote_id = serializers.UUIDField(required=False)  # quotes stored before signed quote tokens
     from_address = serializers.CharField(max_length=42)
     to_address = serializers.CharField(max_length=42)
     
     def validate_from_address(self, value):
-        if not value.startswith('0x') or len(value) != 42:
-            raise serializers.ValidationError("Invalid Ethereum address")
-        return value.lower()
+        return checksum_address(value)
     
     def validate_to_address(self, value):
-        if not value.startswith('0x') or len(value) != 42:
-            raise serializers.ValidationError("Invalid Ethereum address")
-        return value.lower()
+        return checksum_address(value)
+    
+    def validate(self, data):
+        if not data.get('quote_token') and not data.get('quote_id'):
+            raise serializers.ValidationError("Either quote_token or quote_id is required")
+        return data
 
 class AllowanceRequestSerializer(serializers.Serializer):
     token = serializers.CharField(max_length=20)
     contract_address = serializers.CharField(max_length=42)
-    amount = serializers.DecimalField(max_digits=30, decimal_places=18)
+    owner_address = serializers.CharField(max_length=42, required=False)
+    amount = serializers.DecimalField(max_digits=30, decimal_places=18, required=False)
     
     def validate_contract_address(self, value):
-        if not value.startswith('0x') or len(value) != 42:
-            raise serializers.ValidationError("Invalid contract address")
-        return value.lower()
\ No newline at end of file
+        return checksum_address(value, "Invalid contract address").lower()
+    
+    def validate_owner_address(self, value):
+        return checksum_address(value, "Invalid owner address").lower()
+    
+    def validate(self, data):
+        # with an owner address the amount is read on-chain
+        if 'owner_address' not in data and 'amount' not in data:
+            raise serializers.ValidationError("Either owner_address or amount is required")
+        return data
\ No newline at end of file
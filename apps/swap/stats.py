@@ -0,0 +1,317 @@
+"""
+Rolling 24h MarketStats for swap pairs.
+
+A pair is a direct SwapRoute, named "<in>_<out>" ("ETH_USDT"). The engine
+keeps one ring of 1440 per-minute buckets per pair, each holding the
+minute's swap volume and the open/high/low/close of the pair rate.
+Recording a swap or a price tick touches a single bucket. A bucket that
+comes round again a day later is reset before reuse, so the window slides
+without deleting anything.
+
+* Volume is the ``amount_in`` of completed SwapTransactions, counted at
+  ``completed_at``.
+* The rate is token_in's USD price over token_out's, from SwapPrice ticks.
+
+``StatsEngine.warm()`` loads the last 24h once through indexed range reads.
+After that, ``poll()`` only reads what is new: ticks past the last SwapPrice
+id, and swaps completed since the last poll. Both look back for late
+commits (ticks ``PRICE_ID_LAG`` ids, swaps ``COMPLETION_LAG``) and count
+what they re-read once. ``flush()`` writes one MarketStats row per pair and
+puts the serialized rows in the cache that MarketStatsView reads.
+"""
+import heapq
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import MarketStats, SwapPrice, SwapRoute, SwapToken, SwapTransaction
+from .serializers import MarketStatsSerializer
+
+WINDOW_MINUTES = 24 * 60
+CACHE_KEY = 'swap:market-stats'
+AMOUNT_QUANT = Decimal('1e-18')
+CHANGE_QUANT = Decimal('0.01')
+ZERO = Decimal('0')
+
+# Swaps may commit a little after their completed_at: polls look back this far
+COMPLETION_LAG = timedelta(seconds=30)
+# ...and ticks may commit after a higher id: polls re-read this many ids back
+PRICE_ID_LAG = 500
+
+
+def pair_name(symbol_in: str, symbol_out: str) -> str:
+    return f"{symbol_in}_{symbol_out}"
+
+
+def _minute(at) -> int:
+    return int(at.timestamp()) // 60
+
+
+# --------------------------------------------------------------------------- #
+# Ring buckets                                                                #
+# --------------------------------------------------------------------------- #
+
+class Ring:
+    """Per-minute buckets of one pair over the last ``size`` minutes."""
+    __slots__ = ('size', 'minutes', 'volume', 'open', 'high', 'low', 'close', 'newest')
+
+    def __init__(self, size=WINDOW_MINUTES):
+        self.size = size
+        self.minutes = [None] * size
+        self.volume = [ZERO] * size
+        self.open = [None] * size
+        self.high = [None] * size
+        self.low = [None] * size
+        self.close = [None] * size
+        self.newest = None
+
+    def _slot(self, minute: int):
+        """Index of ``minute``'s bucket, reset if it held an older minute; None if too old."""
+        if self.newest is not None and minute <= self.newest - self.size:
+            return None
+        i = minute % self.size
+        if self.minutes[i] != minute:
+            self.minutes[i] = minute
+            self.volume[i] = ZERO
+            self.open[i] = self.high[i] = self.low[i] = self.close[i] = None
+        if self.newest is None or minute > self.newest:
+            self.newest = minute
+        return i
+
+    def add_volume(self, minute: int, amount: Decimal) -> None:
+        i = self._slot(minute)
+        if i is not None:
+            self.volume[i] += amount
+
+    def add_rate(self, minute: int, rate: Decimal) -> None:
+        i = self._slot(minute)
+        if i is None:
+            return
+        if self.open[i] is None:
+            self.open[i] = self.high[i] = self.low[i] = rate
+        else:
+            self.high[i] = max(self.high[i], rate)
+            self.low[i] = min(self.low[i], rate)
+        self.close[i] = rate
+
+    def snapshot(self, now_minute: int) -> dict:
+        """volume/high/low/change over the ``size`` minutes up to ``now_minute``."""
+        volume = ZERO
+        high = low = None
+        first = last = None   # (minute, slot) of the oldest/newest bucket with a rate
+        for i, minute in enumerate(self.minutes):
+            if minute is None or minute <= now_minute - self.size:
+                continue
+            volume += self.volume[i]
+            if self.open[i] is None:
+                continue
+            high = self.high[i] if high is None else max(high, self.high[i])
+            low = self.low[i] if low is None else min(low, self.low[i])
+            if first is None or minute < first[0]:
+                first = (minute, i)
+            if last is None or minute > last[0]:
+                last = (minute, i)
+
+        change = ZERO
+        if first is not None and self.open[first[1]]:
+            opened, closed = self.open[first[1]], self.close[last[1]]
+            change = (closed - opened) / opened * 100
+        return {
+            'volume_24h': volume.quantize(AMOUNT_QUANT),
+            'high_24h': (high or ZERO).quantize(AMOUNT_QUANT),
+            'low_24h': (low or ZERO).quantize(AMOUNT_QUANT),
+            'change_24h': change.quantize(CHANGE_QUANT),
+        }
+
+
+# --------------------------------------------------------------------------- #
+# Engine                                                                      #
+# --------------------------------------------------------------------------- #
+
+class StatsEngine:
+    def __init__(self, window=WINDOW_MINUTES):
+        self.window = window
+        self.rings = {}          # pair name -> Ring
+        self.prices = {}         # token id -> latest USD price
+        self.priced_at = {}      # token id -> timestamp of that price
+        self.pairs = {}          # token id -> [(pair name, token_in id, token_out id), ...]
+        self.last_price_id = 0
+        self.swaps_read_at = None
+        self._counted = {}       # swap id -> completed_at, for the COMPLETION_LAG overlap
+        self._ticked = set()     # SwapPrice ids in the PRICE_ID_LAG overlap
+
+    def _ring(self, pair: str) -> Ring:
+        ring = self.rings.get(pair)
+        if ring is None:
+            ring = self.rings[pair] = Ring(self.window)
+        return ring
+
+    def load_pairs(self) -> None:
+        routes = SwapRoute.objects.filter(is_active=True).values_list(
+            'token_in_id', 'token_out_id', 'token_in__symbol', 'token_out__symbol',
+        )
+        pairs = {}
+        for token_in, token_out, symbol_in, symbol_out in routes:
+            pair = (pair_name(symbol_in, symbol_out), token_in, token_out)
+            pairs.setdefault(token_in, []).append(pair)
+            pairs.setdefault(token_out, []).append(pair)
+        self.pairs = pairs
+
+    # ------------------------------------------------------------------ #
+    # Events                                                             #
+    # ------------------------------------------------------------------ #
+
+    def record_price(self, token_id, price: Decimal, at) -> None:
+        prices = self.prices
+        if token_id not in self.priced_at or at >= self.priced_at[token_id]:
+            self.prices[token_id] = price
+            self.priced_at[token_id] = at
+        else:
+            prices = {**self.prices, token_id: price}   # a late tick must not replace a newer price
+        minute = _minute(at)
+        for pair, token_in, token_out in self.pairs.get(token_id, ()):
+            if token_in in prices and token_out in prices:
+                self._ring(pair).add_rate(minute, prices[token_in] / prices[token_out])
+
+    def record_tick(self, price_id, token_id, price: Decimal, at) -> bool:
+        if price_id in self._ticked:
+            return False
+        self._ticked.add(price_id)
+        self.record_price(token_id, price, at)
+        return True
+
+    def record_swap(self, swap_id, completed_at, pair: str, amount: Decimal) -> bool:
+        if swap_id in self._counted:
+            return False
+        self._counted[swap_id] = completed_at
+        self._ring(pair).add_volume(_minute(completed_at), amount)
+        return True
+
+    # ------------------------------------------------------------------ #
+    # Reading the tables                                                 #
+    # ------------------------------------------------------------------ #
+
+    def _swaps(self, since):
+        return (
+            SwapTransaction.objects.filter(status='completed', completed_at__gte=since)
+            .order_by('completed_at')
+            .values_list(
+                'id', 'completed_at', 'quote__amount_in',
+                'quote__token_in__symbol', 'quote__token_out__symbol',
+            )
+        )
+
+    def _read_swaps(self, since, now) -> int:
+        counted = 0
+        for swap_id, completed_at, amount, symbol_in, symbol_out in self._swaps(since):
+            counted += self.record_swap(swap_id, completed_at, pair_name(symbol_in, symbol_out), amount)
+        self.swaps_read_at = now
+        # only swaps inside the next poll's overlap can be read twice
+        horizon = now - COMPLETION_LAG
+        self._counted = {swap_id: at for swap_id, at in self._counted.items() if at >= horizon}
+        return counted
+
+    def warm(self, now=None) -> None:
+        """Load the last 24h: one (token, -timestamp) range read per token, one swap range read."""
+        now = now or timezone.now()
+        start = now - timedelta(minutes=self.window)
+        self.load_pairs()
+
+        # taken first: ticks written during the warm-up are left to poll()
+        self.last_price_id = SwapPrice.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        per_token = [
+            SwapPrice.objects.filter(token_id=token_id, timestamp__gte=start, id__lte=self.last_price_id)
+            .order_by('timestamp', 'id')
+            .values_list('timestamp', 'id', 'token_id', 'price_usd')
+            for token_id in SwapToken.objects.filter(is_active=True).values_list('id', flat=True)
+        ]
+        for at, _, token_id, price in heapq.merge(*per_token):
+            self.record_price(token_id, price, at)
+        self._ticked = set(
+            SwapPrice.objects.filter(id__gt=self.last_price_id - PRICE_ID_LAG, id__lte=self.last_price_id)
+            .values_list('id', flat=True)
+        )
+
+        self._read_swaps(start, now)
+
+    def poll(self, batch_size=5000) -> int:
+        """Fold in what was written since the last poll. Returns the events read."""
+        now = timezone.now()
+        if self.swaps_read_at is None:
+            self.warm(now)
+        self.load_pairs()
+        read = 0
+        after = max(self.last_price_id - PRICE_ID_LAG, 0)
+        while True:
+            ticks = list(
+                SwapPrice.objects.filter(id__gt=after)
+                .order_by('id')
+                .values_list('id', 'token_id', 'price_usd', 'timestamp')[:batch_size]
+            )
+            for price_id, token_id, price, at in ticks:
+                read += self.record_tick(price_id, token_id, price, at)
+            if ticks:
+                after = ticks[-1][0]
+            if len(ticks) < batch_size:
+                break
+        self.last_price_id = max(self.last_price_id, after)
+        # only ticks inside the next poll's overlap can be read twice
+        horizon = self.last_price_id - PRICE_ID_LAG
+        self._ticked = {price_id for price_id in self._ticked if price_id > horizon}
+
+        return read + self._read_swaps(self.swaps_read_at - COMPLETION_LAG, now)
+
+    # ------------------------------------------------------------------ #
+    # Output                                                             #
+    # ------------------------------------------------------------------ #
+
+    def flush(self, now=None) -> int:
+        """Write one MarketStats row per pair and refresh the read cache."""
+        now = now or timezone.now()
+        now_minute = _minute(now)
+        snapshots = {pair: ring.snapshot(now_minute) for pair, ring in self.rings.items()}
+
+        rows = {}
+        for row in MarketStats.objects.filter(token_pair__in=list(snapshots)).order_by('id'):
+            rows.setdefault(row.token_pair, row)
+        updated, created = [], []
+        for pair, values in snapshots.items():
+            row = rows.get(pair)
+            if row is None:
+                row = MarketStats(token_pair=pair)
+                created.append(row)
+            else:
+                updated.append(row)
+            for field, value in values.items():
+                setattr(row, field, value)
+            row.last_updated = now
+        fields = ['volume_24h', 'high_24h', 'low_24h', 'change_24h', 'last_updated']
+        MarketStats.objects.bulk_update(updated, fields)
+        MarketStats.objects.bulk_create(created)
+
+        publish(MarketStatsSerializer(_stats_rows(), many=True).data)
+        return len(snapshots)
+
+
+def _stats_rows():
+    return MarketStats.objects.order_by('token_pair', 'id')
+
+
+# --------------------------------------------------------------------------- #
+# Read cache                                                                  #
+# --------------------------------------------------------------------------- #
+
+def publish(data: list) -> None:
+    cache.set(CACHE_KEY, data, settings.XUSDT_SETTINGS['SWAP_MARKET_STATS_CACHE_SECONDS'])
+
+
+def cached_stats() -> list:
+    """Serialized MarketStats rows, from the cache when they are there."""
+    data = cache.get(CACHE_KEY)
+    if data is None:
+        data = MarketStatsSerializer(_stats_rows(), many=True).data
+        publish(data)
+    return data
@@ -0,0 +1,798 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from eth_abi import decode, encode
+from web3 import Web3
+
+from apps.core import events
+from apps.core.catalog import Catalog
+from apps.core.models import AnonymousUser
+from . import allowances, candles, prices, stats
+from .exceptions import AllowanceUnavailable, ChainUnavailable, InvalidAddress
+from .routing import RouteGraph
+from .execution import LOCAL_EXECUTOR_ADDRESS, LocalChain, LocalChainBackend, SwapExecutor
+from .models import (
+    MarketStats, SwapAllowance, SwapCandle, SwapExecutorNonce, SwapPrice, SwapQuote, SwapRollupWatermark, SwapRoute, SwapToken,
+    SwapTransaction,
+)
+
+ETH_ADDRESS = '0x' + '11' * 20
+USDT_ADDRESS = '0x' + '22' * 20
+DAI_ADDRESS = '0x' + '33' * 20
+ALICE = '0x' + 'aa' * 20
+BOB = '0x' + 'bb' * 20
+
+
+def create_user(exchange_code):
+    user = AnonymousUser(exchange_code=exchange_code)
+    user.set_password('pw123456')
+    user.save()
+    return user
+
+
+class SwapFixtureMixin:
+    """ETH and USDT with a direct ETH -> USDT route and fresh prices."""
+
+    def setUp(self):
+        super().setUp()
+        self.eth = SwapToken.objects.create(
+            symbol='ETH', name='Ether', network='ethereum', contract_address=ETH_ADDRESS, decimals=18,
+        )
+        self.usdt = SwapToken.objects.create(
+            symbol='USDT', name='Tether', network='ethereum', contract_address=USDT_ADDRESS, decimals=6,
+        )
+        self.route = SwapRoute.objects.create(
+            token_in=self.eth, token_out=self.usdt, fee_percentage=Decimal('0.3'),
+            min_amount_in=Decimal('0'), max_amount_in=Decimal('100'),
+        )
+        prices.publish({'ETH': Decimal('3000'), 'USDT': Decimal('1')}, timezone.now())
+        self.user = create_user('EX-SWAPR01')
+
+    def post(self, name, data):
+        return self.client.post(
+            reverse(name), data, content_type='application/json',
+            HTTP_X_CLIENT_TOKEN=self.user.client_token,
+        )
+
+    def quote(self, amount_in='1'):
+        response = self.post('swap-quote', {'token_in': 'ETH', 'token_out': 'USDT', 'amount_in': amount_in})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def execute(self, quote_token, from_address=ALICE, to_address=BOB):
+        return self.post('swap-execute', {
+            'quote_token': quote_token, 'from_address': from_address, 'to_address': to_address,
+        })
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ExecuteSwapTests(SwapFixtureMixin, TestCase):
+
+    def test_quote_token_executes_once(self):
+        token = self.quote()['quote_token']
+        response = self.execute(token)
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['status'], 'queued')
+
+        self.assertEqual(self.execute(token).status_code, 409)
+        self.assertEqual(SwapTransaction.objects.count(), 1)
+
+    def test_legacy_quote_id_executes_once(self):
+        quote = SwapQuote.objects.create(
+            token_in=self.eth, token_out=self.usdt, amount_in=Decimal('1'), amount_out=Decimal('2990'),
+            rate=Decimal('3000'), fee_amount=Decimal('0.003'),
+            valid_until=timezone.now() + timedelta(minutes=5),
+        )
+        data = {'quote_id': str(quote.pk), 'from_address': ALICE, 'to_address': BOB}
+        self.assertEqual(self.post('swap-execute', data).status_code, 202)
+        self.assertEqual(self.post('swap-execute', data).status_code, 409)
+        self.assertEqual(SwapTransaction.objects.filter(quote=quote).count(), 1)
+
+    def test_addresses_are_validated_and_checksummed(self):
+        token = self.quote()['quote_token']
+        response = self.execute(token, to_address='not-an-address')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('to_address', response.json())
+
+        response = self.post('swap-execute', {'quote_token': token, 'from_address': ALICE})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('to_address', response.json())
+
+        # a rejected request does not use the quote up
+        response = self.execute(token)
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['to_address'], Web3.to_checksum_address(BOB))
+
+    def test_tampered_token_is_rejected(self):
+        token = self.quote()['quote_token']
+        tampered = token[:-4] + ('AAAA' if not token.endswith('AAAA') else 'BBBB')
+        self.assertEqual(self.execute(tampered).status_code, 400)
+
+
+class StaticFeed(prices.PriceFeed):
+    def __init__(self, quotes):
+        self.quotes = quotes
+
+    def fetch(self):
+        return self.parse(self.quotes)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PriceTests(SwapFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_quote_after_ingest(self):
+        self.assertEqual(self.post('swap-quote', {'token_in': 'ETH', 'token_out': 'USDT', 'amount_in': '1'}).status_code, 503)
+
+        self.assertEqual(prices.ingest([StaticFeed({'ETH': '3000', 'USDT': '1'}), StaticFeed({'ETH': '3100'})]), 2)
+        quote = self.quote()
+        self.assertEqual(Decimal(quote['rate']), Decimal('3050'))    # median of the two feeds
+
+    def test_price_missing_from_the_cache_is_read_from_the_database(self):
+        # ingested by another process whose cache this one does not see
+        SwapPrice.objects.create(token=self.eth, price_usd=Decimal('2000'))
+        SwapPrice.objects.create(token=self.usdt, price_usd=Decimal('1'))
+        self.assertEqual(Decimal(self.quote()['rate']), Decimal('2000'))
+        self.assertEqual(set(prices.latest_prices(['ETH', 'USDT'])), {'ETH', 'USDT'})
+        self.assertIsNotNone(cache.get(prices.cache_key('ETH')))
+
+    def test_stale_price_is_refused(self):
+        prices.publish({'ETH': Decimal('3000'), 'USDT': Decimal('1')}, timezone.now() - timedelta(hours=1))
+        response = self.post('swap-quote', {'token_in': 'ETH', 'token_out': 'USDT', 'amount_in': '1'})
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RouteGraphTests(SwapFixtureMixin, TestCase):
+    PRICES = {'ETH': Decimal('3000'), 'USDT': Decimal('1'), 'DAI': Decimal('1')}
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.dai = SwapToken.objects.create(
+            symbol='DAI', name='Dai', network='ethereum', contract_address=DAI_ADDRESS, decimals=18,
+        )
+        SwapRoute.objects.filter(pk=self.route.pk).update(fee_percentage=Decimal('5'))
+        self.eth_dai = self.add_route(self.eth, self.dai)
+        self.dai_usdt = self.add_route(self.dai, self.usdt)
+        self.graph = RouteGraph(ttl=3600)
+
+    def add_route(self, token_in, token_out, **fields):
+        fields = {'fee_percentage': Decimal('0.1'), 'min_amount_in': Decimal('0'),
+                  'max_amount_in': Decimal('1000000'), **fields}
+        return SwapRoute.objects.create(token_in=token_in, token_out=token_out, **fields)
+
+    def best(self, prices=PRICES, **kwargs):
+        path = self.graph.best_path('ETH', 'USDT', Decimal('1'), prices, **kwargs)
+        if path is None:
+            return None
+        return [(edge.token_in, edge.token_out) for edge, _, _ in path.hops], path.amount_out
+
+    def test_cheaper_two_hop_path_beats_the_direct_route(self):
+        self.assertEqual(
+            self.best(),
+            ([('ETH', 'DAI'), ('DAI', 'USDT')], Decimal('3000') * Decimal('0.999') * Decimal('0.999')),
+        )
+        self.assertEqual(self.best(max_hops=1), ([('ETH', 'USDT')], Decimal('3000') * Decimal('0.95')))
+
+    def test_hops_respect_route_bounds_and_prices(self):
+        SwapRoute.objects.filter(pk=self.dai_usdt.pk).update(max_amount_in=Decimal('1000'))
+        self.graph.reload()
+        self.assertEqual(self.best()[0], [('ETH', 'USDT')])     # the DAI hop would get 2997
+
+        prices = {symbol: price for symbol, price in self.PRICES.items() if symbol != 'DAI'}
+        SwapRoute.objects.filter(pk=self.route.pk).delete()
+        self.graph.reload()
+        self.assertIsNone(self.best(prices))                   # no price, no routing through DAI
+
+    def test_route_changes_reach_every_graph(self):
+        other = RouteGraph(ttl=3600)
+        self.assertEqual(len(self.best()[0]), 2)
+        self.assertEqual(len(other.best_path('ETH', 'USDT', Decimal('1'), self.PRICES).hops), 2)
+
+        self.eth_dai.is_active = False
+        self.eth_dai.save()
+        self.graph.route_saved(self.eth_dai)    # what the on_commit receiver does
+        self.assertEqual(self.best()[0], [('ETH', 'USDT')])
+        # another process notices the version bump and reloads
+        self.assertEqual(len(other.best_path('ETH', 'USDT', Decimal('1'), self.PRICES).hops), 1)
+
+    def test_quote_carries_the_multi_hop_path(self):
+        prices.publish(self.PRICES, timezone.now())
+        with mock.patch('apps.swap.views.route_graph', self.graph):
+            quote = self.quote()
+        self.assertEqual([(hop['token_in'], hop['token_out']) for hop in quote['path']], [('ETH', 'DAI'), ('DAI', 'USDT')])
+        self.assertEqual(Decimal(quote['amount_out']), Decimal('2994.003'))
+
+
+class QuoteCompactionTests(SwapFixtureMixin, TestCase):
+
+    def stored_quote(self, expired_for):
+        return SwapQuote.objects.create(
+            token_in=self.eth, token_out=self.usdt, amount_in=Decimal('1'), amount_out=Decimal('2991'),
+            rate=Decimal('3000'), fee_amount=Decimal('9'), valid_until=timezone.now() - expired_for,
+        )
+
+    def test_only_unexecuted_quotes_past_retention_are_deleted(self):
+        dead = [self.stored_quote(timedelta(hours=2)) for _ in range(3)]
+        executed = self.stored_quote(timedelta(hours=2))
+        SwapTransaction.objects.create(
+            user_token=self.user.user_token, quote=executed, from_address=ALICE, to_address=BOB,
+        )
+        recent = self.stored_quote(timedelta(minutes=30))
+
+        out = StringIO()
+        call_command('compact_swap_quotes', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), '3 expired swap quotes deleted')
+        self.assertFalse(SwapQuote.objects.filter(pk__in=[quote.pk for quote in dead]).exists())
+        self.assertEqual(set(SwapQuote.objects.values_list('pk', flat=True)), {executed.pk, recent.pk})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CandleTests(SwapFixtureMixin, TestCase):
+    START = datetime(2026, 1, 5, 10, 0, tzinfo=dt_timezone.utc)
+
+    def tick(self, price, at, token=None):
+        return SwapPrice.objects.create(token=token or self.eth, price_usd=Decimal(price), timestamp=at)
+
+    def candle(self, interval, open_time):
+        c = SwapCandle.objects.get(token=self.eth, interval=interval, open_time=open_time)
+        return [c.open, c.high, c.low, c.close, c.ticks]
+
+    def test_ticks_fold_into_every_interval(self):
+        for price, seconds in (('3000', 10), ('3100', 20), ('2900', 30), ('3050', 70)):
+            self.tick(price, self.START + timedelta(seconds=seconds))
+        self.tick('1', self.START, token=self.usdt)
+
+        self.assertEqual(candles.rollup(batch_size=2), 5)
+        self.assertEqual(self.candle('1m', self.START), [3000, 3100, 2900, 2900, 3])
+        self.assertEqual(self.candle('1m', self.START + timedelta(minutes=1)), [3050, 3050, 3050, 3050, 1])
+        for interval in ('5m', '1h'):
+            self.assertEqual(self.candle(interval, self.START), [3000, 3100, 2900, 3050, 4])
+        self.assertEqual(self.candle('1d', self.START.replace(hour=0)), [3000, 3100, 2900, 3050, 4])
+        self.assertEqual(SwapCandle.objects.filter(token=self.usdt).count(), 4)
+
+    def test_watermark_folds_each_tick_once(self):
+        self.tick('3000', self.START)
+        self.assertEqual(candles.rollup(), 1)
+        self.assertEqual(candles.rollup(), 0)
+
+        latest = self.tick('3200', self.START + timedelta(seconds=5))
+        self.assertEqual(candles.rollup(), 1)
+        self.assertEqual(self.candle('1m', self.START), [3000, 3200, 3000, 3200, 2])
+        self.assertEqual(SwapRollupWatermark.objects.get(name=candles.WATERMARK).last_id, latest.id)
+
+    def test_rollup_folds_ticks_committed_after_a_higher_id(self):
+        first = self.tick('3000', self.START)
+        late = self.tick('3500', self.START + timedelta(seconds=5))
+        last = self.tick('3200', self.START + timedelta(seconds=10))
+        late_id, late.id = late.id, None
+        SwapPrice.objects.filter(id=late_id).delete()   # not committed yet when the rollup runs
+        self.assertEqual(candles.rollup(), 2)
+        self.assertEqual(self.candle('1m', self.START), [3000, 3200, 3000, 3200, 2])
+
+        late.id = late_id
+        late.save(force_insert=True)
+        self.assertEqual(candles.rollup(), 1)
+        self.assertEqual(candles.rollup(), 0)
+        self.assertEqual(self.candle('1m', self.START), [3000, 3500, 3000, 3200, 3])   # close kept
+        mark = SwapRollupWatermark.objects.get(name=candles.WATERMARK)
+        self.assertEqual((mark.last_id, mark.folded_ids), (last.id, [first.id, late_id, last.id]))
+
+    def test_retention_thins_rolled_up_ticks_and_drops_short_candles(self):
+        now = self.START + timedelta(days=10)
+        old = [self.tick('3000', self.START + timedelta(minutes=minute)) for minute in (5, 10, 20, 65)]
+        recent = self.tick('3000', now - timedelta(days=1))
+        candles.rollup()
+        # written after the rollup: not thinned until folded
+        pending = [self.tick('3000', self.START + timedelta(minutes=minute)) for minute in (125, 130)]
+
+        result = candles.apply_retention(now=now)
+        self.assertEqual(result, {'ticks_thinned': 2, 'candles_expired': 4})
+        kept = set(SwapPrice.objects.filter(token=self.eth).values_list('pk', flat=True))
+        self.assertEqual(kept, {old[2].pk, old[3].pk, recent.pk, *(tick.pk for tick in pending)})
+        intervals = SwapCandle.objects.filter(open_time__lt=now - timedelta(days=2)).values_list('interval', flat=True)
+        self.assertEqual(set(intervals), {'5m', '1h', '1d'})
+
+    def test_endpoint_returns_the_latest_candles_oldest_first(self):
+        for minute in range(5):
+            self.tick(str(3000 + minute), self.START + timedelta(minutes=minute))
+        candles.rollup()
+
+        def get(**params):
+            response = self.client.get(
+                reverse('swap-candles'), {'token': 'ETH', 'interval': '1m', **params},
+                HTTP_X_CLIENT_TOKEN=self.user.client_token,
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+            return [Decimal(c['close']) for c in response.json()]
+
+        self.assertEqual(get(limit=2), [3003, 3004])
+        self.assertEqual(get(start=self.START.timestamp() + 60, limit=2), [3001, 3002])
+
+
+class StatsRingTests(TestCase):
+
+    def test_buckets_are_reset_when_the_ring_wraps(self):
+        ring = stats.Ring(size=3)
+        for minute, amount, rate in ((10, '1', '100'), (11, '2', '110'), (12, '4', '90')):
+            ring.add_volume(minute, Decimal(amount))
+            ring.add_rate(minute, Decimal(rate))
+        self.assertEqual(ring.snapshot(12), {
+            'volume_24h': Decimal('7'), 'high_24h': Decimal('110'),
+            'low_24h': Decimal('90'), 'change_24h': Decimal('-10.00'),
+        })
+
+        ring.add_rate(13, Decimal('120'))     # takes minute 10's bucket
+        ring.add_volume(10, Decimal('50'))    # older than the window: dropped
+        snapshot = ring.snapshot(13)
+        self.assertEqual((snapshot['volume_24h'], snapshot['high_24h']), (Decimal('6'), Decimal('120')))
+        self.assertEqual(snapshot['change_24h'], Decimal('9.09'))   # 110 -> 120
+
+    def test_snapshot_skips_buckets_outside_the_window(self):
+        ring = stats.Ring(size=3)
+        ring.add_volume(10, Decimal('5'))
+        ring.add_rate(10, Decimal('100'))
+        self.assertEqual(ring.snapshot(13), {
+            'volume_24h': Decimal('0'), 'high_24h': Decimal('0'),
+            'low_24h': Decimal('0'), 'change_24h': Decimal('0'),
+        })
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class StatsEngineTests(SwapFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.now = timezone.now()
+
+    def tick(self, token, price, ago=timedelta(0)):
+        SwapPrice.objects.create(token=token, price_usd=Decimal(price), timestamp=self.now - ago)
+
+    def swap(self, amount_in, ago=timedelta(0), status='completed'):
+        quote = SwapQuote.objects.create(
+            token_in=self.eth, token_out=self.usdt, amount_in=Decimal(amount_in), amount_out=Decimal('0'),
+            rate=Decimal('3000'), fee_amount=Decimal('0'), valid_until=self.now,
+        )
+        SwapTransaction.objects.create(
+            user_token=self.user.user_token, quote=quote, from_address=ALICE, to_address=BOB,
+            status=status, completed_at=self.now - ago,
+        )
+
+    def stats(self):
+        row = MarketStats.objects.get(token_pair='ETH_USDT')
+        return row.volume_24h, row.high_24h, row.low_24h, row.change_24h
+
+    def test_warm_poll_and_flush(self):
+        self.tick(self.eth, '2800', timedelta(hours=25))     # before the window
+        self.tick(self.usdt, '1', timedelta(hours=23))
+        self.tick(self.eth, '3000', timedelta(hours=23))
+        self.tick(self.eth, '3300', timedelta(hours=2))
+        self.tick(self.eth, '2700', timedelta(hours=1))
+        self.swap('2', timedelta(minutes=30))
+        self.swap('5', timedelta(hours=25))
+        self.swap('7', status='pending')
+
+        engine = stats.StatsEngine()
+        engine.warm(self.now)
+        self.assertEqual(engine.flush(self.now), 1)
+        self.assertEqual(self.stats(), (2, 3300, 2700, Decimal('-10.00')))
+
+        self.tick(self.eth, '3600')
+        self.swap('1')
+        self.assertEqual(engine.poll(), 2)
+        self.assertEqual(engine.poll(), 0)     # the overlap re-reads the swap but counts it once
+        engine.flush(self.now)
+        self.assertEqual(self.stats(), (3, 3600, 2700, Decimal('20.00')))
+
+    def test_poll_picks_up_ticks_committed_after_a_higher_id(self):
+        self.tick(self.usdt, '1', timedelta(hours=1))
+        self.tick(self.eth, '3000', timedelta(hours=1))
+        engine = stats.StatsEngine()
+        engine.warm(self.now)
+
+        self.tick(self.eth, '3100', timedelta(minutes=2))
+        self.tick(self.eth, '3900', timedelta(minutes=1))
+        self.tick(self.eth, '3200')
+        late = SwapPrice.objects.order_by('-id')[1]
+        late_id, late.id = late.id, None
+        SwapPrice.objects.filter(id=late_id).delete()   # not committed yet when the engine polls
+        self.assertEqual(engine.poll(), 2)
+
+        late.id = late_id
+        late.save(force_insert=True)
+        self.assertEqual(engine.poll(), 1)
+        self.assertEqual(engine.poll(), 0)
+        self.assertEqual(engine.prices[self.eth.id], Decimal('3200'))   # the late tick is older
+        engine.flush(self.now)
+        self.assertEqual(self.stats()[1:3], (3900, 3000))
+
+    def test_view_serves_the_flushed_rows(self):
+        self.tick(self.usdt, '1')
+        self.tick(self.eth, '3000')
+        engine = stats.StatsEngine()
+        engine.warm(self.now)
+        engine.flush(self.now)
+
+        MarketStats.objects.all().delete()      # served from the cache
+        response = self.client.get(
+            reverse('swap-market-stats'), {'pair': 'ETH_USDT'}, HTTP_X_CLIENT_TOKEN=self.user.client_token,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['token_pair'], Decimal(row['high_24h'])) for row in response.json()], [('ETH_USDT', 3000)])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CatalogTests(SwapFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        catalog = Catalog('swap', ttl=3600)
+        for module in ('apps.swap.views', 'apps.swap.receivers'):
+            patcher = mock.patch(f'{module}.catalog', catalog)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, name, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse(name), params, HTTP_X_CLIENT_TOKEN=self.user.client_token, **headers)
+
+    def test_current_etag_gets_an_empty_304(self):
+        response = self.get('swap-tokens')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([token['symbol'] for token in response.json()], ['ETH', 'USDT'])
+        etag = response['ETag']
+
+        for if_none_match in (etag, f'"stale", W/{etag}', '*'):
+            response = self.get('swap-tokens', etag=if_none_match)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get('swap-tokens', etag='"stale"').status_code, 200)
+
+    def test_snapshot_hit_runs_no_catalog_query(self):
+        self.get('swap-routes', token_in='ETH')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('swap-routes', token_in='ETH')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'swap_swaproute' in q['sql']])
+
+    def test_each_query_has_its_own_etag(self):
+        everything = self.get('swap-routes')
+        none = self.get('swap-routes', token_in='USDT')
+        self.assertEqual(len(everything.json()), 1)
+        self.assertEqual(none.json(), [])
+        self.assertNotEqual(everything['ETag'], none['ETag'])
+
+    def test_saved_token_invalidates_the_snapshot(self):
+        etag = self.get('swap-tokens')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usdt.name = 'Tether USD'
+            self.usdt.save()
+
+        response = self.get('swap-tokens', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Tether USD', [token['name'] for token in response.json()])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SwapHistoryTests(SwapFixtureMixin, TestCase):
+
+    def swap(self, created_at):
+        quote = SwapQuote.objects.create(
+            token_in=self.eth, token_out=self.usdt, amount_in=Decimal('1'), amount_out=Decimal('2991'),
+            rate=Decimal('3000'), fee_amount=Decimal('9'), valid_until=created_at,
+        )
+        swap = SwapTransaction.objects.create(
+            user_token=self.user.user_token, quote=quote, from_address=ALICE, to_address=BOB,
+        )
+        SwapTransaction.objects.filter(pk=swap.pk).update(created_at=created_at)
+        return swap
+
+    def test_pages_follow_created_at_then_id(self):
+        now = timezone.now()
+        tied = sorted((self.swap(now) for _ in range(3)), key=lambda swap: swap.pk, reverse=True)
+        older = self.swap(now - timedelta(minutes=1))
+
+        url, seen = f"{reverse('swap-history')}?page_size=2", []
+        while url:
+            response = self.client.get(url, HTTP_X_CLIENT_TOKEN=self.user.client_token)
+            self.assertEqual(response.status_code, 200, response.content)
+            seen.append([row['id'] for row in response.json()['results']])
+            url = response.json()['next']
+        self.assertEqual(seen, [[str(tied[0].pk), str(tied[1].pk)], [str(tied[2].pk), str(older.pk)]])
+
+
+class DownBackend(LocalChainBackend):
+    """Signs, but every broadcast fails."""
+
+    def broadcast(self, raw_tx):
+        raise ChainUnavailable("connection refused")
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SwapExecutorTests(SwapFixtureMixin, TestCase):
+    ETH = 10 ** 18
+
+    def setUp(self):
+        super().setUp()
+        self.chain = LocalChain(automine=False)
+        self.executor = SwapExecutor(LocalChainBackend(self.chain))
+        self.chain.mint(USDT_ADDRESS, LOCAL_EXECUTOR_ADDRESS, 10_000 * 10 ** 6)
+
+    def fund(self, amount=ETH, approve=ETH):
+        self.chain.mint(ETH_ADDRESS, ALICE, amount)
+        self.chain.approve(ETH_ADDRESS, ALICE, LOCAL_EXECUTOR_ADDRESS, approve)
+
+    def queue_swap(self):
+        response = self.execute(self.quote()['quote_token'])
+        self.assertEqual(response.status_code, 202, response.content)
+        return SwapTransaction.objects.get(pk=response.json()['id'])
+
+    def step(self, mine=True):
+        if mine:
+            self.chain.mine()
+        return self.executor.run_once()
+
+    def test_swap_is_collected_before_it_is_paid_out(self):
+        self.fund()
+        swap = self.queue_swap()
+
+        self.assertEqual(self.step(mine=False)['collecting'], 1)
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'collecting')
+        self.assertIsNone(swap.tx_hash)
+        self.assertEqual(self.chain.balance_of(USDT_ADDRESS, BOB), 0)
+
+        counts = self.step()
+        self.assertEqual((counts['collected'], counts['submitted']), (1, 1))
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'submitted')
+        self.assertEqual(swap.amount_received, Decimal('1'))
+        self.assertEqual(self.chain.balance_of(ETH_ADDRESS, LOCAL_EXECUTOR_ADDRESS), self.ETH)
+
+        self.assertEqual(self.step()['completed'], 1)
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'completed')
+        self.assertIsNotNone(swap.completed_at)
+        self.assertEqual(swap.signed_tx, '')
+        self.assertEqual(
+            self.chain.balance_of(USDT_ADDRESS, BOB),
+            int(swap.quote.amount_out * 10 ** 6),
+        )
+        self.assertEqual(SwapExecutorNonce.objects.get().next_nonce, 2)
+
+    def test_swap_without_allowance_fails_without_transactions(self):
+        self.fund(approve=self.ETH // 2)
+        swap = self.queue_swap()
+
+        self.step()
+        self.step()
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'failed')
+        self.assertIn('allowance', swap.error)
+        self.assertIsNone(swap.amount_received)
+        self.assertIsNone(swap.refund_tx_hash)
+        self.assertEqual(self.chain.mined, {})
+
+    def test_reverted_deposit_is_not_refunded(self):
+        self.fund()
+        swap = self.queue_swap()
+        self.step(mine=False)
+        # the funds move away between the check and the pull
+        self.chain.balances[(ETH_ADDRESS, ALICE)] = 0
+
+        self.step()
+        self.step()
+        swap.refresh_from_db()
+        self.assertEqual((swap.status, swap.error), ('failed', 'Deposit transfer reverted'))
+        self.assertIsNone(swap.refund_tx_hash)
+        self.assertEqual(self.chain.balance_of(USDT_ADDRESS, BOB), 0)
+
+    def test_failed_payout_refunds_what_was_collected(self):
+        self.fund()
+        self.chain.balances[(USDT_ADDRESS, LOCAL_EXECUTOR_ADDRESS)] = 0
+        swap = self.queue_swap()
+
+        self.step(mine=False)       # pull
+        self.step()                 # collected, payout sent
+        counts = self.step()        # payout reverted, refund sent
+        self.assertEqual((counts['failed'], counts['refunding']), (1, 1))
+        self.assertEqual(self.step()['refunded'], 1)
+
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'refunded')
+        self.assertEqual(swap.error, 'Swap transaction reverted')
+        self.assertEqual(self.chain.balance_of(ETH_ADDRESS, ALICE), self.ETH)
+        self.assertEqual(self.chain.balance_of(ETH_ADDRESS, LOCAL_EXECUTOR_ADDRESS), 0)
+
+    def test_taken_nonce_is_resynced_and_the_transfer_signed_again(self):
+        self.fund()
+        backend = self.executor.backend
+        # another client of the hot wallet used nonces 0 and 1
+        SwapExecutorNonce.objects.create(address=LOCAL_EXECUTOR_ADDRESS, next_nonce=0)
+        for nonce in (0, 1):
+            self.chain.send(backend.sign_transfer(USDT_ADDRESS, BOB, 1, nonce)[1])
+        self.chain.mine()
+        swap = self.queue_swap()
+
+        broker = mock.Mock()
+        with mock.patch.object(events, '_broker', broker), self.captureOnCommitCallbacks(execute=True):
+            self.step(mine=False)
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'collecting')
+        self.assertEqual(swap.nonce, 2)     # re-signed within the same pass
+        pushed = [event['data']['status'] for call in broker.publish.call_args_list for event in call.args[0]]
+        self.assertEqual(pushed, ['collecting', 'queued', 'collecting'])
+
+        self.step()
+        self.step()
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'completed')
+        self.assertEqual(SwapExecutorNonce.objects.get().next_nonce, 4)
+
+    def test_settled_swaps_reach_the_event_stream(self):
+        broker = mock.Mock()
+        self.fund(amount=2 * self.ETH, approve=2 * self.ETH)
+        with mock.patch.object(events, '_broker', broker), self.captureOnCommitCallbacks(execute=True):
+            completed = self.queue_swap()
+            for _ in range(3):
+                self.step()
+            failed = self.queue_swap()
+            self.step(mine=False)
+            self.chain.balances[(ETH_ADDRESS, ALICE)] = 0
+            self.step()
+
+        pushed = [
+            (event['data']['id'], event['data']['status'])
+            for call in broker.publish.call_args_list for event in call.args[0]
+        ]
+        self.assertEqual(
+            [status for swap_id, status in pushed if swap_id == str(completed.pk)],
+            ['queued', 'collecting', 'collected', 'submitted', 'completed'],
+        )
+        self.assertEqual(
+            [status for swap_id, status in pushed if swap_id == str(failed.pk)],
+            ['queued', 'collecting', 'failed'],
+        )
+
+    def test_stored_transaction_is_rebroadcast_after_a_failed_send(self):
+        self.fund()
+        swap = self.queue_swap()
+        SwapExecutor(DownBackend(self.chain)).run_once()
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'collecting')
+        self.assertEqual(self.chain.mempool, {})
+
+        # a fresh worker finds the stored bytes unmined and sends them again
+        self.assertEqual(self.step(mine=False)['pending'], 1)
+        self.chain.mine()
+        self.assertEqual(self.chain.mined, {swap.deposit_tx_hash: True})
+
+
+class FakeMulticall:
+    """Answers aggregate3 from ``table`` {(token, owner, spender): raw | 'revert' | 'short'}."""
+
+    def __init__(self, table):
+        self.table = {tuple(a.lower() for a in key): value for key, value in table.items()}
+        self.calls = []     # (block, [(target, allow_failure, call_data), ...]) per eth_call
+        self.functions = self
+
+    def aggregate3(self, calls):
+        return mock.Mock(call=lambda block_identifier: self._call(block_identifier, calls))
+
+    def _call(self, block, calls):
+        self.calls.append((block, calls))
+        results = []
+        for target, _, data in calls:
+            owner, spender = decode(['address', 'address'], data[4:])
+            value = self.table.get((target.lower(), owner.lower(), spender.lower()), 0)
+            if value == 'revert':
+                results.append((False, b''))
+            elif value == 'short':
+                results.append((True, b'\x01'))
+            else:
+                results.append((True, encode(['uint256'], [value])))
+        return results
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AllowanceTests(SwapFixtureMixin, TestCase):
+    SPENDER = '0x' + 'cc' * 20
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.chain = FakeMulticall({
+            (USDT_ADDRESS, ALICE, self.SPENDER): 5 * 10 ** 6,
+            (ETH_ADDRESS, ALICE, self.SPENDER): 'revert',
+            (ETH_ADDRESS, BOB, self.SPENDER): 'short',
+        })
+        self.w3 = mock.Mock()
+        self.w3.eth.block_number = 100
+        for name, value in (('multicall', self.chain), ('w3', self.w3)):
+            patcher = mock.patch.object(allowances, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_multicall_results_are_decoded(self):
+        keys = [
+            (USDT_ADDRESS, ALICE, self.SPENDER),
+            (ETH_ADDRESS, ALICE, self.SPENDER),
+            (ETH_ADDRESS, BOB, self.SPENDER),
+        ]
+        block, values = allowances.read_allowances(keys)
+        self.assertEqual(block, 100)
+        self.assertEqual(values, dict(zip(keys, [5 * 10 ** 6, None, None])))
+
+        (read_at, calls), = self.chain.calls
+        self.assertEqual(read_at, 100)
+        target, allow_failure, data = calls[0]
+        self.assertEqual((target, allow_failure), (Web3.to_checksum_address(USDT_ADDRESS), True))
+        self.assertEqual(data[:4], allowances.ALLOWANCE_SELECTOR)
+        self.assertEqual(
+            [a.lower() for a in decode(['address', 'address'], data[4:])], [ALICE, self.SPENDER]
+        )
+
+    def test_reads_are_cached_per_block(self):
+        key = (USDT_ADDRESS, ALICE, self.SPENDER)
+        allowances.read_allowances([key])
+        allowances.read_allowances([key, key])
+        self.assertEqual(len(self.chain.calls), 1)
+
+        self.w3.eth.block_number = 101
+        self.assertEqual(allowances.read_allowances([key]), (101, {key: 5 * 10 ** 6}))
+        allowances.read_allowances([key], block=100)
+        self.assertEqual([block for block, _ in self.chain.calls], [100, 101])
+
+    def test_malformed_address_is_refused_before_reading(self):
+        with self.assertRaises(InvalidAddress):
+            allowances.read_allowances([(USDT_ADDRESS, '0xnot-an-address', self.SPENDER)])
+        self.assertEqual(self.chain.calls, [])
+
+    def test_unreachable_chain_is_unavailable(self):
+        self.chain.aggregate3 = mock.Mock(side_effect=ConnectionError('connection refused'))
+        with self.assertRaises(AllowanceUnavailable):
+            allowances.read_allowances([(USDT_ADDRESS, ALICE, self.SPENDER)])
+
+    def test_posted_allowance_is_read_on_chain_or_marked_unverified(self):
+        response = self.post('swap-allowance', {
+            'token': 'USDT', 'contract_address': self.SPENDER, 'owner_address': ALICE,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Decimal(response.json()['allowance_amount']), Decimal('5'))
+        self.assertTrue(response.json()['verified'])
+
+        response = self.post('swap-allowance', {'token': 'ETH', 'contract_address': self.SPENDER, 'amount': '7'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(response.json()['verified'])
+        self.assertEqual(SwapAllowance.objects.count(), 2)
+
+    def test_malformed_addresses_are_bad_requests(self):
+        response = self.post('swap-allowance', {
+            'token': 'USDT', 'contract_address': '0x' + 'zz' * 20, 'owner_address': ALICE,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('contract_address', response.json())
+
+        SwapToken.objects.filter(pk=self.usdt.pk).update(contract_address='0x1234')
+        response = self.post('swap-allowance', {
+            'token': 'USDT', 'contract_address': self.SPENDER, 'owner_address': ALICE,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.chain.calls, [])
@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     TokenListView, RouteListView, QuoteCreateView,
     ExecuteSwapView, SwapStatusView, SwapHistoryView,
-    PriceListView, MarketStatsView, AllowanceView
+    PriceListView, CandleListView, MarketStatsView, AllowanceView
 )
 
 urlpatterns = [
@@ -13,6 +13,7 @@ urlpatterns = [
     path('status/<uuid:tx_id>/', SwapStatusView.as_view(), name='swap-status'),
     path('history/', SwapHistoryView.as_view(), name='swap-history'),
     path('prices/', PriceListView.as_view(), name='swap-prices'),
+    path('candles/', CandleListView.as_view(), name='swap-candles'),
     path('market-stats/', MarketStatsView.as_view(), name='swap-market-stats'),
     path('allowance/', AllowanceView.as_view(), name='swap-allowance'),
 ]
\ No newline at end of file
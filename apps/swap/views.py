@@ -1,41 +1,60 @@
+import logging
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import generics, status
 from .models import (
     SwapToken, SwapRoute, SwapQuote, SwapTransaction,
-    SwapAllowance, SwapPrice, MarketStats
+    SwapAllowance, SwapPrice, SwapCandle
 )
 from .serializers import (
     TokenSerializer, RouteSerializer, QuoteSerializer,
-    TransactionSerializer, AllowanceSerializer,
-    PriceSerializer, MarketStatsSerializer
+    TransactionSerializer, AllowanceSerializer, AllowanceRequestSerializer,
+    PriceSerializer, CandleSerializer, CandleQuerySerializer,
+    SwapExecuteRequestSerializer
 )
+from apps.core import quotes
+from apps.core.pagination import KeysetPagination
+from . import allowances as allowance_service
+from . import prices
+from .catalog import catalog
+from . import stats as market_stats
+from .exceptions import AllowanceUnavailable, InvalidAddress, PriceUnavailable
+from .routing import AMOUNT_QUANT, route_graph
 import uuid
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
 from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 
+logger = logging.getLogger(__name__)
+
 class TokenListView(APIView):
     def get(self, request):
-        tokens = SwapToken.objects.filter(is_active=True)
-        serializer = TokenSerializer(tokens, many=True)
-        return Response(serializer.data)
+        def build():
+            tokens = SwapToken.objects.filter(is_active=True)
+            return TokenSerializer(tokens, many=True).data
+        
+        return catalog.respond(request, ('tokens',), build)
 
 class RouteListView(APIView):
     def get(self, request):
         token_in = request.query_params.get('token_in')
         token_out = request.query_params.get('token_out')
         
-        routes = SwapRoute.objects.filter(is_active=True)
-        
-        if token_in:
-            routes = routes.filter(token_in__symbol=token_in)
-        if token_out:
-            routes = routes.filter(token_out__symbol=token_out)
+        def build():
+            routes = SwapRoute.objects.filter(is_active=True).select_related('token_in', 'token_out')
             
-        serializer = RouteSerializer(routes, many=True)
-        return Response(serializer.data)
+            if token_in:
+                routes = routes.filter(token_in__symbol=token_in)
+            if token_out:
+                routes = routes.filter(token_out__symbol=token_out)
+                
+            return RouteSerializer(routes, many=True).data
+        
+        return catalog.respond(request, ('routes', token_in, token_out), build)
 
 class QuoteCreateView(APIView):
     def post(self, request):
@@ -49,40 +68,44 @@ class QuoteCreateView(APIView):
             token_out = SwapToken.objects.get(symbol=token_out_symbol, is_active=True)
             amount_in = Decimal(amount_in)
             
-            # Check if route exists
-            route = SwapRoute.objects.filter(
-                token_in=token_in,
-                token_out=token_out,
-                is_active=True,
-                min_amount_in__lte=amount_in,
-                max_amount_in__gte=amount_in
-            ).first()
-            
-            if not route:
+            # Latest oracle prices from the cache (see prices.py)
+            try:
+                rate = prices.rate(token_in.symbol, token_out.symbol)
+            except PriceUnavailable as e:
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+
+            # Best direct or multi-hop path through the route graph
+            path = route_graph.best_path(
+                token_in.symbol,
+                token_out.symbol,
+                amount_in,
+                prices.fresh_prices(route_graph.symbols()),
+            )
+            if not path:
                 return Response(
                     {'error': 'No available route for this swap'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            amount_out = path.amount_out.quantize(AMOUNT_QUANT)
+            fee_amount = (amount_in - amount_out / rate).quantize(AMOUNT_QUANT)
             
-            # Calculate swap (simplified - in real app use price oracles)
-            # This is where you'd integrate with actual swap services
-            rate = Decimal('1.0')  # Simplified - get actual rate from oracle
-            amount_out = amount_in * rate * (1 - route.fee_percentage / 100)
-            fee_amount = amount_in * route.fee_percentage / 100
-            
-            # Create and save quote
-            quote = SwapQuote.objects.create(
+            # The quote is signed, not saved: it is stored when executed
+            quote = SwapQuote(
                 token_in=token_in,
                 token_out=token_out,
                 amount_in=amount_in,
                 amount_out=amount_out,
                 rate=rate,
                 fee_amount=fee_amount,
+                path=path.as_list(),
                 valid_until=timezone.now() + timedelta(minutes=5)
             )
             
             serializer = QuoteSerializer(quote)
-            return Response(serializer.data)
+            return Response(dict(serializer.data, quote_token=quote.sign()))
             
         except SwapToken.DoesNotExist:
             return Response(
@@ -97,38 +120,57 @@ class QuoteCreateView(APIView):
 
 class ExecuteSwapView(APIView):
     def post(self, request):
-        quote_id = request.data.get('quote_id')
-        from_address = request.data.get('from_address')
-        to_address = request.data.get('to_address')
-        user_token = request.headers.get('X-User-Token')  # Get from auth
+        serializer = SwapExecuteRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        quote_token = data.get('quote_token')
+        user_token = request.user.user_token
         
-        try:
-            quote = SwapQuote.objects.get(id=quote_id, valid_until__gte=timezone.now())
+        invalid = Response(
+            {'error': 'Invalid or expired quote'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+        used = Response(
+            {'error': 'Quote has already been used'},
+            status=status.HTTP_409_CONFLICT
+        )
+        if quote_token:
+            try:
+                quote = SwapQuote.from_token(quote_token)
+            except (quotes.InvalidQuote, ValidationError):
+                return invalid
+        
+        with transaction.atomic():
+            if quote_token:
+                try:
+                    # the token's id is the primary key: a token executes once
+                    with transaction.atomic():
+                        quote.save(force_insert=True)
+                except IntegrityError:
+                    return used
+            else:
+                # quotes stored before signed quote tokens: the row lock
+                # serializes concurrent executions of the same quote
+                quote = SwapQuote.objects.select_for_update().filter(
+                    id=data['quote_id'], valid_until__gte=timezone.now()
+                ).first()
+                if quote is None:
+                    return invalid
+                if SwapTransaction.objects.filter(quote=quote).exists():
+                    return used
             
             # Create swap transaction
             swap = SwapTransaction.objects.create(
                 user_token=user_token,
                 quote=quote,
-                from_address=from_address,
-                to_address=to_address,
-                status='pending'
-            )
-            
-            # In a real app, here you'd interact with blockchain
-            # For now, we'll simulate success
-            swap.status = 'completed'
-            swap.executed_at = timezone.now()
-            swap.completed_at = timezone.now()
-            swap.save()
-            
-            serializer = TransactionSerializer(swap)
-            return Response(serializer.data)
-            
-        except SwapQuote.DoesNotExist:
-            return Response(
-                {'error': 'Invalid or expired quote'},
-                status=status.HTTP_400_BAD_REQUEST
+                from_address=data['from_address'],
+                to_address=data['to_address'],
+                status='queued'
             )
+        
+        # Collected, paid out and tracked by the execute_swaps workers (execution.py)
+        serializer = TransactionSerializer(swap)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 class SwapStatusView(APIView):
     def get(self, request, tx_id):
@@ -142,12 +184,16 @@ class SwapStatusView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-class SwapHistoryView(APIView):
-    def get(self, request):
-        user_token = request.headers.get('X-User-Token')
-        swaps = SwapTransaction.objects.filter(user_token=user_token).order_by('-created_at')
-        serializer = TransactionSerializer(swaps, many=True)
-        return Response(serializer.data)
+class SwapHistoryView(generics.ListAPIView):
+    """The caller's swaps, newest first, cursor paginated on idx_swap_user_history."""
+    serializer_class = TransactionSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return (
+            SwapTransaction.objects.filter(user_token=self.request.user.user_token)
+            .select_related('quote__token_in', 'quote__token_out')
+        )
 
 class PriceListView(APIView):
     def get(self, request):
@@ -161,58 +207,119 @@ class PriceListView(APIView):
         serializer = PriceSerializer(prices, many=True)
         return Response(serializer.data)
 
+class CandleListView(APIView):
+    """
+    OHLC candles of one token, oldest first. Without ``start`` the latest
+    ``limit`` candles before ``end`` (default: now) are returned.
+    """
+    def get(self, request):
+        query = CandleQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        
+        candles = SwapCandle.objects.filter(token__symbol=params['token'], interval=params['interval'])
+        if 'start' in params:
+            candles = candles.filter(open_time__gte=datetime.fromtimestamp(params['start'], dt_timezone.utc))
+        if 'end' in params:
+            candles = candles.filter(open_time__lt=datetime.fromtimestamp(params['end'], dt_timezone.utc))
+        
+        if 'start' in params:
+            candles = list(candles.order_by('open_time')[:params['limit']])
+        else:
+            candles = list(candles.order_by('-open_time')[:params['limit']])[::-1]
+        
+        serializer = CandleSerializer(candles, many=True)
+        return Response(serializer.data)
+
 class MarketStatsView(APIView):
     def get(self, request):
         pair = request.query_params.get('pair')
-        stats = MarketStats.objects.all()
+        stats = market_stats.cached_stats()
         
         if pair:
-            stats = stats.filter(token_pair=pair)
+            stats = [row for row in stats if row['token_pair'] == pair]
             
-        serializer = MarketStatsSerializer(stats, many=True)
-        return Response(serializer.data)
+        return Response(stats)
 
 class AllowanceView(APIView):
     def get(self, request):
-        user_token = request.headers.get('X-User-Token')
+        user_token = request.user.user_token
         token = request.query_params.get('token')
         
-        allowances = SwapAllowance.objects.filter(user_token=user_token)
+        allowances = SwapAllowance.objects.filter(user_token=user_token).select_related('token')
         
         if token:
             allowances = allowances.filter(token__symbol=token)
+        
+        # Re-read the stale on-chain allowances in one multicall
+        allowances = list(allowances)
+        stale = [a for a in allowances if allowance_service.is_stale(a)]
+        if stale:
+            try:
+                allowance_service.refresh(stale)
+            except AllowanceUnavailable:
+                logger.warning("Serving stored allowances, the chain could not be read", exc_info=True)
             
         serializer = AllowanceSerializer(allowances, many=True)
         return Response(serializer.data)
 
     def post(self, request):
-        user_token = request.headers.get('X-User-Token')
-        token_symbol = request.data.get('token')
-        contract_address = request.data.get('contract_address')
-        amount = request.data.get('amount')
+        user_token = request.user.user_token
+        serializer = AllowanceRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
         
         try:
-            token = SwapToken.objects.get(symbol=token_symbol)
-            amount = Decimal(amount)
-            
-            # Update or create allowance
-            allowance, created = SwapAllowance.objects.update_or_create(
-                user_token=user_token,
-                token=token,
-                contract_address=contract_address,
-                defaults={'allowance_amount': amount}
-            )
-            
-            serializer = AllowanceSerializer(allowance)
-            return Response(serializer.data)
-            
+            token = SwapToken.objects.get(symbol=data['token'])
         except SwapToken.DoesNotExist:
             return Response(
                 {'error': 'Invalid token'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        except (ValueError, TypeError):
-            return Response(
-                {'error': 'Invalid amount'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+        
+        owner_address = data.get('owner_address')
+        if owner_address:
+            # Verified: read the approval on-chain instead of trusting the client
+            if not token.contract_address:
+                return Response(
+                    {'error': 'Token has no contract address'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            key = (token.contract_address, owner_address, data['contract_address'])
+            try:
+                block, values = allowance_service.read_allowances([key])
+            except InvalidAddress as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except AllowanceUnavailable as e:
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            if values[key] is None:
+                return Response(
+                    {'error': 'Could not read the allowance of this token'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            defaults = {
+                'owner_address': owner_address,
+                'allowance_amount': allowance_service.to_amount(values[key], token.decimals),
+                'block_number': block,
+            }
+        else:
+            # client-reported and never re-read: served with verified=False
+            defaults = {
+                'owner_address': '',
+                'allowance_amount': data['amount'],
+                'block_number': None,
+            }
+        
+        # Update or create allowance
+        allowance, created = SwapAllowance.objects.update_or_create(
+            user_token=user_token,
+            token=token,
+            contract_address=data['contract_address'],
+            defaults=defaults
+        )
+        
+        serializer = AllowanceSerializer(allowance)
+        return Response(serializer.data)
@@ -98,6 +98,16 @@ DATABASES = {
 #     }
 # }
 
+# The cache must be shared by every process: ingest_prices, compute_market_stats
+# and the catalog/route receivers write to it and the web workers read it.
+# The default keeps it in the database; `manage.py migrate` creates the
+# table (see apps/core/apps.py), but every cache hit is then a DB round trip,
+# so set CACHE_URL to redis://... in production. locmem:// only suits a
+# single process.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='dbcache://django_cache'),
+}
+
 
 
 # Load environment
@@ -207,6 +217,23 @@ PASSWORD_HASHERS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Avatars are content-addressed and served by apps.core.views.AvatarFileView;
+# point the "avatars" backend at an S3-compatible storage in production.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'avatars': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': os.path.join(MEDIA_ROOT, 'avatars'),
+        },
+    },
+}
+
 # Application-specific settings
 XUSDT_SETTINGS = {
     'EXCHANGE_CODE_PREFIX': 'EX-',
@@ -217,4 +244,20 @@ XUSDT_SETTINGS = {
     'ESCROW_MIN_FEE': 1.0,  # 1 USDT
     'LISTING_EXPIRY_DAYS': 7,
     'TRADE_TIMEOUT_HOURS': 24,
+    'ORDER_BOOK_TTL_SECONDS': 30,  # per-process order book full reload interval
+    'P2P_BULK_MAX_LISTINGS': 100,  # listings per bulk create/update/cancel request
+    'SELLER_PROFILE_CACHE_SECONDS': 600,  # dropped early by trade events, see apps/p2p/profiles.py
+    'SWAP_PRICE_FEEDS': env.list('SWAP_PRICE_FEEDS', default=[]),  # see apps/swap/prices.py
+    'SWAP_PRICE_MAX_AGE_SECONDS': 60,  # quotes refuse older prices
+    'SWAP_ROUTE_GRAPH_TTL_SECONDS': 300,  # per-process route graph full reload interval
+    'SWAP_PRICE_RAW_RETENTION_DAYS': 7,  # older price ticks are thinned to one per token and hour
+    'SWAP_CANDLE_RETENTION_DAYS': {'1m': 7, '5m': 90},  # 1h and 1d candles are kept
+    'SWAP_ALLOWANCE_MAX_AGE_SECONDS': 30,  # on-chain allowances older than this are re-read
+    'MULTICALL3_ADDRESS': env('MULTICALL3_ADDRESS', default='0xcA11bde05977b3631167028862bE2a173976CA11'),
+    'SWAP_EXECUTION_BACKEND': env('SWAP_EXECUTION_BACKEND', default='apps.swap.execution.Web3Backend'),
+    'SWAP_EXECUTOR_PRIVATE_KEY': env('SWAP_EXECUTOR_PRIVATE_KEY', default=''),  # hot wallet users approve; pulls deposits, pays out swaps
+    'SWAP_MARKET_STATS_CACHE_SECONDS': 60,  # refreshed by compute_market_stats on every flush
+    'QUOTE_RETENTION_SECONDS': 3600,  # unexecuted swap/bridge quotes are compacted this long after expiry
+    'CATALOG_TTL_SECONDS': 300,  # per-process token/route/network/fee response snapshot, see apps/core/catalog.py
+    'EVENT_BROKER': env('EVENT_BROKER', default='local'),  # 'database' when running several workers
 }
\ No newline at end of file